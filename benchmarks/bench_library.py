@@ -0,0 +1,161 @@
+import os, io, sys, json, time, shutil, argparse, tempfile, itertools, statistics, subprocess, contextlib
+
+# Times the library paths (scans, metadata, sorting, thumbnails, "Generate All Cache", filling the grid's model)
+# on a synthetic library, and writes JSON that can be compared with a run from another commit.
+# Usage: python benchmarks/bench_library.py --series 200 --episodes 12 --json after.json --compare before.json
+#        python benchmarks/bench_library.py --library /tmp/library --skip-cache  (reuse a library, scans only)
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(benchmarks_dir)
+sys.path.insert(0, repo_dir)
+sys.path.insert(0, benchmarks_dir)
+from synthetic_library import make_library, load_shape
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(name, function, repeat, setup=None, items=None):  # Runs function repeat times, stats in ms
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):  # The app prints a lot, don't time the terminal
+            time_start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - time_start)
+    result = {
+        "name": name,
+        "runs": repeat,
+        "mean_ms": statistics.mean(times) * 1000,
+        "median_ms": statistics.median(times) * 1000,
+        "min_ms": min(times) * 1000,
+        "max_ms": max(times) * 1000,
+    }
+    if items:  # Per item throughput, like files per second
+        result["items"] = items
+        result["items_per_second"] = items / statistics.median(times) if statistics.median(times) else 0
+    return result
+
+
+def clear_media_caches(root):  # Removes every <anime>/.cache, so thumbnails and covers are made again
+    for folder, folders, files in os.walk(root):
+        if ".cache" in folders:
+            shutil.rmtree(os.path.join(folder, ".cache"))
+            folders.remove(".cache")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Library scan, cache and grid benchmark")
+    parser.add_argument("--series", type=int, default=100)
+    parser.add_argument("--episodes", type=int, default=12, help="Episodes per series")
+    parser.add_argument("--seasons", type=int, default=0, help="Season folders per series, 0 for none")
+    parser.add_argument("--covers", type=float, default=1.0, help="Share of series with a cover.png")
+    parser.add_argument("--info", type=float, default=1.0, help="Share of series with a PTBAnime-info.json")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--library", help="Folder to keep the generated library in (reused if it was made before)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each of the quick benchmarks")
+    parser.add_argument("--thumbnails", type=int, default=20, help="Videos for the extract_video_thumbnail benchmark")
+    parser.add_argument("--skip-cache", action="store_true", help="Skip the thumbnail and Generate All Cache benchmarks")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--compare", help="Results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    root = args.library or tempfile.mkdtemp(prefix="ptbanime-bench-library-")
+    shape = load_shape(root)
+    if shape is None:
+        print(f"Generating {args.series} series of {args.episodes} episodes in {root}...")
+        shape = make_library(root, args.series, args.episodes, args.seasons, args.covers, args.info, seed=args.seed)
+    state_dir = tempfile.mkdtemp(prefix="ptbanime-bench-state-")
+    os.environ["XDG_CACHE_HOME"] = state_dir  # The app's index, manifest and journals go here, not in ~/.cache
+
+    import ui, core
+    from gi.repository import Gio
+    from library_index import LibraryIndex
+    from metadata_repository import MetadataRepository
+    from search_index import SearchIndex
+    ui.settings["anime_folder"] = root  # Only in memory, settings.json is left alone
+    ui.settings["anime_folders"] = []  # Only the synthetic library, not the other folders from settings.json
+    core.update_anime_dir()  # Sets core.anime_dir, which the scan and cache code read
+    folders = sorted(ui.fetch_anime_folder())
+    anime_paths = [os.path.join(root, folder) for folder in folders]
+    episodes = {anime_path: ui.fetch_episodes(anime_path) for anime_path in anime_paths}
+    videos = [os.path.join(anime_path, episode) for anime_path in anime_paths for episode in episodes[anime_path]]
+    indexes = itertools.count()
+
+    def fresh_index():  # Cold scan: nothing saved yet
+        core.library_index = LibraryIndex(os.path.join(state_dir, f"index-{next(indexes)}.sqlite"))
+
+    def fresh_metadata():
+        core.metadata = MetadataRepository(ui.ptbanime_data_file)
+
+    def populate_grid(found_anime):  # What refresh_grid does, minus the widgets: model + search index, in batches
+        store = Gio.ListStore.new(ui.AnimeItem)
+        search_index = SearchIndex()
+        batch = []
+        for anime_path, anime_data, cover_path, anime_episodes in found_anime:
+            search_index.add(anime_path, anime_data, anime_episodes)
+            batch.append(ui.AnimeItem(anime_data, cover_path, anime_path))
+            if len(batch) == 200:
+                store.splice(store.get_n_items(), 0, batch)
+                batch = []
+        store.splice(store.get_n_items(), 0, batch)
+
+    def generate_all_cache():  # Journal keyed like the app's. ui.anime_dir is the copy from import time, don't use it
+        ui.create_cache_builder().run(core.library_key(), ui.plan_cache_items())
+
+    fresh_index()
+    found_anime = ui.scan_library()
+    results = [
+        measure("fetch_anime_folder", ui.fetch_anime_folder, args.repeat, items=len(folders)),
+        measure("fetch_episodes", lambda: [ui.fetch_episodes(anime_path) for anime_path in anime_paths], args.repeat,
+                items=len(anime_paths)),
+        measure("get_anime_info (cold)", lambda: [ui.get_anime_info(folder) for folder in folders], args.repeat,
+                setup=fresh_metadata, items=len(folders)),
+        measure("get_anime_info (warm)", lambda: [ui.get_anime_info(folder) for folder in folders], args.repeat,
+                items=len(folders)),
+        measure("natural_sort_key sort", lambda: [sorted(anime_episodes, key=ui.natural_sort_key)
+                                                  for anime_episodes in episodes.values()], args.repeat, items=len(videos)),
+        measure("scan_library (cold)", ui.scan_library, args.repeat, setup=lambda: (fresh_index(), fresh_metadata()),
+                items=len(folders)),
+        measure("scan_library (warm)", ui.scan_library, args.repeat, items=len(folders)),
+        measure("grid population", lambda: populate_grid(found_anime), args.repeat, items=len(found_anime)),
+    ]
+    if not args.skip_cache:
+        thumbnail_videos = videos[:args.thumbnails]
+        results += [
+            measure("extract_video_thumbnail", lambda: [ui.extract_video_thumbnail(video) for video in thumbnail_videos], 1,
+                    setup=lambda: clear_media_caches(root), items=len(thumbnail_videos)),
+            measure("generate_all_cache", generate_all_cache, 1, setup=lambda: clear_media_caches(root),
+                    items=len(videos) + shape["covers"]),
+        ]
+        clear_media_caches(root)
+
+    previous = {}
+    if args.compare:
+        with open(args.compare, "r") as F:
+            previous = {result["name"]: result for result in json.load(F)["results"]}
+    print(f"{'benchmark':<26}{'runs':>6}{'mean ms':>11}{'p50 ms':>11}{'min ms':>11}{'items/s':>11}" +
+          (f"{'before':>11}{'change':>9}" if previous else ""))
+    for result in results:
+        line = (f"{result['name']:<26}{result['runs']:>6}{result['mean_ms']:>11.1f}{result['median_ms']:>11.1f}"
+                f"{result['min_ms']:>11.1f}{result.get('items_per_second', 0):>11.0f}")
+        old = previous.get(result["name"])
+        if old is not None:
+            line += f"{old['median_ms']:>11.1f}{(result['median_ms'] / old['median_ms'] - 1) * 100 if old['median_ms'] else 0:>+8.0f}%"
+        print(line)
+    if args.json:
+        with open(args.json, "w") as F:
+            json.dump({"commit": git_commit(), "library": shape, "results": results}, F, indent=4)
+    shutil.rmtree(state_dir)
+    if not args.library:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
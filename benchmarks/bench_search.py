@@ -0,0 +1,143 @@
+import os, sys, json, time, random, argparse, statistics
+
+# Search latency on a made up library, the way it's typed: every prefix of each query is searched in order.
+# With GTK installed it also times what the library grid does per key press: the search plus updating the
+# filter and sort models the grid view shows (store -> filter -> sort, like main.py).
+# Usage: python benchmarks/bench_search.py --series 10000 [--json results.json]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search_index import SearchIndex, filter_change
+
+syllables = ["ka", "ki", "ku", "ko", "sa", "shi", "su", "ta", "chi", "tsu", "na", "ni", "ha", "hi", "fu", "ma", "mi",
+             "mo", "ya", "yu", "ra", "ri", "ru", "ro", "wa", "no", "to", "ga", "ze", "do", "ba", "pi", "ren", "zen"]
+english = ["sword", "online", "attack", "titan", "hunter", "demon", "slayer", "academy", "hero", "dragon", "ball",
+           "ghost", "shell", "steins", "gate", "spirited", "away", "cowboy", "bebop", "neon", "genesis", "fullmetal",
+           "alchemist", "death", "note", "one", "piece", "frieren", "journey", "end", "spy", "family", "mob", "psycho"]
+
+
+def make_word(rng):
+    return "".join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+
+
+def make_library(series, episodes, seed=1):
+    rng = random.Random(seed)
+    library = []
+    for n in range(series):
+        title = " ".join(make_word(rng) for _ in range(rng.randint(1, 4)))
+        title_en = " ".join(rng.choice(english) for _ in range(rng.randint(1, 4))) + f" {n}"
+        description = " ".join(rng.choice(english + [make_word(rng)]) for _ in range(rng.randint(20, 60)))
+        files = [f"[Group] {title} - {e + 1:02} (1080p).mp4" for e in range(rng.randint(1, episodes))]
+        library.append((f"/anime/{n}", {"title": title, "title-en": title_en, "description": description}, files))
+    return library
+
+
+class GridModels:  # The library grid's list models from main.py, filled with the made up library
+    def __init__(self, library):
+        import gi
+        gi.require_version("Gtk", "4.0")
+        from gi.repository import Gtk, Gio, GObject
+
+        class Item(GObject.Object):
+            def __init__(self, key):
+                super().__init__()
+                self.key = key
+
+        self.Gtk = Gtk
+        self.results = None
+        self.store = Gio.ListStore.new(Item)
+        self.store.splice(0, 0, [Item(key) for key, anime_data, files in library])
+        self.filter = Gtk.CustomFilter.new(lambda item: self.results is None or item.key in self.results)
+        self.filter_model = Gtk.FilterListModel.new(self.store, self.filter)
+        self.sorter = Gtk.CustomSorter.new(self.compare)
+        self.sort_model = Gtk.SortListModel.new(self.filter_model, None)
+        self.changes = {"more_strict": Gtk.FilterChange.MORE_STRICT, "less_strict": Gtk.FilterChange.LESS_STRICT,
+                        "different": Gtk.FilterChange.DIFFERENT}
+
+    def compare(self, a, b):
+        return (self.results.get(b.key, 0) > self.results.get(a.key, 0)) - (self.results.get(b.key, 0) < self.results.get(a.key, 0))
+
+    def update(self, results):  # Same as Application.run_search after the search, returns the shown count
+        change = filter_change(self.results, results)
+        self.results = results
+        if change != "same":
+            self.filter.changed(self.changes[change])
+        if results is None:
+            self.sort_model.set_sorter(None)
+        else:
+            self.sort_model.set_sorter(self.sorter)
+            self.sorter.changed(self.Gtk.SorterChange.DIFFERENT)
+        return self.sort_model.get_n_items()
+
+
+def grid_models(library):  # None without GTK
+    try:
+        return GridModels(library)
+    except (ImportError, ValueError) as e:
+        print("No GTK, only timing the search index:", e)
+        return None
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return {
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Library search benchmark")
+    parser.add_argument("--series", type=int, default=10000)
+    parser.add_argument("--episodes", type=int, default=24, help="Most episodes per series")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    library = make_library(args.series, args.episodes)
+    index = SearchIndex()
+    time_start = time.perf_counter()
+    for key, anime_data, files in library:
+        index.add(key, anime_data, files)
+    build_time = time.perf_counter() - time_start
+
+    rng = random.Random(2)
+    queries = []
+    for _ in range(args.queries):
+        key, anime_data, files = rng.choice(library)
+        query = rng.choice([anime_data["title"], anime_data["title-en"], anime_data["title"].split()[0]])
+        if rng.random() < 0.3 and len(query) > 5:  # Typo: swap two letters
+            i = rng.randrange(1, len(query) - 2)
+            query = query[:i] + query[i + 1] + query[i] + query[i + 2:]
+        queries.append(query)
+
+    models = grid_models(library)
+    latencies, model_latencies, results = [], [], []
+    for query in queries:
+        for end in range(len(query) + 1):  # One search per keystroke, starting from a cleared search box
+            search_start = time.perf_counter()
+            found = index.search(query[:end])
+            latencies.append(time.perf_counter() - search_start)
+            if models is not None:
+                models.update(found)
+                model_latencies.append(time.perf_counter() - search_start)
+        results.append(len(found or ()))
+
+    result = {"series": args.series, "build_seconds": build_time, "searches": len(latencies), **percentiles(latencies),
+              "mean_results": statistics.mean(results)}
+    print(f"Indexed {args.series} series in {build_time:.2f} s")
+    print(f"{len(latencies)} searches: mean {result['mean_ms']:.2f} ms, p50 {result['p50_ms']:.2f} ms, "
+          f"p95 {result['p95_ms']:.2f} ms, max {result['max_ms']:.2f} ms")
+    if model_latencies:  # What a key press really costs, the "< 10 ms" target is for this
+        result["with_models"] = percentiles(model_latencies)
+        stats = result["with_models"]
+        print(f"Search + filter and sort models: mean {stats['mean_ms']:.2f} ms, p50 {stats['p50_ms']:.2f} ms, "
+              f"p95 {stats['p95_ms']:.2f} ms, max {stats['max_ms']:.2f} ms")
+    if args.json:
+        with open(args.json, "w") as F:
+            json.dump(result, F, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import os, sys, json, time, random, shutil, argparse, tempfile, statistics
+import ffmpeg
+
+# Seek-to-frame latency: how long it takes until the frame at a position is decoded, for an exact seek
+# (decode from the keyframe before it up to the position) and for a seek to the nearest keyframe
+# (what the seek controller does while a key is held). Long GOPs make the difference big.
+# Usage: python benchmarks/bench_seek.py --duration 600 --gop 10 --seeks 30 [--codec libx265] [--json results.json]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from keyframes import mp4_keyframes, nearest_keyframe
+
+
+def make_video(path, duration, gop_seconds, codec):  # High-ish resolution so decoding a GOP costs something
+    (
+        ffmpeg
+        .input(f"testsrc2=duration={duration}:size=1920x1080:rate=24", f="lavfi")
+        .output(path, vcodec=codec, g=gop_seconds * 24, keyint_min=gop_seconds * 24, sc_threshold=0,
+                preset="ultrafast", crf=30)
+        .run(quiet=True, overwrite_output=True)
+    )
+
+
+def frame_at(video_path, seconds, exact):  # Seconds until the frame at this position is decoded
+    time_start = time.perf_counter()
+    input_args = {"ss": seconds}
+    if not exact:
+        input_args["noaccurate_seek"] = None
+    (
+        ffmpeg
+        .input(video_path, **input_args)
+        .output("-", f="null", vframes=1)
+        .run(quiet=True)
+    )
+    return time.perf_counter() - time_start
+
+
+def summary(name, latencies):
+    latencies = sorted(latencies)
+    return {
+        "name": name,
+        "seeks": len(latencies),
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "median_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seek-to-frame latency benchmark")
+    parser.add_argument("--duration", type=int, default=300, help="Seconds of generated video")
+    parser.add_argument("--gop", type=int, default=10, help="Seconds between keyframes")
+    parser.add_argument("--codec", default="libx264", help="libx265 for HEVC, if your ffmpeg has it")
+    parser.add_argument("--seeks", type=int, default=30)
+    parser.add_argument("--video", help="Use this mp4 instead of generating one")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    folder = None
+    video_path = args.video
+    if video_path is None:
+        folder = tempfile.mkdtemp(prefix="ptbanime-bench-")
+        video_path = os.path.join(folder, "seek.mp4")
+        print(f"Generating {args.duration}s {args.codec} video with a keyframe every {args.gop}s...")
+        make_video(video_path, args.duration, args.gop, args.codec)
+
+    time_start = time.perf_counter()
+    keyframes = mp4_keyframes(video_path)
+    index_time = time.perf_counter() - time_start
+    duration = float(ffmpeg.probe(video_path)["format"]["duration"])
+    print(f"Keyframe index: {len(keyframes or [])} keyframes in {index_time * 1000:.1f} ms")
+
+    rng = random.Random(1)
+    targets = [rng.uniform(0, duration - 1) for _ in range(args.seeks)]
+    exact = [frame_at(video_path, target, True) for target in targets]
+    fast = [frame_at(video_path, nearest_keyframe(keyframes, int(target * 1000000)) / 1000000, False) for target in targets]
+    results = [summary("exact", exact), summary("keyframe", fast)]
+
+    print(f"{'seek':<12}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for result in results:
+        print(f"{result['name']:<12}{result['mean_ms']:>10.1f}{result['median_ms']:>10.1f}{result['p95_ms']:>10.1f}")
+    print("(includes starting ffmpeg for every seek, the difference between the two is the decoding)")
+    if args.json:
+        with open(args.json, "w") as F:
+            json.dump({"video": {"duration": duration, "keyframes": len(keyframes or []), "index_ms": index_time * 1000},
+                       "results": results}, F, indent=4)
+    if folder is not None:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import os, sys, json, time, shutil, argparse, tempfile, statistics
+import ffmpeg
+
+# Compares the old thumbnail path (ffprobe + exact seek ffmpeg run per file) with thumbnails.py
+# (header duration + keyframe seek, one file or a batch of files per ffmpeg run).
+# Usage: python benchmarks/bench_thumbnails.py --files 40 --duration 600 --batch 8 [--json results.json]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from thumbnails import extract_thumbnail, extract_thumbnails
+
+
+def make_corpus(folder, files, duration):  # Small real mp4 files made with ffmpeg's testsrc
+    videos = []
+    for n in range(files):
+        video_path = os.path.join(folder, f"Episode {n + 1:03}.mp4")
+        (
+            ffmpeg
+            .input(f"testsrc=duration={duration}:size=640x360:rate=24", f="lavfi")
+            .output(video_path, vcodec="libx264", g=240, preset="ultrafast", crf=40)
+            .run(quiet=True, overwrite_output=True)
+        )
+        videos.append(video_path)
+    return videos
+
+
+def legacy_extract(video_path, output_path):  # What extract_video_thumbnail used to do
+    probe = ffmpeg.probe(video_path)
+    midpoint = float(probe["format"]["duration"]) / 2
+    (
+        ffmpeg
+        .input(video_path, ss=midpoint)
+        .filter("scale", 160, 90)
+        .output(output_path, vframes=1, qscale=5)
+        .run(quiet=True, overwrite_output=True)
+    )
+
+
+def run(name, videos, out_dir, batch):
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    jobs = [(video_path, os.path.join(out_dir, os.path.basename(video_path) + ".jpg")) for video_path in videos]
+    latencies = []
+    time_start = time.perf_counter()
+    for i in range(0, len(jobs), batch):
+        chunk = jobs[i:i + batch]
+        chunk_start = time.perf_counter()
+        if name == "legacy":
+            for job in chunk:
+                legacy_extract(*job)
+        elif batch == 1:
+            extract_thumbnail(*chunk[0])
+        else:
+            extract_thumbnails(chunk)
+        latencies += [(time.perf_counter() - chunk_start) / len(chunk)] * len(chunk)
+    total_time = time.perf_counter() - time_start
+    made = sum(os.path.exists(output_path) for video_path, output_path in jobs)
+    return {
+        "name": name if batch == 1 else f"{name} (batch {batch})",
+        "files": len(jobs),
+        "made": made,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "median_ms": statistics.median(latencies) * 1000,
+        "p95_ms": sorted(latencies)[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0,
+        "files_per_second": len(jobs) / total_time if total_time else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Thumbnail extraction benchmark")
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--duration", type=int, default=300, help="Seconds per generated video")
+    parser.add_argument("--batch", type=int, default=8, help="Files per ffmpeg run for the batched engine")
+    parser.add_argument("--corpus", help="Folder to keep the generated videos in (reused if it has videos)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    corpus = args.corpus or tempfile.mkdtemp(prefix="ptbanime-bench-")
+    os.makedirs(corpus, exist_ok=True)
+    videos = sorted(os.path.join(corpus, name) for name in os.listdir(corpus) if name.endswith(".mp4"))
+    if len(videos) < args.files:
+        print(f"Generating {args.files} videos of {args.duration}s in {corpus}...")
+        videos = make_corpus(corpus, args.files, args.duration)
+    videos = videos[:args.files]
+
+    out_dir = os.path.join(corpus, ".cache")
+    results = [
+        run("legacy", videos, out_dir, 1),
+        run("engine", videos, out_dir, 1),
+        run("engine", videos, out_dir, args.batch),
+    ]
+    print(f"{'path':<22}{'made':>6}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'files/s':>10}")
+    for result in results:
+        print(f"{result['name']:<22}{result['made']:>6}{result['mean_ms']:>10.1f}{result['median_ms']:>10.1f}"
+              f"{result['p95_ms']:>10.1f}{result['files_per_second']:>10.2f}")
+    if args.json:
+        with open(args.json, "w") as F:
+            json.dump({"corpus": {"files": len(videos), "duration": args.duration}, "results": results}, F, indent=4)
+    if not args.corpus:
+        shutil.rmtree(corpus)
+
+
+if __name__ == "__main__":
+    main()
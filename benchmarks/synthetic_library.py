@@ -0,0 +1,99 @@
+import os, sys, json, random, shutil, argparse, tempfile
+import ffmpeg
+
+# Makes a made up anime library on disk, the same shape every time for the same arguments (seeded).
+# Every episode is a copy of one tiny real mp4 made with ffmpeg's testsrc, so scans, the magic byte check
+# and thumbnail extraction all see real files, but making thousands of them stays quick.
+# Usage: python benchmarks/synthetic_library.py /tmp/library --series 200 --episodes 12 --seasons 2
+
+syllables = ["ka", "ki", "ku", "ko", "sa", "shi", "su", "ta", "chi", "tsu", "na", "ni", "ha", "hi", "fu", "ma", "mi",
+             "mo", "ya", "yu", "ra", "ri", "ru", "ro", "wa", "no", "to", "ga", "ze", "do", "ba", "pi", "ren", "zen"]
+
+
+def make_word(rng):
+    return "".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def make_video(path, duration):
+    (
+        ffmpeg
+        .input(f"testsrc=duration={duration}:size=320x180:rate=24", f="lavfi")
+        .output(path, vcodec="libx264", g=48, preset="ultrafast", crf=45)
+        .run(quiet=True, overwrite_output=True)
+    )
+
+
+def make_cover(path):
+    (
+        ffmpeg
+        .input("testsrc=duration=1:size=560x800:rate=1", f="lavfi")
+        .output(path, vframes=1)
+        .run(quiet=True, overwrite_output=True)
+    )
+
+
+def make_library(root, series=100, episodes=12, seasons=0, covers=1.0, info=1.0, duration=2, seed=1):
+    # seasons = 0 puts the episodes straight in the anime folder, otherwise they're split over "Season N" folders
+    # covers and info are the share of series that get a cover.png and a PTBAnime-info.json
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    templates = tempfile.mkdtemp(prefix="ptbanime-templates-")
+    template_video = os.path.join(templates, "episode.mp4")
+    template_cover = os.path.join(templates, "cover.png")
+    make_video(template_video, duration)
+    if covers > 0:
+        make_cover(template_cover)
+
+    shape = {"series": series, "episodes": episodes, "seasons": seasons, "covers": 0, "info": 0, "videos": 0,
+             "duration": duration, "seed": seed}
+    for n in range(series):
+        title = " ".join(make_word(rng) for _ in range(rng.randint(1, 3)))
+        anime_path = os.path.join(root, f"{title} {n}")
+        os.makedirs(anime_path, exist_ok=True)
+        for e in range(episodes):
+            folder = anime_path
+            if seasons:
+                folder = os.path.join(anime_path, f"Season {e * seasons // episodes + 1}")
+                os.makedirs(folder, exist_ok=True)
+            shutil.copyfile(template_video, os.path.join(folder, f"[Group] {title} - {e + 1:02} (1080p).mp4"))
+            shape["videos"] += 1
+        if rng.random() < covers:
+            shutil.copyfile(template_cover, os.path.join(anime_path, "cover.png"))
+            shape["covers"] += 1
+        if rng.random() < info:
+            with open(os.path.join(anime_path, "PTBAnime-info.json"), "w") as F:
+                json.dump({"title": title, "title-en": f"{title} (en)", "last-episode": 1, "last-episode-timestamp": 0,
+                           "description": " ".join(make_word(rng).lower() for _ in range(rng.randint(20, 60)))}, F, indent=4)
+            shape["info"] += 1
+    shutil.rmtree(templates)
+    with open(os.path.join(root, ".synthetic-library.json"), "w") as F:  # So a benchmark can reuse the library
+        json.dump(shape, F, indent=4)
+    return shape
+
+
+def load_shape(root):  # The shape a library was made with, None if it wasn't made here
+    try:
+        with open(os.path.join(root, ".synthetic-library.json"), "r") as F:
+            return json.load(F)
+    except (OSError, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic anime library generator")
+    parser.add_argument("root", help="Folder to make the library in")
+    parser.add_argument("--series", type=int, default=100)
+    parser.add_argument("--episodes", type=int, default=12, help="Episodes per series")
+    parser.add_argument("--seasons", type=int, default=0, help="Season folders per series, 0 for none")
+    parser.add_argument("--covers", type=float, default=1.0, help="Share of series with a cover.png")
+    parser.add_argument("--info", type=float, default=1.0, help="Share of series with a PTBAnime-info.json")
+    parser.add_argument("--duration", type=int, default=2, help="Seconds per video")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    shape = make_library(args.root, args.series, args.episodes, args.seasons, args.covers, args.info, args.duration, args.seed)
+    print(f"Made {shape['series']} series, {shape['videos']} videos, {shape['covers']} covers and "
+          f"{shape['info']} info files in {args.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import os, json, time, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Builds the cover and thumbnail caches for the whole library.
+# - Worker count comes from the CPU count and what kind of disk the library is on
+# - What's left to do is saved in a journal, so a cancelled or crashed build carries on where it stopped
+# - Items that failed stay in the journal and aren't counted as done. After a finished build the next plan
+#   picks them up again, the manifest never recorded them
+# - Items are plain dicts so the journal is just JSON:
+#     {"kind": "cover", "anime_path": ..., "source": cover path}
+#     {"kind": "thumbnails", "anime_path": ..., "sources": [video paths]}  (one ffmpeg run for all of them)
+#     {"kind": "storyboard", "anime_path": ..., "source": video path}  (seek bar preview sheet)
+
+network_filesystems = ("nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "fuse.sshfs", "fuse.rclone", "davfs", "afpfs")
+
+
+def storage_type(path):  # "network", "hdd", "ssd" or "unknown"
+    try:
+        real_path = os.path.realpath(path)
+        mount_point, fs_type = "", ""
+        with open("/proc/mounts", "r") as F:
+            for line in F:
+                fields = line.split()
+                point = fields[1].replace("\\040", " ")
+                if (real_path == point or real_path.startswith(point.rstrip("/") + "/")) and len(point) > len(mount_point):
+                    mount_point, fs_type = point, fields[2]
+        if fs_type in network_filesystems:
+            return "network"
+        dev = os.stat(real_path).st_dev
+        block_path = f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}"
+        for rotational_path in (os.path.join(block_path, "queue", "rotational"),
+                                os.path.join(block_path, "..", "queue", "rotational")):  # Partitions use the disk's
+            if os.path.exists(rotational_path):
+                with open(rotational_path, "r") as F:
+                    return "hdd" if F.read().strip() == "1" else "ssd"
+    except (OSError, IndexError):
+        pass
+    return "unknown"
+
+
+def pick_workers(path):
+    cpus = os.cpu_count() or 2
+    kind = storage_type(path)
+    if kind == "hdd":  # Jumping between files is what makes spinning disks slow
+        workers = 2
+    elif kind == "network":  # Mostly waiting on the network, but don't flood it
+        workers = min(4, cpus)
+    else:
+        workers = max(1, cpus - 1)  # Leave a core for the UI
+    print(f"Cache build: {kind} storage, {workers} workers")
+    return workers
+
+
+def item_weight(item):  # How many files an item makes, for progress
+    return len(item["sources"]) if item["kind"] == "thumbnails" else 1
+
+
+class CacheBuilder:
+    def __init__(self, journal_path, handlers, workers=2, on_progress=None, on_done=None):
+        self.journal_path = journal_path
+        self.handlers = handlers  # Kind -> function(item), makes the cache for an item (skipping what's fresh)
+        self.workers = workers
+        self.on_progress = on_progress  # (done, total, item, eta seconds or None)
+        self.on_done = on_done  # (done, total, failed, cancelled, seconds)
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.remaining = {}  # Index -> item, what's not done yet
+        self.done = 0
+        self.failed = 0
+        self.total = 0
+
+    def load_journal(self, root):  # Items left from a build that didn't finish, or None
+        try:
+            with open(self.journal_path, "r") as F:
+                journal = json.load(F)
+        except (OSError, ValueError):
+            return None
+        if journal.get("root") != root:
+            return None
+        return journal["items"]
+
+    def save_journal(self, root):
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        with self.lock:
+            journal = {"root": root, "items": list(self.remaining.values())}
+        temp_path = self.journal_path + ".tmp"
+        with open(temp_path, "w") as F:
+            json.dump(journal, F)
+        os.replace(temp_path, self.journal_path)  # Never leave a half written journal
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def start(self, root, items):
+        threading.Thread(target=self.run, args=(root, items), daemon=True).start()
+
+    def run(self, root, items):
+        time_start = time.perf_counter()
+        self.remaining = dict(enumerate(items))
+        self.total = sum(item_weight(item) for item in items)
+        self.done = 0
+        self.failed = 0
+        self.save_journal(root)
+        last_save = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.build_item, item): index for index, item in enumerate(items)}
+            for future in as_completed(futures):
+                item = items[futures[future]]
+                result = future.result()
+                if result == "failed":  # Stays in remaining, so a crash or cancel keeps it for next time
+                    with self.lock:
+                        self.failed += item_weight(item)
+                elif result == "done":
+                    with self.lock:
+                        del self.remaining[futures[future]]
+                        self.done += item_weight(item)
+                    elapsed = time.perf_counter() - time_start
+                    eta = elapsed / self.done * (self.total - self.done) if self.done else None
+                    if self.on_progress is not None:
+                        self.on_progress(self.done, self.total, item, eta)
+                if time.perf_counter() - last_save > 2:  # Don't rewrite the journal for every file
+                    self.save_journal(root)
+                    last_save = time.perf_counter()
+                if self.cancelled.is_set():
+                    pool.shutdown(wait=True, cancel_futures=True)
+                    break
+        if self.remaining and self.cancelled.is_set():
+            self.save_journal(root)  # Resumed next time
+        elif os.path.exists(self.journal_path):  # Only failures left, planning again retries them with anything new
+            os.remove(self.journal_path)
+        if self.on_done is not None:
+            self.on_done(self.done, self.total, self.failed, self.cancelled.is_set(), time.perf_counter() - time_start)
+
+    def build_item(self, item):  # "done", "failed", or "skipped" if it was cancelled before it started
+        if self.cancelled.is_set():
+            return "skipped"
+        try:
+            if self.handlers[item["kind"]](item) is False:  # Handlers return False when nothing could be made
+                print("Cache build failed for", item.get("source") or item.get("anime_path"))
+                return "failed"
+        except Exception as e:  # One broken file shouldn't stop the whole build
+            print("Cache build failed for", item.get("source") or item.get("anime_path"), e)
+            return "failed"
+        return "done"
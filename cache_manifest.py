@@ -0,0 +1,113 @@
+import os, time, sqlite3, threading
+
+# Remembers what every cache file (cover, thumbnail) was made from, so a replaced or re-encoded source
+# gets a new cache file, and keeps all of them under a disk budget by throwing out the least recently used.
+
+
+def source_signature(path):  # (size, mtime, inode), None if the file is gone
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+class CacheManifest:
+    touch_interval = 3600  # Only write last_used again after this many seconds, reads shouldn't cost a write
+
+    def __init__(self, db_path, budget_bytes=None):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.trim_lock = threading.Lock()  # Only one trim at a time, the cache builder records from many threads
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS artifacts ("
+                        "cache_path TEXT PRIMARY KEY, source_path TEXT, source_size INTEGER, source_mtime INTEGER, "
+                        "source_inode INTEGER, artifact_size INTEGER, last_used REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS artifacts_last_used ON artifacts (last_used)")
+        self.db.commit()
+        self.budget_bytes = budget_bytes  # None = no limit
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(artifact_size), 0) FROM artifacts").fetchone()[0]
+
+    def is_fresh(self, cache_path, source_path, check_source=True):  # True if cache_path exists and was made from source_path as it is now
+        # check_source=False is for cache files named after their content, the name already says they match
+        signature = source_signature(source_path)
+        if signature is None or not os.path.exists(cache_path):
+            return False
+        with self.lock:
+            row = self.db.execute("SELECT source_path, source_size, source_mtime, source_inode, last_used FROM artifacts "
+                                  "WHERE cache_path = ?", (cache_path,)).fetchone()
+        if row is None:
+            # Made before there was a manifest. Keep it if it's newer than the source
+            if os.stat(cache_path).st_mtime_ns >= signature[1]:
+                self.record(cache_path, source_path)
+                return True
+            return False
+        if check_source and (row[0], row[1], row[2], row[3]) != (source_path,) + signature:
+            return False
+        if time.time() - row[4] > self.touch_interval:
+            with self.lock:
+                self.db.execute("UPDATE artifacts SET last_used = ? WHERE cache_path = ?", (time.time(), cache_path))
+                self.db.commit()
+        return True
+
+    def record(self, cache_path, source_path):  # Call after making cache_path from source_path
+        signature = source_signature(source_path)
+        try:
+            artifact_size = os.path.getsize(cache_path)
+        except OSError:
+            return
+        if signature is None:
+            return
+        with self.lock:
+            old = self.db.execute("SELECT artifact_size FROM artifacts WHERE cache_path = ?", (cache_path,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (cache_path, source_path) + signature + (artifact_size, time.time()))
+            self.db.commit()
+            self.total_bytes += artifact_size - (old[0] if old else 0)
+        if self.budget_bytes is not None and self.total_bytes > self.budget_bytes:
+            self.trim(int(self.budget_bytes * 0.9))  # Leave some room so we don't trim on every new file
+
+    def forget(self, cache_path):  # The cache file was moved or removed by someone else
+        with self.lock:
+            old = self.db.execute("SELECT artifact_size FROM artifacts WHERE cache_path = ?", (cache_path,)).fetchone()
+            if old is not None:
+                self.db.execute("DELETE FROM artifacts WHERE cache_path = ?", (cache_path,))
+                self.db.commit()
+                self.total_bytes -= old[0]
+
+    def trim(self, target_bytes=None, drop_orphans=False):  # Returns (files removed, bytes freed)
+        # drop_orphans also removes cache for sources that are gone, that's a stat per file so it's optional
+        with self.trim_lock:
+            if target_bytes is None:
+                target_bytes = self.budget_bytes if self.budget_bytes is not None else self.total_bytes
+            removed, freed = 0, 0
+            with self.lock:
+                rows = self.db.execute("SELECT cache_path, source_path, artifact_size FROM artifacts ORDER BY last_used").fetchall()
+            for cache_path, source_path, artifact_size in rows:
+                if self.total_bytes - freed <= target_bytes:
+                    if not drop_orphans:
+                        break
+                    if os.path.exists(source_path):
+                        continue
+                try:
+                    os.remove(cache_path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print("Couldn't remove cache file", cache_path, e)
+                    continue
+                with self.lock:
+                    self.db.execute("DELETE FROM artifacts WHERE cache_path = ?", (cache_path,))
+                removed += 1
+                freed += artifact_size
+            with self.lock:
+                self.db.commit()
+                self.total_bytes -= freed
+            print(f"Trimmed cache: removed {removed} files, freed {freed / 1024 / 1024:.1f} MB")
+            return removed, freed
+
+    def stats(self):
+        with self.lock:
+            files = self.db.execute("SELECT COUNT(*) FROM artifacts").fetchone()[0]
+        return {"files": files, "bytes": self.total_bytes, "budget_bytes": self.budget_bytes}
@@ -0,0 +1,75 @@
+import os, shutil, sqlite3, hashlib, threading
+
+# Cache files kept in one local folder (like ~/.cache/ptbanime/store) instead of <anime>/.cache,
+# named after what the source file contains, so the same cover or episode in two places shares one file.
+#
+# Hashing a whole video would take forever, so the key is the size plus 64 KB from the start, middle and end.
+# The key for a path is remembered with the file's size, mtime and inode, so it's only hashed again if it changed.
+
+sample_size = 64 * 1024
+
+
+def content_key(path):
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, "rb") as f:
+        for offset in sorted({0, max(0, size // 2 - sample_size // 2), max(0, size - sample_size)}):
+            f.seek(offset)
+            digest.update(f.read(sample_size))
+    return digest.hexdigest()
+
+
+class CacheStore:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(root, "keys.sqlite"), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS keys ("
+                        "source_path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, inode INTEGER, key TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS migrated (root TEXT PRIMARY KEY)")
+        self.db.commit()
+
+    def key_for(self, source_path):  # None if the source is gone
+        try:
+            st = os.stat(source_path)
+        except OSError:
+            return None
+        with self.lock:
+            row = self.db.execute("SELECT size, mtime, inode, key FROM keys WHERE source_path = ?", (source_path,)).fetchone()
+        if row is not None and row[:3] == (st.st_size, st.st_mtime_ns, st.st_ino):
+            return row[3]
+        try:
+            key = content_key(source_path)
+        except OSError:
+            return None
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO keys VALUES (?, ?, ?, ?, ?)",
+                            (source_path, st.st_size, st.st_mtime_ns, st.st_ino, key))
+            self.db.commit()
+        return key
+
+    def path_for(self, source_path, kind, extension):  # kind is "covers", "thumbnails" or "storyboards"
+        key = self.key_for(source_path)
+        if key is None:
+            key = "missing-" + hashlib.blake2b(source_path.encode(), digest_size=16).hexdigest()
+        return os.path.join(self.root, kind, key[:2], key + extension)
+
+    def adopt(self, old_path, new_path):  # Moves an old cache file in, copies if the old place is read only
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        if not os.path.exists(new_path):
+            shutil.copy2(old_path, new_path)
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+
+    def is_migrated(self, root):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM migrated WHERE root = ?", (root,)).fetchone() is not None
+
+    def set_migrated(self, root):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO migrated VALUES (?)", (root,))
+            self.db.commit()
@@ -0,0 +1,112 @@
+import os, sys, time, argparse, threading
+import core
+from core import iter_library, plan_cache_items, create_cache_builder, migrate_media_caches, cache_manifest, \
+    cache_build_journal_path, format_duration, settings, update_anime_dir, library_roots, library_key
+from cache_builder import item_weight
+
+# PTBAnime without the window, for a server that holds the library. Uses the same index and cache as the
+# desktop app, so running "cache build" from cron overnight means the app starts with everything cached.
+#   python cli.py scan                         Index every series (folders, episodes, PTBAnime-info.json)
+#   python cli.py cache build --jobs 4         Make every missing cover, thumbnail and storyboard, carries on after Ctrl+C
+#   python cli.py cache stats                  Size of the cache and what's still missing
+# --library PATH (more than once for several folders) is used instead of the folders in settings.json
+
+
+def use_library(paths):  # Returns False if there's no library to work on
+    if paths:  # Only for this run, settings.json is left alone
+        settings["anime_folder"] = os.path.abspath(paths[0])
+        settings["anime_folders"] = [os.path.abspath(path) for path in paths[1:]]
+    if core.anime_dir_is_home_dir():
+        print("No library folder, set anime_folder in settings.json or pass --library", file=sys.stderr)
+        return False
+    update_anime_dir()
+    return True
+
+
+def scan(args):
+    time_start = time.perf_counter()
+    counts = {root: [0, 0, 0] for root in library_roots()}  # Root -> [series, episodes, seconds until the last of them]
+    for root, found_anime, online in iter_library():  # A root comes in several parts, as it's scanned
+        counts[root][0] += len(found_anime)
+        counts[root][1] += sum(len(anime_episodes) for anime_path, anime_data, cover_path, anime_episodes in found_anime)
+        counts[root][2] = time.perf_counter() - time_start
+    offline = 0
+    for root, (series, episodes, seconds) in counts.items():
+        online = core.root_status.get(root) == "online"
+        print(f"{root}: {series} series with {episodes} episodes"
+              + ("" if online else " (offline, as last scanned)") + f" after {seconds:.2f} s")
+        offline += not online
+    return 1 if offline else 0
+
+
+def cache_build(args):
+    if core.cache_store is not None:  # Moving old <anime>/.cache files into the central cache, online roots only
+        for root, found_anime, online in iter_library():
+            pass
+        migrate_media_caches()
+    last_print = [0]
+
+    def on_progress(done, total, item, eta):
+        if time.perf_counter() - last_print[0] < 2 and done < total:  # Don't flood cron's mail
+            return
+        last_print[0] = time.perf_counter()
+        eta_text = f", about {format_duration(eta)} left" if eta is not None else ""
+        print(f"{done} / {total} files{eta_text}", flush=True)
+
+    def on_done(done, total, failed, cancelled, total_time):
+        print(("Stopped" if cancelled else "Finished") + f" after caching {done} of {total} files in {total_time:.2f} s"
+              + (f", {failed} failed" if failed else "") + (", the rest is done next time" if cancelled else ""))
+
+    builder = create_cache_builder(on_progress, on_done, workers=args.jobs)
+    items = builder.load_journal(library_key())
+    if items is not None:
+        print(f"Resuming unfinished build, {sum(item_weight(item) for item in items)} files left")
+    else:
+        items = plan_cache_items()
+        print(f"{sum(item_weight(item) for item in items)} files to make")
+    thread = threading.Thread(target=builder.run, args=(library_key(), items))
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(0.5)  # Short waits, so Ctrl+C gets through
+    except KeyboardInterrupt:
+        print("Stopping, finishing the files that are being made...")
+        builder.cancel()
+        thread.join()
+    return 1 if builder.cancelled.is_set() or builder.failed else 0
+
+
+def cache_stats(args):
+    stats = cache_manifest.stats()
+    print(f"Location:  {'central (' + core.cache_store.root + ')' if core.cache_store is not None else 'next to the media'}")
+    print(f"Files:     {stats['files']}")
+    print(f"Size:      {stats['bytes'] / 1024 / 1024:.1f} MB of {stats['budget_bytes'] / 1024 / 1024:.0f} MB")
+    missing = sum(item_weight(item) for item in plan_cache_items())
+    print(f"Missing:   {missing} files")
+    for root in library_roots():
+        if core.root_status.get(root) == "offline":
+            print(f"           not counting {root}, it's offline")
+    if os.path.exists(cache_build_journal_path):
+        print("An unfinished build is waiting, \"cache build\" carries on with it")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="ptbanime", description="PTBAnime library tools, no GTK needed")
+    parser.add_argument("--library", action="append", help="Library folder instead of the ones in settings.json, can be given more than once")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("scan", help="Index every series in the library").set_defaults(run=scan)
+    cache_parser = commands.add_parser("cache", help="Cover and thumbnail cache")
+    cache_commands = cache_parser.add_subparsers(dest="cache_command", required=True)
+    build_parser = cache_commands.add_parser("build", help="Make every missing cover, thumbnail and storyboard")
+    build_parser.add_argument("--jobs", type=int, help="Worker count, picked from the CPUs and the disk if not given")
+    build_parser.set_defaults(run=cache_build)
+    cache_commands.add_parser("stats", help="Cache size and what's still missing").set_defaults(run=cache_stats)
+    args = parser.parse_args()
+    if not use_library(args.library):
+        return 2
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,489 @@
+import re, json
+import os, time, queue, threading
+from library_index import LibraryIndex, cache_home
+from cache_builder import CacheBuilder, pick_workers, storage_type
+from cache_manifest import CacheManifest
+from cache_store import CacheStore
+from metadata_repository import MetadataRepository, write_json_atomic
+from progress_store import ProgressStore
+from library_crawler import scan_series, scan_series_with_seasons, list_series, crawl_workers
+from thumbnails import extract_thumbnail, extract_thumbnails, extract_storyboard, scale_image
+import tracing
+
+# Everything about the library that doesn't need GTK: settings, scanning, metadata, watch progress and the
+# cover/thumbnail cache. ui.py builds the desktop app on top of this, cli.py uses it on headless machines.
+
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+settings_path = os.path.join(base_dir, "settings.json")
+
+
+def load_settings():  # settings.json next to the app, empty if there isn't one (a server that only runs the CLI)
+    try:
+        with open(settings_path, "r") as F:
+            return json.load(F)
+    except (OSError, ValueError):
+        return {}
+
+
+settings = load_settings()
+anime_dir = settings.get("anime_folder", os.path.join(os.path.expanduser("~"), "Anime"))
+ptbanime_data_file = {  # Default data file
+    "title": "Anime Title",          # Title
+    "title-en": "Anime Title (en)",  # Title in english
+    "last-episode": 1,               # Last episode you watched
+    "last-episode-timestamp": 0,     # Where you last left off of last-episode
+    "description": "Default description. You should edit the PTBAnime-info.json file in the folder of this anime to change the description, you can also change other stuff too, like the english and japanese titles. Changing the titles won't change your folder name. "
+}
+library_index = LibraryIndex()
+default_cover_path = os.path.join(base_dir, "assets", "anime_card_thumbnail.png")
+metadata = MetadataRepository(ptbanime_data_file)  # Every PTBAnime-info.json, parsed once
+progress_store = ProgressStore(os.path.join(cache_home, "ptbanime", "progress.journal"), metadata)  # Watch progress
+cache_build_journal_path = os.path.join(cache_home, "ptbanime", "cache-build.json")  # Unfinished "Generate All Cache"
+# What every cache file was made from, and the disk budget for all of them
+cache_manifest = CacheManifest(os.path.join(cache_home, "ptbanime", "cache-manifest.sqlite"),
+                               settings.get("cache-budget-mb", 2048) * 1024 * 1024)
+# "central" keeps cache files in one local folder named by content, "media" keeps them in <anime>/.cache
+cache_store = CacheStore(os.path.join(cache_home, "ptbanime", "store")) if settings.get("cache-location") == "central" else None
+# The library can be spread over several folders (disks, network shares): anime_folder plus anime_folders.
+# Each folder is scanned in its own thread, folders on the same disk share that disk's worker limit, and a
+# folder that doesn't answer in time is "offline": its anime are shown as they were last scanned.
+device_workers = {"ssd": crawl_workers, "hdd": 2, "network": 4, "unknown": 4}  # Series scanned at once per disk
+device_limits = {}  # st_dev -> Semaphore, shared by every root on that disk
+device_limits_lock = threading.Lock()
+root_status = {}  # Root -> "online" or "offline", from the last scan
+scanned_online = {}  # Root -> anime paths the last scan got from the disk, a root that stalled halfway still opens those
+
+
+def media_cover_path(image_path, anime_path):  # Where "media" mode keeps a cover, <anime>/.cache
+    return str(os.path.join(anime_dir, anime_path, ".cache", os.path.basename(image_path)))
+
+
+def media_thumbnail_path(video_path):  # Where "media" mode keeps a thumbnail, .cache next to the video (so in season folders too)
+    return os.path.join(os.path.dirname(video_path), ".cache", os.path.basename(video_path) + ".jpg")
+
+
+def media_storyboard_paths(video_path):  # (sheet, index) in "media" mode, next to the video like the thumbnail
+    base_path = os.path.join(os.path.dirname(video_path), ".cache", os.path.basename(video_path) + ".storyboard")
+    return base_path + ".jpg", base_path + ".json"
+
+
+def get_cover_cache_path(image_path, anime_path):
+    if cache_store is not None:
+        return cache_store.path_for(image_path, "covers", ".png")
+    return media_cover_path(image_path, anime_path)
+
+
+def is_cache_fresh(cache_path, source_path):
+    return cache_manifest.is_fresh(cache_path, source_path, check_source=cache_store is None)
+
+
+def fetch_episodes(anime_path):  # Takes full anime path
+    if anime_path is None:
+        return None
+    found_episodes = scan_series(anime_path)
+    print("Found", len(found_episodes), "episodes for", anime_path)
+    return found_episodes
+
+
+def fetch_anime_folder():
+    found_anime = list_series(anime_dir)
+    print("Found Anime:", found_anime)
+    return found_anime
+
+
+@tracing.traced()
+def get_anime_info(select_anime_folder):  # Gets the anime info.
+    if anime_dir_is_home_dir():
+        return ptbanime_data_file, None
+    # select_anime_folder is the anime folder name in anime_dir, or a full path (any library root)
+    full_select_anime_folder = os.path.join(anime_dir, select_anime_folder)  # Full anime folder path
+    cover_image_path = os.path.join(str(base_dir), "assets", "anime_card_thumbnail.png")  # Default cover image
+    for ext in ["jpg", "jpeg", "png"]:  # Find cover image. If not found default cover image is used
+        candidate = os.path.join(str(full_select_anime_folder), f"cover.{ext}")
+        if os.path.isfile(candidate):
+            cover_image_path = candidate
+            break
+    anime_data = metadata.load(full_select_anime_folder)  # Reads and fixes PTBAnime-info.json only if it changed
+    return anime_data, cover_image_path  # Return the anime data and cover image path
+
+
+def load_series(anime_path):  # Everything the library index saves for one anime, takes full anime path
+    anime_data, cover_image_path = get_anime_info(anime_path)
+    episodes, seasons = scan_series_with_seasons(anime_path)
+    print("Found", len(episodes), "episodes for", anime_path)
+    return anime_data, cover_image_path, episodes, seasons
+
+
+def library_roots():  # Every library folder, anime_folder first. The home directory means "not set"
+    roots = []
+    for root in [settings.get("anime_folder", "")] + list(settings.get("anime_folders", [])):
+        root = os.path.abspath(os.path.expanduser(root)) if root else ""
+        if root and root != os.path.expanduser("~") and root not in roots:
+            roots.append(root)
+    return roots
+
+
+def library_key():  # One string for the whole set of roots, for the cache build journal
+    return os.pathsep.join(library_roots())
+
+
+def device_limit(root):  # The semaphore for the disk root is on, made the first time a root on that disk is seen
+    dev = os.stat(root).st_dev
+    with device_limits_lock:
+        if dev not in device_limits:
+            workers = device_workers[storage_type(root)]
+            device_limits[dev] = threading.BoundedSemaphore(workers)
+        return device_limits[dev]
+
+
+def scan_one_series(root, anime, limit):  # (anime_data, cover path, episodes), the defaults if the series is broken
+    try:
+        with limit:
+            return library_index.get_series(root, anime, load_series, commit=False)
+    except Exception as e:  # A broken PTBAnime-info.json or an unreadable folder shouldn't take the whole root offline
+        print("Couldn't scan", os.path.join(root, anime), e)
+        return metadata.default_data(os.path.join(root, anime)), default_cover_path, []
+
+
+@tracing.traced()
+def scan_root(root, results):  # Runs in its own thread, puts (root, found anime, finished, error) into results
+    # Anime are put as soon as they're scanned, in folder order, so the grid fills while the rest is still being
+    # scanned. Every scanned series puts something, even if it's nothing new in order, so iter_library sees progress.
+    # The last put has finished=True, or an error if the root couldn't be scanned
+    try:
+        if not os.path.isdir(root):
+            raise FileNotFoundError(f"{root} isn't there")
+        limit = device_limit(root)
+        folders = sorted(library_index.list_folders(root))
+        series = [None] * len(folders)
+        pending = queue.Queue()
+        for n in range(len(folders)):
+            pending.put(n)
+        lock = threading.Lock()
+        sent = [0]  # Everything before this was put already
+
+        def work():
+            while True:
+                try:
+                    n = pending.get_nowait()
+                except queue.Empty:
+                    return
+                anime = scan_one_series(root, folders[n], limit)
+                with lock:  # Put under the lock, so the anime come out in order
+                    series[n] = anime
+                    start = sent[0]
+                    while sent[0] < len(folders) and series[sent[0]] is not None:
+                        sent[0] += 1
+                    results.put((root, [(os.path.join(root, folders[k]),) + tuple(series[k]) for k in range(start, sent[0])],
+                                 False, None))
+
+        # Daemon threads, not a ThreadPoolExecutor: the interpreter waits for executor threads on exit, and one
+        # stuck on a hung network read would keep the CLI from ever exiting. The semaphore decides how many really run
+        workers = [threading.Thread(target=work, daemon=True) for _ in range(min(crawl_workers, len(folders)))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        library_index.commit()
+        results.put((root, [], True, None))
+    except Exception as e:
+        results.put((root, [], True, e))
+
+
+def saved_library(root):  # What the index has for an offline root, the same tuples as scan_library
+    return [(os.path.join(root, folder), anime_data, cover_image_path, episodes)
+            for folder, anime_data, cover_image_path, episodes in library_index.saved_series(root)]
+
+
+def iter_library(timeout=None):  # Yields (root, found anime, online) as the anime are scanned, several times per root
+    # Fast disks come first. A root that goes the timeout without finishing a single series (or listing its folder)
+    # is offline and the rest of it comes from the index, a big library on a slow disk that keeps going is fine.
+    # Its thread can't be stopped (a hung network mount), it finishes in the background and is ignored.
+    roots = library_roots()
+    timeout = timeout or settings.get("library-timeout", 10)
+    deadlines = {root: time.monotonic() + timeout for root in roots}  # Pushed back every time a root makes progress
+    results = queue.Queue()
+    for root in roots:
+        threading.Thread(target=scan_root, args=(root, results), daemon=True).start()
+    waiting = list(roots)
+    shown = {root: set() for root in roots}  # Anime already yielded, so the offline fallback doesn't repeat them
+    for root in roots:
+        scanned_online[root] = shown[root]
+
+    def offline(root):
+        root_status[root] = "offline"
+        return [anime for anime in saved_library(root) if anime[0] not in shown[root]]
+
+    while waiting:
+        for root in [root for root in waiting if deadlines[root] <= time.monotonic()]:  # Checked every time, busy roots don't hide it
+            print("Library folder stopped answering, offline:", root)
+            waiting.remove(root)
+            yield root, offline(root), False
+        if not waiting:
+            break
+        try:
+            root, found_anime, finished, error = results.get(timeout=max(0, min(deadlines[root] for root in waiting) - time.monotonic()))
+        except queue.Empty:
+            continue
+        if root not in waiting:  # Timed out already, this is its thread finishing late
+            continue
+        deadlines[root] = time.monotonic() + timeout
+        if found_anime:
+            shown[root].update(anime[0] for anime in found_anime)
+            yield root, found_anime, True
+        if not finished:
+            continue
+        waiting.remove(root)
+        if error is not None:
+            print("Library folder is offline:", root, error)
+            yield root, offline(root), False
+        else:
+            root_status[root] = "online"
+
+
+@tracing.traced()
+def scan_library():  # Returns (full anime path, anime data, cover path, episodes) for every anime, using the index
+    found_anime = [anime for root, root_anime, online in iter_library() for anime in root_anime]
+    print("Found Anime:", len(found_anime))
+    return found_anime
+
+
+def root_of(anime_path):  # The library root an anime is in
+    return os.path.dirname(anime_path)
+
+
+def is_offline(anime_path):  # Anime that were scanned before their root stalled still open
+    root = root_of(anime_path)
+    return root_status.get(root) == "offline" and anime_path not in scanned_online.get(root, ())
+
+
+def fetch_indexed_episodes(anime_path):  # Same as fetch_episodes, but only lists the folder again if it changed
+    if anime_path is None:
+        return None
+    return library_index.get_series(os.path.dirname(anime_path), os.path.basename(anime_path), load_series)[2]
+
+
+def warm_file(path, size=8 * 1024 * 1024):  # Gets the start of a video into the page cache, so opening it is quick
+    try:
+        with open(path, "rb") as f:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)  # Let the kernel read ahead the rest
+            while size > 0 and f.read(min(size, 1024 * 1024)):
+                size -= 1024 * 1024
+    except OSError as e:
+        print("Couldn't warm", path, e)
+
+
+def get_anime_dir():  # anime_dir changes, so other modules can't just import it
+    return anime_dir
+
+
+def format_duration(seconds):  # 3725 -> "1h 2m", 65 -> "1m 5s"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds}s"
+
+
+def anime_dir_is_home_dir():  # Checks if there's no library folder (anime folder is still the home directory)
+    return not library_roots()
+
+
+def thumbnail_cache_path(video_path):
+    if cache_store is not None:
+        return cache_store.path_for(video_path, "thumbnails", ".jpg")
+    return media_thumbnail_path(video_path)
+
+
+@tracing.traced()
+def extract_video_thumbnail(video_path):  # Returns the thumbnail path, or None if ffmpeg couldn't make one
+    output_path = thumbnail_cache_path(video_path)
+    # Check if the cache file exists already and the video didn't change since
+    if is_cache_fresh(output_path, video_path):
+        return output_path
+    # Create cache stuff
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    print("Generating thumbnail cache for:", video_path)
+    if extract_thumbnail(video_path, output_path) is None:
+        return None
+    cache_manifest.record(output_path, video_path)
+    return output_path
+
+
+@tracing.traced()
+def extract_video_thumbnails(video_paths):  # Same, but the missing ones share ffmpeg runs. Returns the made paths
+    missing = []
+    for video_path in video_paths:
+        output_path = thumbnail_cache_path(video_path)
+        if not is_cache_fresh(output_path, video_path):
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            missing.append((video_path, output_path))
+    if missing:
+        print("Generating thumbnail cache for", len(missing), "videos")
+    made = extract_thumbnails(missing)
+    for video_path, output_path in missing:
+        if output_path in made:
+            cache_manifest.record(output_path, video_path)
+    return made
+
+
+def storyboard_cache_paths(video_path):  # (sprite sheet, index) of a video's seek bar preview
+    if cache_store is not None:
+        return cache_store.path_for(video_path, "storyboards", ".jpg"), cache_store.path_for(video_path, "storyboards", ".json")
+    return media_storyboard_paths(video_path)
+
+
+@tracing.traced()
+def extract_video_storyboard(video_path):  # (sheet path, index), made if it's missing. None if ffmpeg couldn't make one
+    sheet_path, index_path = storyboard_cache_paths(video_path)
+    if is_cache_fresh(sheet_path, video_path) and is_cache_fresh(index_path, video_path):
+        try:
+            with open(index_path, "r") as F:
+                return sheet_path, json.load(F)
+        except (OSError, ValueError):  # Broken index, make both again
+            pass
+    os.makedirs(os.path.dirname(sheet_path), exist_ok=True)
+    print("Generating storyboard for:", video_path)
+    index = extract_storyboard(video_path, sheet_path, settings.get("storyboard-interval", 10))
+    if index is None:
+        return None
+    write_json_atomic(index_path, index)
+    cache_manifest.record(sheet_path, video_path)
+    cache_manifest.record(index_path, video_path)
+    return sheet_path, index
+
+
+def plan_cache_items(batch_size=8):  # Everything "Generate All Cache" has to make, skipping what's already cached
+    items = []
+    if anime_dir_is_home_dir():
+        return items
+    storyboards = []  # After every thumbnail, those are on screen more often
+    found_anime = [anime for root, root_anime, online in iter_library() if online for anime in root_anime]
+    for anime_path, anime_data, cover_image_path, episodes in found_anime:
+        if cover_image_path not in (None, default_cover_path) and \
+                not is_cache_fresh(get_cover_cache_path(cover_image_path, anime_path), cover_image_path):  # The default cover isn't cached
+            items.append({"kind": "cover", "anime_path": anime_path, "source": cover_image_path})
+        missing = [os.path.join(anime_path, episode) for episode in sorted(episodes, key=natural_sort_key)
+                   if not is_cache_fresh(thumbnail_cache_path(os.path.join(anime_path, episode)), os.path.join(anime_path, episode))]
+        for i in range(0, len(missing), batch_size):  # A few episodes per ffmpeg run
+            items.append({"kind": "thumbnails", "anime_path": anime_path, "sources": missing[i:i + batch_size]})
+        if settings.get("storyboards", True):
+            for episode in sorted(episodes, key=natural_sort_key):  # One ffmpeg run per episode, they're long
+                video_path = os.path.join(anime_path, episode)
+                if not is_cache_fresh(storyboard_cache_paths(video_path)[0], video_path):
+                    storyboards.append({"kind": "storyboard", "anime_path": anime_path, "source": video_path})
+    return items + storyboards
+
+
+def migrate_media_caches():  # Moves old <anime>/.cache files into the central store, once per library folder
+    if cache_store is None:
+        return
+    for root in library_roots():
+        if root_status.get(root) == "online" and not cache_store.is_migrated(root):  # Scan first, offline roots could hang
+            migrate_root_caches(root)
+
+
+def migrate_root_caches(root):
+    moved = 0
+    for anime in library_index.list_folders(root):
+        anime_path = os.path.join(root, anime)
+        anime_data, cover_image_path, episodes = library_index.get_series(root, anime, load_series, commit=False)  # From the scan
+        # <anime>/.cache, and <anime>/Season N/.cache for episodes in season folders
+        media_cache_dirs = {os.path.join(anime_path, ".cache")} | \
+                           {os.path.dirname(media_thumbnail_path(os.path.join(anime_path, episode))) for episode in episodes}
+        media_cache_dirs = [folder for folder in media_cache_dirs if os.path.isdir(folder)]
+        if not media_cache_dirs:
+            continue
+        sources = []  # (old path, source, kind, extension), the old paths come from the same helpers "media" mode uses
+        for episode in episodes:
+            video_path = os.path.join(anime_path, episode)
+            sources.append((media_thumbnail_path(video_path), video_path, "thumbnails", ".jpg"))
+            for old_path, extension in zip(media_storyboard_paths(video_path), (".jpg", ".json")):
+                sources.append((old_path, video_path, "storyboards", extension))
+        if cover_image_path not in (None, default_cover_path):
+            sources.append((media_cover_path(cover_image_path, anime_path), cover_image_path, "covers", ".png"))
+        for old_path, source_path, kind, extension in sources:
+            if os.path.exists(old_path) and cache_manifest.is_fresh(old_path, source_path):  # Stale ones just get left behind
+                new_path = cache_store.path_for(source_path, kind, extension)
+                cache_store.adopt(old_path, new_path)
+                cache_manifest.forget(old_path)
+                cache_manifest.record(new_path, source_path)
+                moved += 1
+        for media_cache_dir in media_cache_dirs:
+            try:
+                os.rmdir(media_cache_dir)  # Only works if it's empty now
+            except OSError:
+                pass
+    library_index.commit()
+    cache_store.set_migrated(root)
+    print("Moved", moved, "cache files into", cache_store.root)
+
+
+@tracing.traced()
+def make_cover_file(image_path, anime_path, size=(280, 400)):  # Same file as ui's make_cover_cache, made by ffmpeg instead of GdkPixbuf
+    cover_cache_path = get_cover_cache_path(image_path, anime_path)
+    os.makedirs(os.path.dirname(cover_cache_path), exist_ok=True)
+    if scale_image(image_path, cover_cache_path, size) is None:
+        return None
+    cache_manifest.record(cover_cache_path, image_path)
+    return cover_cache_path
+
+
+def create_cache_builder(on_progress=None, on_done=None, make_cover=make_cover_file, workers=None):
+    def build_thumbnails(item):  # False if any of them couldn't be made
+        extract_video_thumbnails(item["sources"])
+        return all(is_cache_fresh(thumbnail_cache_path(source), source) for source in item["sources"])
+
+    handlers = {  # Each returns False if it couldn't make its files
+        "cover": lambda item: is_cache_fresh(get_cover_cache_path(item["source"], item["anime_path"]), item["source"])
+                              or make_cover(item["source"], item["anime_path"]) is not None,
+        "thumbnails": build_thumbnails,
+        "storyboard": lambda item: extract_video_storyboard(item["source"]) is not None,
+    }
+    return CacheBuilder(cache_build_journal_path, handlers, workers or pick_workers(anime_dir), on_progress, on_done)
+
+
+def update_anime_dir():
+    global anime_dir
+    anime_dir = settings.get("anime_folder", os.path.join(os.path.expanduser("~"), "Anime"))
+
+
+def check_settings():  # Fix settings options if empty
+    if "anime_folder" not in settings or settings["anime_folder"] == "":
+        settings["anime_folder"] = os.path.expanduser("~")
+    if "title-language" not in settings or settings["title-language"] == "":
+        settings["title-language"] = "en"
+    if "first-time" not in settings or settings["first-time"] == "":
+        settings["first-time"] = True
+    if "cache-budget-mb" not in settings or settings["cache-budget-mb"] == "":
+        settings["cache-budget-mb"] = 2048
+    if "texture-cache-mb" not in settings or settings["texture-cache-mb"] == "":
+        settings["texture-cache-mb"] = 256
+    if "cache-location" not in settings or settings["cache-location"] not in ("media", "central"):
+        settings["cache-location"] = "media"
+    if "auto-advance" not in settings or settings["auto-advance"] == "":
+        settings["auto-advance"] = True
+    if "anime_folders" not in settings or not isinstance(settings["anime_folders"], list):
+        settings["anime_folders"] = []  # More library folders, shown together with anime_folder
+    if "library-timeout" not in settings or settings["library-timeout"] == "":
+        settings["library-timeout"] = 10  # Seconds a library folder gets to answer before it's offline
+    if "storyboards" not in settings or settings["storyboards"] == "":
+        settings["storyboards"] = True  # Seek bar previews, made by "Generate All Cache" and when a video opens
+    if "storyboard-interval" not in settings or settings["storyboard-interval"] == "":
+        settings["storyboard-interval"] = 10  # Seconds between storyboard frames
+    cache_manifest.budget_bytes = settings["cache-budget-mb"] * 1024 * 1024
+    save_settings()
+    update_anime_dir()
+
+
+@tracing.traced()
+def save_settings():
+    with open(settings_path, "w") as F:
+        json.dump(settings, F, indent=4)
+
+
+def natural_sort_key(text):
+    return [int(s) if s.isdigit() else s.lower() for s in re.split(r'(\d+)', text)]
@@ -0,0 +1,93 @@
+import os, struct, bisect
+from thumbnails import read_box_header
+
+# Keyframe times of a video, read from the mp4 sample tables (stss + stts of the video track), no decoding.
+# Seeking to a keyframe only needs one frame decoded, so scrubbing snaps to them.
+
+container_boxes = (b"moov", b"trak", b"mdia", b"minf", b"stbl")
+
+
+def read_boxes(f, start, end):  # {box type: [(payload start, payload end)]} for the boxes between start and end
+    boxes = {}
+    f.seek(start)
+    while f.tell() + 8 <= end:
+        box_start = f.tell()
+        box_type, size, header_size = read_box_header(f)
+        if box_type is None:
+            break
+        if size is None:
+            size = end - box_start
+        if size < header_size:  # Broken file
+            break
+        boxes.setdefault(box_type, []).append((box_start + header_size, box_start + size))
+        f.seek(box_start + size)
+    return boxes
+
+
+def find_box(f, start, end, path):  # Follows a path of box types like [b"mdia", b"minf", b"stbl"], (start, end) or None
+    for box_type in path:
+        found = read_boxes(f, start, end).get(box_type)
+        if not found:
+            return None
+        start, end = found[0]
+    return start, end
+
+
+def read_table(f, box, entry_format):  # Entries of a full box with an entry count (stss, stts)
+    start, end = box
+    f.seek(start + 4)  # Version and flags
+    count = struct.unpack(">I", f.read(4))[0]
+    entry_size = struct.calcsize(entry_format)
+    count = min(count, (end - start - 8) // entry_size)
+    data = f.read(count * entry_size)
+    return list(struct.iter_unpack(entry_format, data))
+
+
+def mp4_keyframes(video_path):  # Sorted keyframe times in microseconds, None if unknown or every frame is a keyframe
+    try:
+        with open(video_path, "rb") as f:
+            file_end = os.fstat(f.fileno()).st_size
+            moov = read_boxes(f, 0, file_end).get(b"moov")
+            if not moov:
+                return None
+            for trak_start, trak_end in read_boxes(f, *moov[0]).get(b"trak", []):
+                hdlr = find_box(f, trak_start, trak_end, [b"mdia", b"hdlr"])
+                if hdlr is None:
+                    continue
+                f.seek(hdlr[0] + 8)  # Version, flags and pre_defined
+                if f.read(4) != b"vide":
+                    continue
+                mdhd = find_box(f, trak_start, trak_end, [b"mdia", b"mdhd"])
+                stbl = find_box(f, trak_start, trak_end, [b"mdia", b"minf", b"stbl"])
+                if mdhd is None or stbl is None:
+                    return None
+                f.seek(mdhd[0])
+                version = f.read(1)[0]
+                f.seek(mdhd[0] + (20 if version == 1 else 12))
+                timescale = struct.unpack(">I", f.read(4))[0]
+                tables = read_boxes(f, *stbl)
+                if b"stss" not in tables or b"stts" not in tables or not timescale:
+                    return None
+                sync_samples = [n for (n,) in read_table(f, tables[b"stss"][0], ">I")]
+                times = []
+                sample, time = 1, 0
+                index = 0
+                for count, delta in read_table(f, tables[b"stts"][0], ">II"):
+                    # Sync samples between sample and sample + count - 1 are at time + (n - sample) * delta
+                    while index < len(sync_samples) and sync_samples[index] < sample + count:
+                        times.append((time + (sync_samples[index] - sample) * delta) * 1000000 // timescale)
+                        index += 1
+                    sample += count
+                    time += count * delta
+                return times or None
+    except (OSError, struct.error, IndexError):
+        pass
+    return None
+
+
+def nearest_keyframe(keyframes, position):  # The keyframe closest to position, position if there's no index
+    if not keyframes:
+        return position
+    index = bisect.bisect_left(keyframes, position)
+    candidates = keyframes[max(0, index - 1):index + 1]
+    return min(candidates, key=lambda keyframe: abs(keyframe - position))
@@ -0,0 +1,98 @@
+import os, re
+import tracing
+
+# Finds anime and episodes with os.scandir, which already knows if an entry is a file or a folder,
+# so there's no extra stat per entry (every stat is a round trip on a network share).
+# - Videos are recognised by extension, then by the first bytes of the file, so a renamed text file isn't an episode
+# - "Season 1", "Season 02", "S3" folders inside an anime are searched too
+# - The season folder names are saved in the library index, so checking a series for changes is only stats
+# - core.scan_root crawls the series of a library folder in parallel
+
+video_extensions = (".mp4", ".m4v", ".mkv", ".webm", ".avi")
+season_pattern = re.compile(r"^(season\s*\d+|s\d+)$", re.IGNORECASE)
+crawl_workers = 8  # Mostly waiting on the disk or the network, not the CPU
+
+
+def is_video_name(name):
+    return name.lower().endswith(video_extensions) and not name.startswith(".")
+
+
+def is_season_folder(name):
+    return season_pattern.match(name) is not None
+
+
+def looks_like_video(path):  # Checks the container's magic bytes
+    try:
+        with open(path, "rb") as f:
+            header = f.read(12)
+    except OSError:
+        return False
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".mp4", ".m4v"):
+        return header[4:8] in (b"ftyp", b"moov", b"mdat", b"free", b"wide", b"skip")
+    if extension in (".mkv", ".webm"):
+        return header[:4] == b"\x1a\x45\xdf\xa3"  # EBML
+    if extension == ".avi":
+        return header[:4] == b"RIFF" and header[8:12] == b"AVI "
+    return False
+
+
+def scan_videos(folder, prefix=""):  # Video names in one folder, prefix is added in front of them
+    videos = []
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if is_video_name(entry.name) and entry.is_file() and looks_like_video(entry.path):
+                    videos.append(prefix + entry.name)
+    except OSError as e:
+        print("Couldn't list", folder, e)
+    return videos
+
+
+@tracing.traced("scan_series")
+def scan_series_with_seasons(anime_path):  # (episodes, season folder names), episodes like "Season 2/Episode 1.mkv"
+    episodes, seasons = [], []
+    try:
+        with os.scandir(anime_path) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir():
+                    if is_season_folder(entry.name):
+                        seasons.append(entry.name)
+                elif is_video_name(entry.name) and entry.is_file() and looks_like_video(entry.path):
+                    episodes.append(entry.name)
+    except OSError as e:
+        print("Couldn't list", anime_path, e)
+        return [], []
+    for season in seasons:
+        episodes += scan_videos(os.path.join(anime_path, season), season + os.sep)
+    return episodes, seasons
+
+
+def scan_series(anime_path):  # Episode paths relative to anime_path
+    return scan_series_with_seasons(anime_path)[0]
+
+
+@tracing.traced()
+def series_mtime(anime_path, seasons=()):  # Newest mtime of the anime folder and the given season folders, None if one's gone
+    # Only stats: a season folder being added or removed changes the anime folder's mtime, and an episode
+    # being added to a season changes that season's mtime
+    try:
+        mtime = os.stat(anime_path).st_mtime_ns
+        for season in seasons:
+            mtime = max(mtime, os.stat(os.path.join(anime_path, season)).st_mtime_ns)
+    except OSError:
+        return None
+    return mtime
+
+
+@tracing.traced()
+def list_series(root):  # Anime folder names in root
+    try:
+        with os.scandir(root) as entries:
+            return [entry.name for entry in entries if not entry.name.startswith(".") and entry.is_dir()]
+    except OSError as e:
+        print("Couldn't list", root, e)
+        return []
+
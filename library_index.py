@@ -0,0 +1,94 @@
+import os, json, sqlite3, threading
+from library_crawler import list_series, series_mtime
+
+# Persistent index of the library, so we don't have to rescan every series on every refresh.
+# Each series is revalidated with the mtime of its folder (and its season folders, whose names are saved too)
+# and its PTBAnime-info.json, if both are unchanged we use what we have saved instead of listing the folders again.
+
+cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+index_path = os.path.join(cache_home, "ptbanime", "library-index.sqlite")
+
+
+def get_mtime(path):  # Returns None if the file doesn't exist
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class LibraryIndex:
+    def __init__(self, db_path=index_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.lock = threading.Lock()  # The grid refresh runs in a thread
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS roots (root TEXT PRIMARY KEY, mtime INTEGER, folders TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS series ("
+                        "root TEXT, folder TEXT, dir_mtime INTEGER, info_mtime INTEGER, "
+                        "cover_path TEXT, data TEXT, episodes TEXT, PRIMARY KEY (root, folder))")
+        try:  # Indexes from before season folder names were saved, those rows are scanned once more
+            self.db.execute("ALTER TABLE series ADD COLUMN seasons TEXT")
+        except sqlite3.OperationalError:  # Already there
+            pass
+        self.db.commit()
+
+    def list_folders(self, root):  # Only lists the root folder again if it changed
+        root_mtime = get_mtime(root)
+        with self.lock:
+            row = self.db.execute("SELECT mtime, folders FROM roots WHERE root = ?", (root,)).fetchone()
+        if row is not None and row[0] == root_mtime:
+            return json.loads(row[1])
+        folders = list_series(root)
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO roots VALUES (?, ?, ?)", (root, root_mtime, json.dumps(folders)))
+            # Forget series that were removed
+            known = [r[0] for r in self.db.execute("SELECT folder FROM series WHERE root = ?", (root,))]
+            for folder in set(known) - set(folders):
+                self.db.execute("DELETE FROM series WHERE root = ? AND folder = ?", (root, folder))
+            self.db.commit()
+        return folders
+
+    def get_series(self, root, folder, load_series, commit=True):
+        # load_series(full anime path) -> (anime_data, cover_path, episodes, season folder names), only called when
+        # something changed. Returns (anime_data, cover_path, episodes)
+        full_path = os.path.join(root, folder)
+        with self.lock:
+            row = self.db.execute("SELECT dir_mtime, info_mtime, cover_path, data, episodes, seasons FROM series "
+                                  "WHERE root = ? AND folder = ?", (root, folder)).fetchone()
+        if row is not None and row[5] is not None:
+            dir_mtime = series_mtime(full_path, json.loads(row[5]))
+            info_mtime = get_mtime(os.path.join(full_path, "PTBAnime-info.json"))
+            if row[0] == dir_mtime and row[1] == info_mtime:
+                return json.loads(row[3]), row[2], json.loads(row[4])
+        anime_data, cover_path, episodes, seasons = load_series(full_path)
+        # load_series can create or fix the data file, so check the times again after
+        dir_mtime = series_mtime(full_path, seasons)
+        info_mtime = get_mtime(os.path.join(full_path, "PTBAnime-info.json"))
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO series (root, folder, dir_mtime, info_mtime, cover_path, data, episodes, seasons) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (root, folder, dir_mtime, info_mtime, cover_path,
+                                                                json.dumps(anime_data), json.dumps(episodes), json.dumps(seasons)))
+            if commit:  # Scanning the whole library commits once at the end instead
+                self.db.commit()
+        return anime_data, cover_path, episodes
+
+    def saved_series(self, root):  # [(folder, anime_data, cover_path, episodes)] as last scanned, without touching the disk
+        with self.lock:
+            rows = self.db.execute("SELECT folder, data, cover_path, episodes FROM series WHERE root = ? ORDER BY folder",
+                                   (root,)).fetchall()
+        return [(folder, json.loads(data), cover_path, json.loads(episodes)) for folder, data, cover_path, episodes in rows]
+
+    def saved_seasons(self, root):  # {folder: season folder names} as last scanned, None where it's not known yet
+        with self.lock:
+            rows = self.db.execute("SELECT folder, seasons FROM series WHERE root = ?", (root,)).fetchall()
+        return {folder: json.loads(seasons) if seasons is not None else None for folder, seasons in rows}
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+
+    def forget(self, root):  # Drops everything saved for a root
+        with self.lock:
+            self.db.execute("DELETE FROM roots WHERE root = ?", (root,))
+            self.db.execute("DELETE FROM series WHERE root = ?", (root,))
+            self.db.commit()
@@ -1,6 +1,18 @@
+import startup_profile  # First, so the other imports are timed too
 import gi
 gi.require_version('Gtk', '4.0')
+import collections
 from ui import *
+from watcher import LibraryWatcher
+import playback_state
+from seek_controller import SeekController
+from search_index import filter_change
+from keyframes import mp4_keyframes
+import tracing
+startup_profile.mark("imports")
+
+filter_changes = {"more_strict": Gtk.FilterChange.MORE_STRICT, "less_strict": Gtk.FilterChange.LESS_STRICT,
+                  "different": Gtk.FilterChange.DIFFERENT}
 
 # Global debug flag
 DEBUG_MODE = False
@@ -18,7 +30,34 @@ class Application(Gtk.Application):
         check_settings()
         GLib.set_application_name("PTBAnime")
         self.query = ""
-        self.content_grid = Gtk.FlowBox()
+        self.search_index = SearchIndex()  # Titles, descriptions and episode names of everything in the library
+        self.search_results = None  # Anime path -> score, None when not searching
+        self.search_timer = None
+        self.search_delay = 120  # ms after the last key press before searching
+        # Library: store -> filter (search) -> sort (best match first) -> grid view. Only cards on screen exist as widgets
+        self.library_store = Gio.ListStore.new(AnimeItem)
+        self.library_filter = Gtk.CustomFilter.new(self.filter_func)
+        self.library_filter_model = Gtk.FilterListModel.new(self.library_store, self.library_filter)
+        self.library_sorter = Gtk.CustomSorter.new(self.sort_func)
+        self.library_sort_model = Gtk.SortListModel.new(self.library_filter_model, None)  # Sorter only while searching
+        self.content_grid = Gtk.GridView.new(Gtk.NoSelection.new(self.library_sort_model), create_anime_grid_factory(self.on_anime_hovered))
+        self.prefetch_timer = None
+        self.prefetch_delay = 150  # ms a card has to stay hovered or focused, so sweeping over cards doesn't load them all
+        self.anime_items = {}  # Anime path -> AnimeItem
+        self.reread_timers = {}  # Anime path -> (GLib source id, added), watcher events waiting for the burst to end
+        self.reread_delay = 300  # ms without new events for an anime before reading it again
+        self.reread_generation = 0
+        self.reread_latest = {}  # Anime path -> generation of the read in flight, older reads are dropped
+        self.grid_generation = 0  # Goes up every refresh, so old refreshes know to stop
+        self.grid_frame_budget = 0.008  # Seconds of adding cards per idle callback, so a frame is still drawn in time
+        self.grid_chunk_size = 32  # Cards per splice, the budget is checked between them
+        self.grid_metrics = None
+        # Episodes: store -> grid view, same as the library
+        self.episode_store = Gio.ListStore.new(EpisodeItem)
+        self.episode_items = {}  # Video path -> EpisodeItem
+        self.episodes_generation = 0
+        self.watchers = {}  # Library root -> LibraryWatcher, only for roots that are online
+        self.cache_builder = None  # Running "Generate All Cache"
         self.stack = Gtk.Stack()
         self.win = Gtk.ApplicationWindow()
         self.current_anime = None
@@ -26,6 +65,7 @@ class Application(Gtk.Application):
         self.currently_watching_episode_n = False
         self.current_anime_total_episodes = None
         self.is_currently_watching = False
+        self.trace_path = None  # --trace writes a Chrome trace here on exit
 
         # Timer for hiding controls
         self.hide_controls_timeout_id = None
@@ -39,63 +79,152 @@ class Application(Gtk.Application):
         self.motion_controller_mouse_movement = Gtk.EventControllerMotion.new()
         self.motion_controller_mouse_movement.connect("motion", self.show_controls_and_header_and_reset_hide_timer)
         self.mouse_last_pos = [0, 0]
-        self.key_repeat_id = None
-        GLib.timeout_add(4000, self.autosave_video_data)
+        self.last_skip = (None, 0)  # (key, time) of the last seek from the keyboard, for slowing down key repeat
+        self.skip_repeat_interval = 0.3  # Seconds between seeks while a key is held
 
         # Essential UI elements for video player
         self.video: Gtk.Video = Gtk.Video.new()
         self.headerbar_revealer: Gtk.Revealer = Gtk.Revealer.new()
         self.media_controls_revealer: Gtk.Revealer = Gtk.Revealer.new()
         self.media: Gtk.MediaFile = Gtk.MediaFile.new()
+        self.media_handlers = []  # Signal handler ids on self.media
+        self.playback = playback_state.PlaybackStateMachine()  # Driven by the media stream's signals, no polling
+        self.playback.add_listener(self.on_playback_transition)
+        self.resume_at = 0
+        self.last_recorded_timestamp = None
+        # Skips from the keyboard, coalesced so slow seeks don't pile up
+        self.seek_controller = SeekController(self.media_seek, lambda: self.media.get_timestamp(), lambda: self.media.get_duration())
+        self.storyboard_preview = None  # Made with the video page
+        self.seek_bar = None  # The Gtk.Scale inside the media controls, found on first hover
+        self.storyboard_pool = ThreadPoolExecutor(max_workers=1)  # One storyboard at a time, next to playback
+        self.episode_page_loaded = False  # The Episodes and Video pages are made the first time they're needed
+        # Auto-advance: the next episode gets its own media stream in the last minute, and is swapped in at the end
+        self.next_media = None
+        self.next_item = None
+        self.advance_preload_seconds = 60
+        self.advance_gaps = []  # ms from the end of one episode to the next one playing
+        self.video_page_loaded = False
 
         debug_print("Application: Initialization complete.")
+        startup_profile.mark("application init")
 
     def cleanup(self):
         self.save_video_data()
-
-    def autosave_video_data(self):
-        if self.is_currently_watching:
-            anime_data_path = os.path.join(self.current_anime, "PTBAnime-info.json")
-            with open(anime_data_path, "r") as F:
-                anime_data = json.load(F)
-            if anime_data["last-episode-timestamp"] == self.media.get_timestamp():  # If finished video completely
-                self.go_to_episodes_from_vid()
-                anime_data["last-episode"] += 1
-                print(anime_data["last-episode"], self.current_anime_total_episodes)
-                if anime_data["last-episode"] > self.current_anime_total_episodes:
-                    anime_data["last-episode"] = self.current_anime_total_episodes
-                print(anime_data["last-episode"], self.current_anime_total_episodes)
-            anime_data["last-episode-timestamp"] = self.media.get_timestamp()
-            with open(anime_data_path, "w") as F:
-                json.dump(anime_data, F, indent=4)
-            print("Saved data")
-        return True
-
-    def save_video_data(self):
-        if self.is_currently_watching:
-            anime_data_path = os.path.join(self.current_anime, "PTBAnime-info.json")
-            with open(anime_data_path, "r") as F:
-                anime_data = json.load(F)
-            if anime_data["last-episode-timestamp"] == self.media.get_timestamp():  # If finished video completely
-                self.go_to_episodes_from_vid()
-                anime_data["last-episode"] += 1
-                print(anime_data["last-episode"], self.current_anime_total_episodes)
-                if anime_data["last-episode"] > self.current_anime_total_episodes:
-                    anime_data["last-episode"] = self.current_anime_total_episodes
-                print(anime_data["last-episode"], self.current_anime_total_episodes)
-            anime_data["last-episode-timestamp"] = self.media.get_timestamp()
-            with open(anime_data_path, "w") as F:
-                json.dump(anime_data, F, indent=4)
-            print("Saved data")
-
-    def load_video_data(self):
-        if self.media.is_prepared():
-            anime_data_path = os.path.join(self.current_anime, "PTBAnime-info.json")
-            with open(anime_data_path, "r") as F:
-                anime_data = json.load(F)
-            self.media.seek(anime_data["last-episode-timestamp"])
-            return False  # Finished
-        return True  # Keep checking
+        debug_print("cleanup: Texture cache:", texture_cache.stats())
+        debug_print("cleanup: Seek latency:", self.seek_controller.stats())
+        if tracing.enabled:
+            tracing.report()
+            if self.trace_path:
+                tracing.export(self.trace_path)
+                print("Trace written to", self.trace_path)
+
+    def record_progress(self):  # Puts where we are into the progress store, no file I/O. Returns True if the video ended
+        if not self.is_currently_watching or not self.media.is_prepared():  # Not loaded yet, it would save 0
+            return False
+        ended = self.media.get_ended()
+        episode, timestamp = playback_state.resume_point(self.currently_watching_episode_n, self.current_anime_total_episodes,
+                                                         self.media.get_timestamp(), ended)
+        progress_store.update(self.current_anime, episode, timestamp)
+        return ended
+
+    def save_video_data(self):  # Leaving the video or closing the app, write it all to PTBAnime-info.json
+        self.record_progress()
+        progress_store.save()
+
+    def attach_media(self, media):  # Makes media the stream the player shows and controls
+        for handler_id in self.media_handlers:
+            self.media.disconnect(handler_id)
+        self.media = media
+        self.media_handlers = [
+            media.connect("notify::prepared", lambda m, p: m.is_prepared() and self.playback.fire("prepared", m.get_playing())),
+            media.connect("notify::playing", lambda m, p: self.playback.fire("play" if m.get_playing() else "pause")),
+            media.connect("notify::ended", lambda m, p: m.get_ended() and self.playback.fire("ended")),
+            media.connect("notify::timestamp", self.on_media_timestamp),
+            media.connect("notify::seeking", lambda m, p: m.is_seeking() or self.seek_controller.seek_done()),
+        ]
+        self.video.set_media_stream(media)
+        self.media_controls.set_media_stream(media)
+
+    def open_media(self, resume_at=0):  # current_watching was set, start it from resume_at (microseconds)
+        self.resume_at = resume_at
+        self.last_recorded_timestamp = None
+        self.seek_controller.reset()
+        threading.Thread(target=self.load_keyframes, args=(self.current_watching,), daemon=True).start()
+        if self.storyboard_preview is not None:
+            self.storyboard_preview.clear()
+        if settings.get("storyboards", True):
+            self.storyboard_pool.submit(self.load_storyboard, self.current_watching)
+        self.playback.fire("open")
+        self.update_video()
+        if self.media.is_prepared():  # Same file as before, there won't be a notify::prepared
+            self.playback.fire("prepared", self.media.get_playing())
+
+    def on_playback_transition(self, old_state, event, new_state):
+        debug_print("on_playback_transition:", old_state, event, "->", new_state)
+        if event == "prepared" and self.resume_at:
+            self.media.seek(self.resume_at)
+            self.resume_at = 0
+        elif new_state == playback_state.PAUSED and old_state == playback_state.PLAYING:
+            self.record_progress()  # Paused, make sure the position is on disk
+            progress_store.flush(force=True)
+        elif new_state == playback_state.ENDED:
+            self.on_media_ended()
+
+    def on_media_timestamp(self, media, pspec):  # Many times a second while playing, only does something every second
+        if self.playback.state != playback_state.PLAYING:
+            return
+        timestamp = media.get_timestamp()
+        if self.last_recorded_timestamp is not None and abs(timestamp - self.last_recorded_timestamp) < 1000000:
+            return
+        self.last_recorded_timestamp = timestamp
+        self.record_progress()
+        progress_store.flush()  # Only writes if something changed, and not more than every 30 seconds
+        remaining = (media.get_duration() - timestamp) / 1000000  # Microseconds
+        if settings["auto-advance"] and self.next_media is None and media.get_duration() > 0 and remaining < self.advance_preload_seconds:
+            self.prepare_next_episode()
+
+    def prepare_next_episode(self):
+        item = self.episode_store.get_item(self.currently_watching_episode_n)  # Episode numbers start at 1, so this is the next one
+        if item is None:  # Last episode
+            return
+        debug_print(f"prepare_next_episode: Preparing '{item.video_path}'.")
+        threading.Thread(target=warm_file, args=(item.video_path,), daemon=True).start()
+        self.next_item = item
+        self.next_media = Gtk.MediaFile.new_for_filename(item.video_path)  # Starts opening it, but doesn't play
+
+    def drop_next_episode(self):
+        if self.next_media is not None:
+            self.next_media.set_file(None)
+        self.next_media = None
+        self.next_item = None
+
+    def on_media_ended(self):
+        if not self.is_currently_watching:
+            return
+        media = self.media
+        ended_at = time.perf_counter()
+        if not settings["auto-advance"] or self.next_media is None:
+            self.go_to_episodes_from_vid()
+            return
+        self.record_progress()  # Ended, so this moves the progress to the next episode
+        next_media, item = self.next_media, self.next_item
+        self.next_media, self.next_item = None, None
+        self.attach_media(next_media)
+        media.set_file(None)  # Let go of the old episode
+        self.currently_watching_episode_n = item.episode_num
+        self.current_watching = item.video_path
+        progress_store.update(self.current_anime, item.episode_num, 0)
+        self.open_media()
+
+        def on_timestamp(stream, pspec):
+            if stream.get_timestamp() > 0:
+                stream.disconnect(handler_id)
+                gap = (time.perf_counter() - ended_at) * 1000
+                self.advance_gaps.append(gap)
+                print(f"Auto-advanced to episode {item.episode_num} in {gap:.0f} ms")
+
+        handler_id = next_media.connect("notify::timestamp", on_timestamp)
+        next_media.play()
 
     def show_controls_and_header_and_reset_hide_timer(self, controller=None, x=None, y=None):
         if (round(x), round(y)) != (round(self.mouse_last_pos[0]), round(self.mouse_last_pos[1])):
@@ -105,76 +234,329 @@ class Application(Gtk.Application):
             # print("Mouse cursor moved")
         self.mouse_last_pos = [x, y]
 
-    def on_search_changed(self, entry):
-        debug_print(f"on_search_changed: Query changed to '{entry.get_text()}'")
-        self.query = entry.get_text().lower()
-        self.content_grid.invalidate_filter()
-
-    def filter_func(self, child: Gtk.FlowBoxChild):
-        result = self.query in child.get_child().title.lower() if self.query != "" else True
-        debug_print(f"filter_func: Filtering child '{child.get_child().title}', query '{self.query}', result: {result}")
-        return result
+    def on_search_changed(self, entry):  # Every key press, the search waits until typing stops for a moment
+        if self.search_timer is not None:
+            GLib.source_remove(self.search_timer)
+        self.search_timer = GLib.timeout_add(self.search_delay, self.run_search, entry.get_text())
+
+    def run_search(self, text):
+        self.search_timer = None
+        old_results = self.search_results
+        self.query = text.lower()
+        time_start = time.perf_counter()
+        self.search_results = self.search_index.search(self.query)
+        if DEBUG_MODE:  # Runs per key press, don't build the message for nothing
+            debug_print(f"run_search: '{self.query}' matched {len(self.search_results) if self.search_results is not None else 'everything'}"
+                        f" in {(time.perf_counter() - time_start) * 1000:.2f} ms")
+        change = filter_change(old_results, self.search_results)
+        if change != "same":  # MORE_STRICT only when nothing new matched, then the filter model checks just what it showed
+            self.library_filter.changed(filter_changes[change])
+        if self.search_results is None:  # Library order, no Python comparator over the whole library
+            self.library_sort_model.set_sorter(None)
+        else:
+            self.library_sort_model.set_sorter(self.library_sorter)
+            self.library_sorter.changed(Gtk.SorterChange.DIFFERENT)  # The scores changed
+        return GLib.SOURCE_REMOVE
+
+    def filter_func(self, item: AnimeItem):
+        return self.search_results is None or item.anime_path in self.search_results
+
+    def sort_func(self, a: AnimeItem, b: AnimeItem):  # Best match first, the library order when not searching
+        if self.search_results is None:
+            return 0
+        return (self.search_results.get(b.anime_path, 0) > self.search_results.get(a.anime_path, 0)) - \
+            (self.search_results.get(b.anime_path, 0) < self.search_results.get(a.anime_path, 0))
+
+    def on_anime_hovered(self, item):  # Card hovered or focused, start loading its episodes page
+        if self.prefetch_timer is not None:
+            GLib.source_remove(self.prefetch_timer)
+            self.prefetch_timer = None
+        if item.offline:  # Nothing to load, it would only tie up a prefetch worker
+            return
+        self.prefetch_timer = GLib.timeout_add(self.prefetch_delay, self.start_prefetch, item.anime_path)
+
+    def start_prefetch(self, anime_path):
+        self.prefetch_timer = None
+        debug_print(f"start_prefetch: '{anime_path}'")
+        series_prefetcher.prefetch(anime_path)
+        return GLib.SOURCE_REMOVE
+
+    def on_focus_changed(self, window, pspec):  # Keyboard focus on a library card counts as hovering it
+        focus_widget = window.get_focus()
+        card = focus_widget.get_first_child() if focus_widget is not None else None
+        if isinstance(card, AnimeCard) and card.item is not None:
+            self.on_anime_hovered(card.item)
 
     def refresh_grid(self, idk=None, idkchild=None):
-        debug_print("refresh_grid: Starting grid refresh in a new thread.")
+        # Scanning happens in a thread, the anime get added to the list store on the main thread in
+        # batches so the window keeps drawing. A newer refresh makes the older one stop.
+        self.grid_generation += 1
+        generation = self.grid_generation
+        series_prefetcher.invalidate()  # Pages loaded before the refresh could show files that are gone
+        debug_print(f"refresh_grid: Starting grid refresh #{generation}.")
+        time_start = time.perf_counter()
+        loaded = collections.deque()  # AnimeItems waiting to be added
+        state = {"scanning": True, "scheduled": False, "added": 0, "first_card": None}
+        root_sizes = dict.fromkeys(library_roots(), 0)  # Cards per root, each root keeps its own stretch of the grid
+        lock = threading.Lock()
+
+        self.library_store.remove_all()
+        self.anime_items.clear()
+        search_generation = self.search_index.clear()  # An older scan still running can't add to the new index
+
+        def schedule():  # Makes sure add_batch is queued, called from both threads
+            with lock:
+                if not state["scheduled"]:
+                    state["scheduled"] = True
+                    GLib.idle_add(add_batch)
+
+        def add_chunk():  # Up to grid_chunk_size cards into the store, returns how many
+            batch = {}  # Root -> items, roots are scanned at the same time so their anime come in mixed
+            added = 0
+            while loaded and added < self.grid_chunk_size:
+                item = loaded.popleft()
+                if item.anime_path not in self.anime_items:  # Could be added by the watcher already
+                    self.anime_items[item.anime_path] = item
+                    batch.setdefault(root_of(item.anime_path), []).append(item)
+                    added += 1
+            with tracing.span("add_cards", count=added):  # Makes and binds the cards that come on screen
+                for root, items in batch.items():
+                    root_sizes[root] = root_sizes.get(root, 0) + len(items)
+                    end = 0  # End of this root's stretch, after every root before it
+                    for other_root, size in root_sizes.items():
+                        end += size
+                        if other_root == root:
+                            break
+                    position = min(end - len(items), self.library_store.get_n_items())
+                    self.library_store.splice(position, 0, items)
+            return added
+
+        def add_batch():
+            if generation != self.grid_generation:  # Superseded
+                return GLib.SOURCE_REMOVE
+            deadline = time.perf_counter() + self.grid_frame_budget  # Time, not a count, machines differ a lot
+            added = 0
+            while loaded and time.perf_counter() < deadline:
+                added += add_chunk()
+            state["added"] += added
+            if state["first_card"] is None and added:
+                state["first_card"] = time.perf_counter() - time_start
+            if loaded:
+                return GLib.SOURCE_CONTINUE  # Next batch after the frame is drawn
+            with lock:
+                state["scheduled"] = False
+                finished = not state["scanning"]
+            if finished:
+                self.report_grid_metrics(generation, time_start, state)
+            return GLib.SOURCE_REMOVE
 
         def do():
-            debug_print("refresh_grid.do: Removing existing children.")
-            child = self.content_grid.get_first_child()
-            while child:  # Remove all children
-                next_child = child.get_next_sibling()
-                self.content_grid.remove(child)
-                child = next_child
             if anime_dir_is_home_dir():  # Skips home dir
                 debug_print("refresh_grid.do: Anime directory is home directory, skipping.")
-                return
-            debug_print("refresh_grid.do: Fetching and re-adding anime folders.")
-            for anime in sorted(fetch_anime_folder()):  # Re-add found anime
-                anime_data, anime_cover_path = get_anime_info(anime)
-                self.content_grid.append(AnimeCard(anime_data, anime_cover_path, os.path.join(anime_dir, anime)))
-                debug_print(f"refresh_grid.do: Appended AnimeCard for '{anime_data.get('title-en', anime)}'")
+            else:
+                debug_print("refresh_grid.do: Fetching anime folders from the library index.")
+                for root, found_anime, online in iter_library():  # A few anime at a time, as soon as they're scanned
+                    for anime_path, anime_data, anime_cover_path, episodes in found_anime:
+                        if generation != self.grid_generation:
+                            debug_print(f"refresh_grid.do: Refresh #{generation} cancelled.")
+                            return
+                        self.search_index.add(anime_path, anime_data, episodes, search_generation)
+                        loaded.append(AnimeItem(anime_data, anime_cover_path, anime_path, offline=not online))
+                    schedule()
+            with lock:
+                state["scanning"] = False
+            schedule()  # Finishes up, even if nothing was found
+            GLib.idle_add(self.start_watchers, generation)  # Now we know which roots are online
+            migrate_media_caches()  # Only does something for the central cache
 
         threading.Thread(target=do, daemon=True).start()
 
+    def report_grid_metrics(self, generation, time_start, state):
+        total_time = time.perf_counter() - time_start
+        first_card = state["first_card"] if state["first_card"] is not None else total_time
+        self.grid_metrics = {"generation": generation, "cards": state["added"],
+                             "time_to_first_card": first_card, "time_to_complete": total_time}
+        print(f"Library loaded {state['added']} anime: first card after {first_card * 1000:.0f} ms, "
+              f"complete after {total_time * 1000:.0f} ms")
+
     def refresh_episodes_grid(self, nu=None, idkchild=None):
         debug_print("refresh_episodes_grid: Starting episodes grid refresh in a new thread.")
+        self.episodes_generation += 1
+        generation = self.episodes_generation
+        anime_path = self.current_anime
+        for old_anime_path in {item.anime_path for item in self.episode_items.values()} - {anime_path}:
+            thumbnail_service.cancel_group(old_anime_path)  # Don't make thumbnails for the anime we left
+        self.episode_store.remove_all()
+        self.episode_items.clear()
+
+        def show(items):
+            if generation != self.episodes_generation:  # Another anime was opened meanwhile
+                return GLib.SOURCE_REMOVE
+            self.episode_items = {item.video_path: item for item in items}
+            self.current_anime_total_episodes = len(items)
+            self.episode_selection_label.set_text("Movie" if len(items) == 1 else "Episodes")
+            self.episode_store.splice(0, self.episode_store.get_n_items(), items)
+            debug_print(f"refresh_episodes_grid.show: Added {len(items)} episodes.")
+            return GLib.SOURCE_REMOVE
+
+        def make_items(fetched_episodes):
+            last_episode = progress_store.get(anime_path)[0]  # Once, not per episode
+            items = []
+            for episode_n, episode in enumerate(fetched_episodes, start=1):
+                item = EpisodeItem(os.path.join(anime_path, episode), episode_n, anime_path)
+                item.update(episode_n, last_episode, len(fetched_episodes))
+                items.append(item)
+            return items
 
         def do():
-            debug_print("refresh_episodes_grid.do: Removing existing children.")
-            child = self.episode_selection_grid.get_first_child()
-            while child:  # Remove all children
-                next_child = child.get_next_sibling()
-                self.episode_selection_grid.remove(child)
-                child = next_child
-            episode_n = 1
-            fetched_episodes = fetch_episodes(self.current_anime)
+            fetched_episodes = fetch_indexed_episodes(anime_path)
             if fetched_episodes is None or len(fetched_episodes) == 0:
                 debug_print("refresh_episodes_grid.do: No episodes found for current anime.")
                 print("Episodes do not exist")  # Original print
                 return
             debug_print(f"refresh_episodes_grid.do: Found {len(fetched_episodes)} episodes. Sorting and re-adding.")
             fetched_episodes = sorted(fetched_episodes, key=natural_sort_key)  # Always sort :\
-            self.current_anime_total_episodes = len(fetched_episodes)
-            for episode in fetched_episodes:  # Re-Add found episodes
-                with open(os.path.join(self.current_anime, "PTBAnime-info.json"), "r") as F:
-                    anime_data = json.load(F)
-                card: EpisodeCard = EpisodeCard(anime_data, self.current_anime, "Episode " + str(episode_n), os.path.join(self.current_anime, episode), episode_n)
-                if anime_data["last-episode"] == episode_n:  # Give the card a unique look based on last watched
-                    card.cover.add_css_class("epicard-continue")
-                    card.label.set_text("Continue " + card.label.get_text() + "...")
-                elif episode_n < anime_data["last-episode"]:
-                    card.cover.add_css_class("epicard-watched")
-                else:
-                    card.cover.add_css_class("epicard-not-watched")
-                if len(fetched_episodes) == 1:  # If there is only 1 episode, make it show as a movie instead
-                    card.label.set_text("Watch Movie")
-                    self.episode_selection_label.set_text("Movie")
-                self.episode_selection_grid.append(card)
-                debug_print(f"refresh_episodes_grid.do: Appended EpisodeCard for episode {episode_n} ('{episode}')")
-                episode_n += 1
+            GLib.idle_add(show, make_items(fetched_episodes))
+
+        prefetched = series_prefetcher.get(anime_path)
+        if prefetched is not None and prefetched["episodes"]:  # Card was hovered, the page is there before it slides in
+            debug_print(f"refresh_episodes_grid: Using {len(prefetched['episodes'])} prefetched episodes.")
+            show(make_items(prefetched["episodes"]))
+            return
 
         threading.Thread(target=do, daemon=True).start()
 
+    def start_watchers(self, generation=None):  # (Re)starts watching the library roots that are online for changes
+        if generation is not None and generation != self.grid_generation:  # A newer refresh starts its own
+            return GLib.SOURCE_REMOVE
+        for watcher in self.watchers.values():
+            watcher.stop()
+        self.watchers.clear()
+        for root in library_roots():
+            if root_status.get(root) != "online":  # Offline roots could hang the main thread
+                debug_print("start_watchers: Not watching offline root", root)
+                continue
+            self.watchers[root] = LibraryWatcher(root, self.on_anime_added, self.on_anime_removed,
+                                                 self.on_anime_changed, self.on_episode_added, self.on_episode_removed)
+            self.watchers[root].start(library_index.saved_seasons(root))  # What the scan just found, no listing
+        return GLib.SOURCE_REMOVE
+
+    def reread_series(self, anime_path, added=False):
+        # Copying a season in fires an event per file, so wait until they stop and read the anime once.
+        # The reading happens in a thread, only the grid update comes back to the main thread
+        pending = self.reread_timers.pop(anime_path, None)
+        if pending is not None:
+            GLib.source_remove(pending[0])
+            added = added or pending[1]
+        self.reread_timers[anime_path] = (GLib.timeout_add(self.reread_delay, self.start_reread, anime_path, added), added)
+
+    def start_reread(self, anime_path, added):
+        del self.reread_timers[anime_path]
+        self.reread_generation += 1
+        generation = self.reread_generation
+        self.reread_latest[anime_path] = generation
+
+        def do():
+            anime_data, cover_path, episodes = library_index.get_series(os.path.dirname(anime_path), os.path.basename(anime_path), load_series)
+            self.search_index.add(anime_path, anime_data, episodes)  # The description or episode names could have changed
+            GLib.idle_add(self.apply_reread, anime_path, added, generation, anime_data, cover_path, episodes)
+
+        threading.Thread(target=do, daemon=True).start()
+        return GLib.SOURCE_REMOVE
+
+    def apply_reread(self, anime_path, added, generation, anime_data, cover_path, episodes):
+        if anime_path not in self.reread_latest:  # Removed while it was being read
+            self.search_index.remove(anime_path)
+            return GLib.SOURCE_REMOVE
+        if self.reread_latest[anime_path] != generation:  # A newer read is on its way
+            return GLib.SOURCE_REMOVE
+        del self.reread_latest[anime_path]
+        item = self.anime_items.get(anime_path)
+        if item is None:
+            if added:
+                debug_print(f"apply_reread: Adding item for '{anime_path}'")
+                item = AnimeItem(anime_data, cover_path, anime_path)
+                self.anime_items[anime_path] = item
+                self.library_store.insert_sorted(item, lambda a, b: (a.anime_path > b.anime_path) - (a.anime_path < b.anime_path))
+        # The data file also changes when watching, only replace the item if something you can see changed
+        elif (anime_data["title"], anime_data["title-en"], cover_path) != (item.info["title"], item.info["title-en"], item.image_path):
+            debug_print(f"apply_reread: Replacing item for '{anime_path}'")
+            found, position = self.library_store.find(item)
+            new_item = AnimeItem(anime_data, cover_path, anime_path)
+            self.anime_items[anime_path] = new_item
+            if found:
+                self.library_store.splice(position, 1, [new_item])
+        self.sync_episode_items(anime_path, episodes)
+        return GLib.SOURCE_REMOVE
+
+    def on_anime_added(self, anime_path):
+        debug_print(f"on_anime_added: '{anime_path}'")
+        if anime_path in self.anime_items:
+            return
+        self.reread_series(anime_path, added=True)
+
+    def on_anime_removed(self, anime_path):
+        debug_print(f"on_anime_removed: '{anime_path}'")
+        pending = self.reread_timers.pop(anime_path, None)
+        if pending is not None:
+            GLib.source_remove(pending[0])
+        self.reread_latest.pop(anime_path, None)  # A read already running drops its result
+        item = self.anime_items.pop(anime_path, None)
+        metadata.forget(anime_path)
+        self.search_index.remove(anime_path)
+        series_prefetcher.forget(anime_path)
+        if item is not None:
+            found, position = self.library_store.find(item)
+            if found:
+                self.library_store.remove(position)
+        if anime_path == self.current_anime and not self.is_currently_watching:
+            self.current_anime = None
+            self.go_to_library()
+
+    def on_anime_changed(self, anime_path):
+        if anime_path in self.anime_items:
+            self.reread_series(anime_path)
+
+    def on_episode_added(self, anime_path, video_path):
+        debug_print(f"on_episode_added: '{video_path}'")
+        if anime_path in self.anime_items or anime_path == self.current_anime:
+            self.reread_series(anime_path)  # Also brings the open episodes page up to date
+        series_prefetcher.forget(anime_path)
+        # Make the thumbnail first so the card can show it straight away
+        thumbnail_service.request(video_path, lambda path, texture: self.sync_episode_items(anime_path), PRIORITY_BACKGROUND)
+
+    def on_episode_removed(self, anime_path, video_path):
+        debug_print(f"on_episode_removed: '{video_path}'")
+        if anime_path in self.anime_items or anime_path == self.current_anime:
+            self.reread_series(anime_path)
+        series_prefetcher.forget(anime_path)
+
+    def sync_episode_items(self, anime_path, episodes=None):  # Only adds, removes and updates the episodes that changed
+        if anime_path is None or anime_path != self.current_anime:  # The index picks it up when that anime is opened
+            return GLib.SOURCE_REMOVE
+        if episodes is None:
+            episodes = fetch_indexed_episodes(anime_path)
+        episodes = sorted(episodes or [], key=natural_sort_key)
+        video_paths = [os.path.join(anime_path, episode) for episode in episodes]
+        for video_path in set(self.episode_items) - set(video_paths):
+            found, position = self.episode_store.find(self.episode_items.pop(video_path))
+            if found:
+                self.episode_store.remove(position)
+        last_episode = progress_store.get(anime_path)[0]
+        self.current_anime_total_episodes = len(video_paths)
+        self.episode_selection_label.set_text("Movie" if len(video_paths) == 1 else "Episodes")
+        # Everything before episode_n is already in the right order, so new episodes go in at episode_n - 1
+        for episode_n, video_path in enumerate(video_paths, start=1):
+            item = self.episode_items.get(video_path)
+            if item is None:
+                item = EpisodeItem(video_path, episode_n, anime_path)
+                item.update(episode_n, last_episode, len(video_paths))
+                self.episode_items[video_path] = item
+                self.episode_store.insert(episode_n - 1, item)
+            elif item.update(episode_n, last_episode, len(video_paths)):
+                self.episode_store.splice(episode_n - 1, 1, [item])  # Rebinds the card if it's on screen
+        return GLib.SOURCE_REMOVE
+
     def choose_anime_folder(self, a=None, b=None):
         debug_print("choose_anime_folder: Folder selection initiated.")
 
@@ -189,154 +571,194 @@ class Application(Gtk.Application):
             settings["first-time"] = False
             print("Selected folder", selected_folder)  # Original print
             print("Settings anime folder", settings["anime_folder"])  # Original print
-            with open(settings_path, "w") as F:
-                json.dump(settings, F, indent=4)
-                debug_print("choose_anime_folder.handle_selected_folder: Settings saved.")
+            save_settings()
+            debug_print("choose_anime_folder.handle_selected_folder: Settings saved.")
 
             update_anime_dir()
-            self.refresh_grid()
+            self.refresh_grid()  # Also restarts the watchers
             debug_print("choose_anime_folder.handle_selected_folder: Anime directory updated and grid refreshed.")
 
         select_folder(self.win, handle_selected_folder)
 
     def go_to_library(self, filler_lol=None):
         debug_print("go_to_library: Transitioning to 'Library' stack page.")
+        if self.current_anime is not None:
+            thumbnail_service.cancel_group(self.current_anime)
         self.stack.set_visible_child_name("Library")
 
     def go_to_episodes(self, filler_lol_2=None):
         debug_print("go_to_episodes: Transitioning to 'Episodes' stack page.")
+        self.ensure_episode_page()
         self.stack.set_visible_child_name("Episodes")
 
+    def ensure_episode_page(self):  # Makes the Episodes page the first time it's opened
+        if not self.episode_page_loaded:
+            self.episode_page_loaded = True
+            self.load_episode_selection()
+
+    def ensure_video_page(self):
+        if not self.video_page_loaded:
+            self.video_page_loaded = True
+            self.load_video_player()
+
     def go_to_episodes_from_vid(self, filler_lol_2=None):
         debug_print("go_to_episodes_from_vid: Pausing media and transitioning to 'Episodes' stack page.")
+        self.save_video_data()  # Before we stop counting as watching, or the last position gets lost
         self.is_currently_watching = False
         self.media.pause()
-        self.save_video_data()
-        self.refresh_episodes_grid()
+        self.playback.fire("close")
+        self.drop_next_episode()
+        self.sync_episode_items(self.current_anime)  # Only the watched episodes change
         self.win.unfullscreen()
         self.stack.set_visible_child_name("Episodes")
 
-    def on_anime_flowbox_child_activate(self, flowbox_u_wont_need_cuz_global, child):
-        debug_print(f"on_anime_flowbox_child_activate: Activated child '{child.get_child().title}'.")
-        print("Going to Anime:", child.get_child().title)  # Original print
-        self.update_episodes(child.get_child().info, child.get_child().image_path)
-        self.current_anime = child.get_child().anime_path
+    def on_anime_activate(self, grid_view, position):
+        item = self.library_sort_model.get_item(position)
+        debug_print(f"on_anime_activate: Activated item '{item.title}'.")
+        print("Going to Anime:", item.title)  # Original print
+        if item.offline or is_offline(item.anime_path):  # Opening it would hang on the unreachable folder
+            dialog = Gtk.MessageDialog(transient_for=self.win, message_type=Gtk.MessageType.WARNING,
+                                       text=f"{item.title} is offline",
+                                       secondary_text=f"{root_of(item.anime_path)} didn't answer when the library was "
+                                                      f"scanned. Reconnect it and choose the folder again, or restart PTBAnime.",
+                                       buttons=Gtk.ButtonsType.OK)
+            dialog.connect("response", lambda d, r: d.destroy())
+            dialog.show()
+            return
+        self.ensure_episode_page()
+        # metadata has the newest description, only reads the file again if it changed
+        self.update_episodes(metadata.load(item.anime_path), item.image_path, item.anime_path)
+        self.current_anime = item.anime_path
         self.refresh_episodes_grid()
         self.go_to_episodes()
-        debug_print(f"on_anime_flowbox_child_activate: Updated episodes, refreshed grid, and navigated to episodes page.")
+        debug_print(f"on_anime_activate: Updated episodes, refreshed grid, and navigated to episodes page.")
 
     def generate_all_cache(self, p1=None, p2=None):
         debug_print("generate_all_cache: Starting cache generation in a new thread.")
+        if self.cache_builder is not None:  # Already running, the dialog is still open
+            return
+        print("Generating all cache...")  # Original print
+        dialog = Gtk.MessageDialog(transient_for=self.win, message_type=Gtk.MessageType.INFO,
+                                   text="Generating Cache... This might take a while",
+                                   secondary_text="Looking for things to cache...", buttons=Gtk.ButtonsType.CANCEL)
+        progress_bar = Gtk.ProgressBar()
+        progress_bar.set_show_text(True)
+        dialog.get_message_area().append(progress_bar)
+
+        def on_progress(done, total, item, eta):  # From the builder thread
+            GLib.idle_add(show_progress, done, total, item, eta)
+
+        def show_progress(done, total, item, eta):
+            progress_bar.set_fraction(done / total if total else 1)
+            progress_bar.set_text(f"{done} / {total}")
+            eta_text = f", about {format_duration(eta)} left" if eta is not None else ""
+            dialog.set_property("secondary-text", f"{os.path.basename(item['anime_path'])}{eta_text}")
+            return GLib.SOURCE_REMOVE
+
+        def on_done(done, total, failed, cancelled, total_time):
+            GLib.idle_add(finish, done, total, failed, cancelled, total_time)
+
+        def finish(done, total, failed, cancelled, total_time):
+            self.cache_builder = None
+            dialog.destroy()
+            print("Cancelled generating cache" if cancelled else "Generated all cache!")  # Original print
+            debug_print(f"generate_all_cache.finish: {done}/{total} files in {total_time:.2f} seconds.")
+            result_dialog = Gtk.MessageDialog(transient_for=self.win, message_type=Gtk.MessageType.INFO,
+                                              text="Stopped generating cache" if cancelled else "Finished generating cache!",
+                                              secondary_text=f"Cached {done} of {total} files in {total_time:.2f} seconds"
+                                                             + (f", {failed} failed" if failed else "")
+                                                             + (", the rest is done next time" if cancelled else ""),
+                                              buttons=Gtk.ButtonsType.OK)
+            result_dialog.connect("response", lambda d, r: d.destroy())
+            result_dialog.show()
+            return GLib.SOURCE_REMOVE
+
+        self.cache_builder = create_cache_builder(on_progress, on_done)
+        dialog.connect("response", lambda d, r: self.cache_builder.cancel() if self.cache_builder is not None else None)
+        dialog.show()
+        builder = self.cache_builder
 
         def do():
-            time_start = time.time()
-            print("Generating all cache...")  # Original print
-            dialog = Gtk.MessageDialog(transient_for=self.win, message_type=Gtk.MessageType.INFO,
-                                       text="Generating Cache... This might take a while",
-                                       secondary_text="Do something else and come back")
-            dialog.show()
-            fetched_anime_folders = fetch_anime_folder()
-            if len(fetched_anime_folders) > 0:
-                debug_print(f"generate_all_cache.do: Found {len(fetched_anime_folders)} anime folders for caching.")
-                with ThreadPoolExecutor(max_workers=4) as pool:
-                    for anime in fetched_anime_folders:
-                        for episode in fetch_episodes(os.path.join(anime_dir, anime)):
-                            pool.submit(extract_video_thumbnail,
-                                        os.path.join(anime_dir, anime, episode))  # Extracting the thumbnail
-                            debug_print(
-                                f"generate_all_cache.do: Submitted thumbnail extraction for '{episode}' in '{anime}'.")
-            print("Generated all cache!")  # Original print
-            dialog.destroy()
-            time_end = time.time()
-            total_time = time_end - time_start
-            debug_print(f"generate_all_cache.do: Cache generation finished in {total_time:.2f} seconds.")
-            dialog = Gtk.MessageDialog(transient_for=self.win, message_type=Gtk.MessageType.INFO,
-                                       text="Finished generating cache!",
-                                       secondary_text=f"Took {total_time:.2f} seconds", buttons=Gtk.ButtonsType.OK)
-            dialog.connect("response", lambda d, r: d.destroy())
-            dialog.show()
+            items = builder.load_journal(library_key())
+            if items is not None:
+                debug_print(f"generate_all_cache.do: Resuming unfinished build with {len(items)} items left.")
+            else:
+                items = plan_cache_items()
+                debug_print(f"generate_all_cache.do: Planned {len(items)} cache items.")
+            builder.run(library_key(), items)
 
         threading.Thread(target=do, daemon=True).start()
 
-    def clear_all_cache(self, p1=None, p2=None):
-        debug_print("clear_all_cache: Starting cache clear in a new thread.")
+    def clear_all_cache(self, p1=None, p2=None):  # Trims the cache down to the budget, least recently used goes first
+        debug_print("clear_all_cache: Starting cache trim in a new thread.")
+        print("Trimming cache...")
+        dialog = Gtk.MessageDialog(transient_for=self.win, message_type=Gtk.MessageType.INFO,
+                                   text="Trimming Cache... This might take a while")
+        dialog.show()
 
-        def do():
-            print("Clearing all cache...")  # Original print
-            dialog = Gtk.MessageDialog(transient_for=self.win, message_type=Gtk.MessageType.INFO,
-                                       text="Clearing Cache... This might take a while")
-            dialog.show()
-            for anime in fetch_anime_folder():
-                cache_folder = os.path.join(anime_dir, anime, ".cache")
-                if os.path.exists(cache_folder) and os.path.isdir(cache_folder):  # Check if the .cache folder exists
-                    shutil.rmtree(cache_folder)  # Then remove all cache
-                    debug_print(f"clear_all_cache.do: Removed cache for '{anime}'.")
-            print("Removed all cache!")  # Original print
+        def finish(removed, freed):
             dialog.destroy()
-            debug_print("clear_all_cache.do: Cache clearing complete.")
+            stats = cache_manifest.stats()
+            result_dialog = Gtk.MessageDialog(transient_for=self.win, message_type=Gtk.MessageType.INFO,
+                                              text="Finished trimming cache!",
+                                              secondary_text=f"Removed {removed} files ({freed / 1024 / 1024:.1f} MB). "
+                                                             f"Cache is now {stats['bytes'] / 1024 / 1024:.1f} MB of "
+                                                             f"{settings['cache-budget-mb']} MB",
+                                              buttons=Gtk.ButtonsType.OK)
+            result_dialog.connect("response", lambda d, r: d.destroy())
+            result_dialog.show()
+            debug_print("clear_all_cache.finish: Cache trim complete.")
+            return GLib.SOURCE_REMOVE
+
+        def do():
+            removed, freed = cache_manifest.trim(drop_orphans=True)  # Also drops cache for videos that are gone
+            GLib.idle_add(finish, removed, freed)
 
         threading.Thread(target=do, daemon=True).start()
 
-    def update_episodes(self, anime_data=ptbanime_data_file, cover_path=None):
+    def update_episodes(self, anime_data=ptbanime_data_file, cover_path=None, anime_path=None):
         debug_print(
             f"update_episodes: Updating episode details for '{anime_data.get('title-en', 'N/A')}' (cover_path: {cover_path})")
         # Update HeaderBar
         header_title = anime_data["title"] if settings["title-language"] == "jp" else anime_data["title-en"]
         self.headerbar_episodes.set_title_widget(Gtk.Label.new("PTBAnime - " + header_title))
         debug_print(f"update_episodes: Header bar title set to 'PTBAnime - {header_title}'.")
-        # Update Cover
-        if cover_path is None:
-            debug_print("update_episodes: No cover path provided, using default thumbnail.")
-            bad_cover_picture_episodes = GdkPixbuf.Pixbuf.new_from_file(
-                os.path.join(base_dir, "assets", "anime_card_thumbnail.png"))
-            cover_picture_episodes_texture = Gdk.Texture.new_for_pixbuf(
-                bad_cover_picture_episodes.scale_simple(280, 400, GdkPixbuf.InterpType.BILINEAR))
-        else:
-            cover_cache_path = str(os.path.join(os.path.dirname(cover_path), ".cache", os.path.basename(cover_path)))
-            if os.path.exists(cover_cache_path):
-                debug_print(f"update_episodes: Using cached cover image from '{cover_cache_path}'.")
-                cover_picture_episodes_texture = Gdk.Texture.new_from_filename(cover_cache_path)
-            else:
-                debug_print(
-                    f"update_episodes: Cached cover not found for '{cover_path}', loading original and scaling.")
-                bad_cover_picture_episodes = GdkPixbuf.Pixbuf.new_from_file(cover_path)
-                cover_picture_episodes_texture = Gdk.Texture.new_for_pixbuf(
-                    bad_cover_picture_episodes.scale_simple(280, 400, GdkPixbuf.InterpType.BILINEAR))
+        # Update Cover, usually already decoded for the library card
+        cover_picture_episodes_texture = load_anime_cover(cover_path, anime_path or os.path.dirname(cover_path or ""))
         self.cover_picture_episodes.set_paintable(cover_picture_episodes_texture)
         self.title_episodes.set_label(
             anime_data["title"] if settings["title-language"] == "jp" else anime_data["title-en"])
         self.description_episodes.set_label(anime_data["description"])
         self.episode_selection_label.set_text("Episodes")
         debug_print("update_episodes: Cover, title, and description updated.")
-        # Grid is updated in on_anime_flowbox_child_activate
+        # Grid is updated in on_anime_activate
 
     def update_video(self):
         debug_print(f"update_video: Setting video filename to '{self.current_watching}'.")
-        if self.current_watching != self.media.get_file():  # If it's the same video, it doesn't have to reload
+        current_file = self.media.get_file()
+        if current_file is None or current_file.get_path() != self.current_watching:  # If it's the same video, it doesn't have to reload
             self.media.set_filename(self.current_watching)
         print("Current media file: ", self.media.get_file())
 
-    def on_episode_selected(self, e1=None, child=None):
-        video_path = os.path.basename(child.get_child().video_path)  # Not full path
+    def on_episode_selected(self, grid_view=None, position=0):
+        item = self.episode_store.get_item(position)
+        video_path = os.path.basename(item.video_path)  # Not full path
         debug_print(f"on_episode_selected: Episode '{video_path}' selected for watching.")
         print("Watching", self.current_anime, video_path)  # Original print
+        self.ensure_video_page()
         self.is_currently_watching = True
-        self.currently_watching_episode_n = child.get_child().episode_num
+        self.currently_watching_episode_n = item.episode_num
 
-        anime_data_path = os.path.join(self.current_anime, "PTBAnime-info.json")
-        with open(anime_data_path, "r") as F:
-            anime_data = json.load(F)
-        if anime_data["last-episode"] != self.currently_watching_episode_n:  # New episode, set timestamp to 0
-            anime_data["last-episode-timestamp"] = 0
-        anime_data["last-episode"] = self.currently_watching_episode_n
-        with open(anime_data_path, "w") as F:
-            json.dump(anime_data, F, indent=4)
+        last_episode, last_episode_timestamp = progress_store.get(self.current_anime)
+        if last_episode != self.currently_watching_episode_n:  # New episode, set timestamp to 0
+            last_episode_timestamp = 0
+        progress_store.update(self.current_anime, self.currently_watching_episode_n, last_episode_timestamp)
+        progress_store.flush(force=True)
 
         self.stack.set_visible_child_name("Video")
-        self.current_watching = os.path.join(anime_dir, self.current_anime, video_path)
-        self.update_video()
+        self.current_watching = item.video_path  # Full path, the episode can be in a season folder
+        self.open_media(last_episode_timestamp)  # Seeks there once the stream is prepared
         self.media.play()
-        GLib.timeout_add(100, self.load_video_data)
 
         # Show controls initially (they will stay for a second, or longer if mouse moves)
         debug_print("on_episode_selected: Video playing.")
@@ -346,7 +768,7 @@ class Application(Gtk.Application):
         self.win.fullscreen()
 
     def show_controls_and_header(self):
-        debug_print(f"show_controls_and_header: Current controls_are_visible state: {self.controls_are_visible}")
+        debug_print("show_controls_and_header: Current controls_are_visible state:", self.controls_are_visible)
         # Always attempt to reveal if called, even if controls_are_visible is True.
         # This ensures they reappear if they were transitioning out, or just refresh the state.
         debug_print("show_controls_and_header: Setting reveal_child(True) for header and controls.")
@@ -355,7 +777,7 @@ class Application(Gtk.Application):
         # controls_are_visible will be set to True in on_revealer_reveal_child_notify
 
     def hide_controls_and_header(self):
-        debug_print(f"hide_controls_and_header: Current controls_are_visible state: {self.controls_are_visible}")
+        debug_print("hide_controls_and_header: Current controls_are_visible state:", self.controls_are_visible)
         if self.controls_are_visible:  # Only initiate hide if they are currently considered visible
             debug_print("hide_controls_and_header: Setting reveal_child(False) for header and controls.")
             self.headerbar_revealer.set_reveal_child(False)
@@ -393,47 +815,96 @@ class Application(Gtk.Application):
         # We need to check if the revealer is now hidden (reveal-child is False)
         # AND if the transition is complete (i.e., we are fully hidden, not just starting to hide).
         # GtkRevealer transitions are generally fast, so checking reveal_child is often enough.
-        debug_print(
-            f"on_revealer_reveal_child_notify: Revealer '{revealer.get_name()}' reveal_child changed to {revealer.get_reveal_child()}")
+        if DEBUG_MODE:
+            debug_print(f"on_revealer_reveal_child_notify: Revealer '{revealer.get_name()}' reveal_child changed to {revealer.get_reveal_child()}")
 
         # Update controls_are_visible based on the state of BOTH revealers.
         # It's True if EITHER is showing, False only if BOTH are hidden.
         self.controls_are_visible = self.headerbar_revealer.get_reveal_child() or \
                                     self.media_controls_revealer.get_reveal_child()
-        debug_print(f"on_revealer_reveal_child_notify: controls_are_visible updated to: {self.controls_are_visible}")
-
-    def skip_left(self):
-        curr_pos = self.media.get_timestamp()  # Microseconds for whatever reason. 5 seconds == 5000000 microseconds
-        new_pos = curr_pos - 5000000
-        if new_pos < 0: new_pos = 0
-        self.media.seek(new_pos)
-        print("New time:", new_pos)
-
-    def skip_right(self):
-        curr_pos = self.media.get_timestamp()  # 5 seconds == 5000000 microseconds
-        new_pos = curr_pos + 5000000
-        if new_pos > self.media.get_duration(): new_pos = self.media.get_duration()
-        self.media.seek(new_pos)
-        print("New time:", new_pos)
-
-    def skip_left_big(self):
-        curr_pos = self.media.get_timestamp()
-        new_pos = curr_pos - 10000000
-        if new_pos < 0: new_pos = 0
-        self.media.seek(new_pos)
-        print("New time:", new_pos)
-
-    def skip_right_big(self):
-        curr_pos = self.media.get_timestamp()
-        new_pos = curr_pos + 10000000
-        if new_pos > self.media.get_duration(): new_pos = self.media.get_duration()
-        self.media.seek(new_pos)
-        print("New time:", new_pos)
+        debug_print("on_revealer_reveal_child_notify: controls_are_visible updated to:", self.controls_are_visible)
+
+    def media_seek(self, position):  # For seek_controller
+        if not self.media.is_seekable():
+            return False
+        self.media.seek(position)
+        return True
+
+    def load_keyframes(self, video_path):  # Runs in a thread, scrubbing snaps to these
+        keyframes = mp4_keyframes(video_path)
+
+        def apply():
+            if self.current_watching == video_path:  # Still the same video
+                self.seek_controller.keyframes = keyframes
+            return GLib.SOURCE_REMOVE
+
+        GLib.idle_add(apply)
+
+    def load_storyboard(self, video_path):  # Runs in storyboard_pool, makes it if "Generate All Cache" didn't yet
+        if self.current_watching != video_path:  # Skipped past this episode already
+            return
+        storyboard = extract_video_storyboard(video_path)
+        if storyboard is None:
+            return
+        try:
+            sheet = GdkPixbuf.Pixbuf.new_from_file(storyboard[0])  # The only decode, the tiles are cut out of this
+        except GLib.Error as e:
+            print("Couldn't load storyboard", storyboard[0], e)
+            return
+
+        def apply():
+            if self.current_watching == video_path and self.storyboard_preview is not None:
+                self.storyboard_preview.set_storyboard(sheet, storyboard[1])
+            return GLib.SOURCE_REMOVE
+
+        GLib.idle_add(apply)
+
+    def find_seek_bar(self):  # Gtk.MediaControls doesn't give out its seek bar, it's the widest Gtk.Scale inside
+        scales = []
+        widgets = [self.media_controls]
+        while widgets:
+            widget = widgets.pop()
+            if isinstance(widget, Gtk.Scale):
+                scales.append(widget)
+            child = widget.get_first_child()
+            while child is not None:
+                widgets.append(child)
+                child = child.get_next_sibling()
+        return max(scales, key=lambda scale: scale.get_width(), default=None)
+
+    def on_seek_bar_hover(self, controller, x, y):  # Mouse moved over the media controls
+        if self.seek_bar is None or not self.seek_bar.get_mapped():
+            self.seek_bar = self.find_seek_bar()
+        duration = self.media.get_duration()
+        if self.seek_bar is None or duration <= 0:
+            return
+        found, bounds = self.seek_bar.compute_bounds(self.media_controls)
+        if not found or not (bounds.get_x() <= x <= bounds.get_x() + bounds.get_width()
+                             and bounds.get_y() - 8 <= y <= bounds.get_y() + bounds.get_height() + 8):
+            self.storyboard_preview.popdown()
+            return
+        fraction = (x - bounds.get_x()) / bounds.get_width() if bounds.get_width() else 0
+        self.storyboard_preview.show_at(x, bounds.get_y(), fraction * duration / 1000000)
+
+    def skip(self, offset, scrubbing=False):  # Microseconds for whatever reason. 5 seconds == 5000000 microseconds
+        print("New time:", self.seek_controller.nudge(offset, scrubbing))
+
+    def skip_left(self, scrubbing=False):
+        self.skip(-5000000, scrubbing)
+
+    def skip_right(self, scrubbing=False):
+        self.skip(5000000, scrubbing)
+
+    def skip_left_big(self, scrubbing=False):
+        self.skip(-10000000, scrubbing)
+
+    def skip_right_big(self, scrubbing=False):
+        self.skip(10000000, scrubbing)
 
     # --- New Key Press Handler ---
     def on_key_pressed(self, event_controller, keyval, keycode, state):  # I love youtube keybinds
         keyname = Gdk.keyval_name(keyval)  # Corrected function name
-        debug_print(f"on_key_pressed: Key pressed: {keyname} (keyval: {keyval})")
+        debug_print("on_key_pressed: Key pressed:", keyname, "keyval:", keyval)
 
         if self.stack.get_visible_child_name() == "Video":  # Controls that are only available in while watching a video
             if keyname and keyname.lower() == 's':
@@ -451,27 +922,16 @@ class Application(Gtk.Application):
             if keyval == Gdk.KEY_Escape:
                 self.go_to_episodes_from_vid()
                 return Gdk.EVENT_STOP
-            if keyval == Gdk.KEY_Left and self.key_repeat_id is None:
-                self.skip_left()
-                self.key_repeat_id = GLib.timeout_add(300, lambda: (self.skip_left(), True)[1])
-                self.show_controls_and_header()
-                self.reset_hide_timer()
-                return Gdk.EVENT_STOP
-            if keyval == Gdk.KEY_Right and self.key_repeat_id is None:
-                self.skip_right()
-                self.key_repeat_id = GLib.timeout_add(300, lambda: (self.skip_right(), True)[1])
-                self.show_controls_and_header()
-                self.reset_hide_timer()
-                return Gdk.EVENT_STOP
-            if keyval == Gdk.KEY_j and self.key_repeat_id is None:
-                self.skip_left_big()
-                self.key_repeat_id = GLib.timeout_add(300, lambda: (self.skip_left_big(), True)[1])
-                self.show_controls_and_header()
-                self.reset_hide_timer()
-                return Gdk.EVENT_STOP
-            if keyval == Gdk.KEY_l and self.key_repeat_id is None:
-                self.skip_right_big()
-                self.key_repeat_id = GLib.timeout_add(300, lambda: (self.skip_right_big(), True)[1])
+            skips = {Gdk.KEY_Left: self.skip_left, Gdk.KEY_Right: self.skip_right,
+                     Gdk.KEY_j: self.skip_left_big, Gdk.KEY_l: self.skip_right_big}
+            if keyval in skips:
+                # Holding the key sends repeated presses, those add a skip every skip_repeat_interval.
+                # The seek controller turns them into keyframe seeks, and an exact one when the key is let go
+                now = time.monotonic()
+                held = self.last_skip[0] == keyval
+                if not held or now - self.last_skip[1] >= self.skip_repeat_interval:
+                    self.last_skip = (keyval, now)
+                    skips[keyval](scrubbing=held)
                 self.show_controls_and_header()
                 self.reset_hide_timer()
                 return Gdk.EVENT_STOP
@@ -479,10 +939,9 @@ class Application(Gtk.Application):
         return Gdk.EVENT_PROPAGATE  # Allow other handlers to process the key
 
     def on_key_released(self, event_controller, keyval, keycode, state):
-        if self.stack.get_visible_child_name() == "Video":  # Controls that are only available in while watching a video
-            if keyval in (Gdk.KEY_Left, Gdk.KEY_Right, Gdk.KEY_j, Gdk.KEY_l):
-                GLib.source_remove(self.key_repeat_id)
-                self.key_repeat_id = None
+        if keyval == self.last_skip[0]:  # Let go, the next press seeks straight away
+            self.last_skip = (None, 0)
+            self.seek_controller.release()
         return Gdk.EVENT_PROPAGATE  # Allow other handlers to process the key
 
     def do_activate(self):
@@ -513,6 +972,7 @@ class Application(Gtk.Application):
         key_controller.connect("key-pressed", self.on_key_pressed)
         key_controller.connect("key-released", self.on_key_released)
         self.win.add_controller(key_controller)
+        self.win.connect("notify::focus-widget", self.on_focus_changed)
         debug_print("do_activate: Key event controller added to main window.")
         # --- End Important ---
 
@@ -521,12 +981,11 @@ class Application(Gtk.Application):
         self.stack.set_transition_duration(300)
         debug_print("do_activate: Stack transition type and duration set.")
 
-        # Load pages
+        # Load pages, Episodes and Video are made when they're first opened
         debug_print("do_activate: Loading UI pages...")
         self.load_library()
-        self.load_episode_selection()
         self.load_info_editor()
-        self.load_video_player()
+        startup_profile.mark("library page")
         debug_print("do_activate: UI pages loaded.")
 
         # Set the Library to visible on launch
@@ -537,7 +996,10 @@ class Application(Gtk.Application):
         self.win.set_child(self.stack)
 
         load_css()
+        startup_profile.mark("css")
         self.win.present()
+        startup_profile.mark("window presented")
+        self.watch_first_frame()
         debug_print("do_activate: Window presented.")
 
         # Check first time
@@ -547,6 +1009,25 @@ class Application(Gtk.Application):
             self.choose_anime_folder()
             debug_print("do_activate: Anime folder selection initiated for first time run.")
 
+    def watch_first_frame(self):  # Marks when the first frame was painted, then prints the startup profile
+        # Work that can wait until the window is up starts here too
+        frame_clock = self.win.get_frame_clock()
+        if frame_clock is None:
+            self.start_deferred_work()
+            return
+
+        def after_paint(clock):
+            clock.disconnect(handler_id)
+            startup_profile.mark("first frame")
+            startup_profile.report()
+            self.start_deferred_work()
+
+        handler_id = frame_clock.connect("after-paint", after_paint)
+
+    def start_deferred_work(self):
+        # Watch progress a crashed run left in the journal goes into the info files, off the main thread
+        threading.Thread(target=progress_store.recover, name="progress-recover", daemon=True).start()
+
     def load_library(self):
         debug_print("load_library: Loading Library UI.")
         # Header Bar
@@ -569,17 +1050,17 @@ class Application(Gtk.Application):
         self.add_action(change_anime_folder_action)
         debug_print("load_library: Added 'Change Anime Folder' action.")
 
-        menu.append("Generate All Cache", "app.refresh_anime_grid")
-        generate_all_cache_menu_button = Gio.SimpleAction.new("refresh_anime_grid", None)
+        menu.append("Generate All Cache", "app.generate-all-cache")
+        generate_all_cache_menu_button = Gio.SimpleAction.new("generate-all-cache", None)
         generate_all_cache_menu_button.connect("activate", self.generate_all_cache)
         self.add_action(generate_all_cache_menu_button)
         debug_print("load_library: Added 'Generate All Cache' action.")
 
-        menu.append("Clear All Cache", "app.clear-all-cache")
+        menu.append("Trim Cache", "app.clear-all-cache")
         clear_all_cache_menu_button = Gio.SimpleAction.new("clear-all-cache", None)
         clear_all_cache_menu_button.connect("activate", self.clear_all_cache)
         self.add_action(clear_all_cache_menu_button)
-        debug_print("load_library: Added 'Clear All Cache' action.")
+        debug_print("load_library: Added 'Trim Cache' action.")
 
         menu_button = Gtk.MenuButton(icon_name="open-menu-symbolic")
         menu_button.set_menu_model(menu)
@@ -589,7 +1070,7 @@ class Application(Gtk.Application):
         # Search Bar
         search_entry = Gtk.SearchEntry()
         search_entry.set_placeholder_text("Search Anime...")
-        search_entry.connect("search-changed", self.on_search_changed)
+        search_entry.connect("changed", self.on_search_changed)  # Not search-changed, we debounce it ourselves
         search_entry.set_margin_start(100)
         search_entry.set_margin_end(100)
         search_entry.set_margin_top(10)
@@ -602,9 +1083,10 @@ class Application(Gtk.Application):
         main_home_box.set_margin_bottom(20)
         main_home_box.set_margin_start(0)
         main_home_box.set_margin_end(0)
-        main_home_box_scroll = Gtk.ScrolledWindow()
+        main_home_box_scroll = Gtk.ScrolledWindow()  # Only the grid scrolls, so the grid view knows what's on screen
         main_home_box_scroll.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.ALWAYS)
-        main_home_box_scroll.set_child(main_home_box)
+        main_home_box_scroll.set_vexpand(True)
+        main_home_box_scroll.set_child(self.content_grid)
         debug_print("load_library: Main home boxes and scroll window created.")
 
         # Description
@@ -617,22 +1099,19 @@ class Application(Gtk.Application):
         debug_print("load_library: Welcome label created.")
 
         # Main Content Grid
-        self.content_grid.set_max_children_per_line(8)
-        self.content_grid.set_activate_on_single_click(True)
-        self.content_grid.set_valign(Gtk.Align.START)
-        self.content_grid.set_halign(Gtk.Align.CENTER)
-        self.content_grid.set_hexpand(False)
+        self.content_grid.set_max_columns(8)
+        self.content_grid.set_single_click_activate(True)
+        self.content_grid.set_hexpand(True)
         self.content_grid.set_vexpand(True)
-        self.content_grid.set_filter_func(self.filter_func)
-        self.content_grid.connect("child-activated", self.on_anime_flowbox_child_activate)
+        self.content_grid.connect("activate", self.on_anime_activate)
         self.refresh_grid()
         debug_print("load_library: Content grid configured and refreshed.")
 
         main_home_box_outer.append(headerbar)
+        main_home_box_outer.append(main_home_box)
         main_home_box_outer.append(main_home_box_scroll)
         main_home_box.append(search_entry)
         main_home_box.append(label)
-        main_home_box.append(self.content_grid)
         self.stack.add_named(main_home_box_outer, "Library")
         debug_print("load_library: Library page assembled and added to stack.")
 
@@ -641,9 +1120,9 @@ class Application(Gtk.Application):
         # Main Episodes box
         self.main_episodes_box_outer = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=0)
         self.main_episodes_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=40)
-        self.main_episodes_box_scroll = Gtk.ScrolledWindow()
+        self.main_episodes_box.set_vexpand(True)
+        self.main_episodes_box_scroll = Gtk.ScrolledWindow()  # Only the episode grid scrolls, so the grid view knows what's on screen
         self.main_episodes_box_scroll.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.ALWAYS)
-        self.main_episodes_box_scroll.set_child(self.main_episodes_box)
         self.main_episodes_box_scroll.set_vexpand(True)
         debug_print("load_episode_selection: Main episode boxes and scroll window created.")
 
@@ -684,13 +1163,9 @@ class Application(Gtk.Application):
         self.cover_plus_info_box.append(self.info_box_episodes)
 
         # Make and add more stuff to the stuff's stuff
-        bad_cover_picture_episodes = GdkPixbuf.Pixbuf.new_from_file(
-            os.path.join(base_dir, "assets", "anime_card_thumbnail.png"))
-        cover_picture_episodes_texture = Gdk.Texture.new_for_pixbuf(
-            bad_cover_picture_episodes.scale_simple(280, 400, GdkPixbuf.InterpType.BILINEAR))
-        self.cover_picture_episodes = Gtk.Picture.new_for_paintable(cover_picture_episodes_texture)
+        self.cover_picture_episodes = Gtk.Picture.new()  # Gets the cover in update_episodes
         self.cover_picture_episodes.set_name("episodes_cover")
-        debug_print("load_episode_selection: Default cover picture set.")
+        debug_print("load_episode_selection: Cover picture created.")
 
         self.title_episodes = Gtk.Label.new(
             ptbanime_data_file["title"] if settings["title-language"] == "jp" else ptbanime_data_file["title-en"])
@@ -724,36 +1199,34 @@ class Application(Gtk.Application):
         self.episodes_episodes_box.set_margin_start(40)
         self.episodes_episodes_box.set_margin_end(40)
         self.episodes_episodes_box.set_margin_top(0)
-        self.episodes_episodes_box.set_margin_bottom(100)
+        self.episodes_episodes_box.set_margin_bottom(20)
+        self.episodes_episodes_box.set_vexpand(True)
         self.episode_selection_label = Gtk.Label.new("Episodes")
         self.episode_selection_label.set_name("episode_selection_label")
         self.episode_selection_label.set_xalign(0)
         debug_print("load_episode_selection: Episodes section box and label created.")
 
         # Episode Selection Grid
-        self.episode_selection_grid = Gtk.FlowBox.new()
-        self.episode_selection_grid.set_max_children_per_line(12)
-        self.episode_selection_grid.set_activate_on_single_click(False)
-        self.episode_selection_grid.set_valign(Gtk.Align.START)
-        self.episode_selection_grid.set_halign(Gtk.Align.START)
-        self.episode_selection_grid.set_hexpand(False)
+        self.episode_selection_grid = Gtk.GridView.new(Gtk.NoSelection.new(self.episode_store), create_episode_grid_factory())
+        self.episode_selection_grid.set_max_columns(12)
+        self.episode_selection_grid.set_single_click_activate(False)
+        self.episode_selection_grid.set_hexpand(True)
         self.episode_selection_grid.set_vexpand(True)
-        self.episode_selection_grid.connect("child-activated", self.on_episode_selected)
-        self.refresh_episodes_grid()
-        debug_print("load_episode_selection: Episode selection grid configured and refreshed.")
+        self.episode_selection_grid.connect("activate", self.on_episode_selected)
+        self.main_episodes_box_scroll.set_child(self.episode_selection_grid)
+        debug_print("load_episode_selection: Episode selection grid configured.")
 
         self.episodes_episodes_box.append(self.episode_selection_label)
-        self.episodes_episodes_box.append(self.episode_selection_grid)
+        self.episodes_episodes_box.append(self.main_episodes_box_scroll)
         debug_print("load_episode_selection: Episodes section assembled.")
 
         # Add the things to main box and outer box
         self.main_episodes_box.append(self.cover_plus_info_box)
         self.main_episodes_box.append(self.episodes_episodes_box)
         self.main_episodes_box_outer.append(self.headerbar_episodes)
-        self.main_episodes_box_outer.append(self.main_episodes_box_scroll)
+        self.main_episodes_box_outer.append(self.main_episodes_box)
 
         self.stack.add_named(self.main_episodes_box_outer, "Episodes")
-        self.update_episodes()  # Set everything to default PTBAnime-data
         debug_print("load_episode_selection: Episode page assembled and added to stack.")
 
     def load_info_editor(self):
@@ -791,19 +1264,23 @@ class Application(Gtk.Application):
         debug_print("load_video_player: Video header bar configured.")
 
         # Media and Video Player
-        self.media = Gtk.MediaFile.new()
-        self.media.set_loop(False)
         self.video = Gtk.Video()
         self.video.set_hexpand(True)
         self.video.set_vexpand(True)
-        self.video.set_media_stream(self.media)
         self.video.set_name("main_video_widget")
 
         # Media Controls
-        self.media_controls = Gtk.MediaControls(media_stream=self.media)
+        self.media_controls = Gtk.MediaControls()
+        self.attach_media(Gtk.MediaFile.new())  # Swapped for the next episode's stream when auto-advancing
         self.media_controls.set_halign(Gtk.Align.FILL)
         self.media_controls.set_valign(Gtk.Align.END)
         self.media_controls.set_name("media_controls")
+        # Frame preview while hovering the seek bar, from the episode's storyboard
+        self.storyboard_preview = StoryboardPreview(self.media_controls)
+        seek_bar_hover = Gtk.EventControllerMotion.new()
+        seek_bar_hover.connect("motion", self.on_seek_bar_hover)
+        seek_bar_hover.connect("leave", lambda controller: self.storyboard_preview.popdown())
+        self.media_controls.add_controller(seek_bar_hover)
         debug_print("load_video_player: Media controls created.")
 
         # Revealer for Media Controls
@@ -843,8 +1320,22 @@ if __name__ == "__main__":
     if os.path.exists('./debug_mode'):
         DEBUG_MODE = True
         debug_print("main: Debug mode enabled from 'debug_mode' file.")
+    # Prints how long each part of startup took, up to the first frame
+    if "--profile-startup" in sys.argv:
+        startup_profile.enabled = True
+        sys.argv.remove("--profile-startup")
+    # Times scans, metadata reads, thumbnails, decoding, cards and saves. "--trace" prints a summary on exit,
+    # "--trace trace.json" also writes a trace for chrome://tracing or ui.perfetto.dev
+    trace_path = None
+    if "--trace" in sys.argv:
+        tracing.enabled = True
+        index = sys.argv.index("--trace")
+        sys.argv.pop(index)
+        if index < len(sys.argv) and sys.argv[index].endswith(".json"):
+            trace_path = sys.argv.pop(index)
 
     app = Application()
+    app.trace_path = trace_path
     atexit.register(app.cleanup)
     exit_status = app.run(sys.argv)
     debug_print(f"main: Application exited with status {exit_status}.")
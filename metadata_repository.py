@@ -0,0 +1,100 @@
+import os, json, threading
+import tracing
+from library_index import get_mtime
+
+# Parsed PTBAnime-info.json files, kept in memory.
+# A file is only read again if its mtime changed, missing keys are filled in once when it's read,
+# and writes go through here too, so what's in memory and what's on disk never disagree.
+
+
+@tracing.traced()
+def write_json_atomic(path, data):  # Write to a temp file next to it, then swap, so a crash can't leave half a file
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as F:
+        json.dump(data, F, indent=4)
+        F.flush()
+        os.fsync(F.fileno())
+    os.replace(temp_path, path)
+
+
+def info_file_path(anime_path):
+    return os.path.join(anime_path, "PTBAnime-info.json")
+
+
+class MetadataRepository:
+    def __init__(self, defaults):
+        self.defaults = defaults  # Default value for every key
+        self.lock = threading.Lock()  # Only around entries, never around file I/O (one hung network read would block every root)
+        self.write_lock = threading.Lock()  # update() reads, changes and writes one file at a time
+        self.entries = {}  # Anime path -> (mtime, anime data, broken), broken = the file couldn't be read, that's the defaults
+        self.reads = 0  # How many times a file was actually parsed
+
+    def default_data(self, anime_path):
+        anime_data = self.defaults.copy()
+        anime_data["title"] = os.path.basename(anime_path)
+        anime_data["title-en"] = os.path.basename(anime_path)
+        return anime_data
+
+    def load(self, anime_path):  # The anime data, don't change the dict, use update()
+        data_file_path = info_file_path(anime_path)
+        mtime = get_mtime(data_file_path)
+        with self.lock:
+            entry = self.entries.get(anime_path)
+        if entry is not None and mtime is not None and entry[0] == mtime:
+            return entry[1]
+        if mtime is None:  # Data file doesn't exist. Create data file automatically
+            print("Creating new PTBAnime data file for", anime_path)
+            anime_data = self.default_data(anime_path)
+            missing = list(anime_data)
+            parsed = False
+        else:
+            try:
+                with open(data_file_path, "r") as F:
+                    anime_data = json.load(F)
+                if not isinstance(anime_data, dict):
+                    raise ValueError("not a JSON object")
+                parsed = True
+            except (OSError, ValueError) as e:  # Broken file, use the defaults but leave the file for the user to fix
+                print("Couldn't read", data_file_path, e)
+                anime_data = self.default_data(anime_path)
+                with self.lock:
+                    self.entries[anime_path] = (mtime, anime_data, True)  # Not read again until it changes
+                return anime_data
+            missing = [key for key in self.defaults if key not in anime_data]
+            for key in missing:  # Check for missing keys, and fill them if not present
+                anime_data[key] = self.defaults[key]
+            if missing:
+                print("Filled in missing", ", ".join(missing), "for", anime_path)
+        if missing:
+            try:
+                write_json_atomic(data_file_path, anime_data)
+            except OSError as e:  # Read only library, the defaults still work from memory
+                print("Couldn't write", data_file_path, e)
+        mtime = get_mtime(data_file_path)
+        with self.lock:
+            self.entries[anime_path] = (mtime, anime_data, False)
+            self.reads += parsed
+        return anime_data
+
+    def is_broken(self, anime_path):  # The data file was there but couldn't be read when it was last loaded
+        with self.lock:
+            entry = self.entries.get(anime_path)
+        return entry is not None and entry[2]
+
+    def update(self, anime_path, changes):  # Writes changes (a dict) into the data file
+        # Raises ValueError if the file is broken, writing the defaults over it would lose what the user wrote
+        data_file_path = info_file_path(anime_path)
+        with self.write_lock:  # Two updates at once would lose one's changes
+            anime_data = dict(self.load(anime_path))
+            if self.is_broken(anime_path):
+                raise ValueError(f"{data_file_path} couldn't be read, not writing over it")
+            anime_data.update(changes)
+            write_json_atomic(data_file_path, anime_data)
+            mtime = get_mtime(data_file_path)
+            with self.lock:
+                self.entries[anime_path] = (mtime, anime_data, False)
+            return anime_data
+
+    def forget(self, anime_path):  # Anime was removed
+        with self.lock:
+            self.entries.pop(anime_path, None)
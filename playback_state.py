@@ -0,0 +1,59 @@
+from collections import deque
+
+# What the video player is doing, as a small state machine. The media stream's notify signals
+# (prepared, playing, ended) are turned into events, and the app reacts to the transitions instead of
+# polling the stream with timers, so nothing wakes up while nothing is playing.
+#
+#   idle --open--> loading --prepared--> playing / paused <--play/pause--> ... --ended--> ended
+#   open from playing, paused or ended starts the next video, close from anywhere goes back to idle
+
+IDLE = "idle"
+LOADING = "loading"
+PLAYING = "playing"
+PAUSED = "paused"
+ENDED = "ended"
+
+transitions = {
+    (IDLE, "open"): LOADING,
+    (LOADING, "prepared"): PAUSED,  # Becomes PLAYING if the stream is already playing, see fire()
+    (LOADING, "open"): LOADING,
+    (PLAYING, "pause"): PAUSED,
+    (PLAYING, "ended"): ENDED,
+    (PLAYING, "open"): LOADING,
+    (PAUSED, "play"): PLAYING,
+    (PAUSED, "ended"): ENDED,
+    (PAUSED, "open"): LOADING,
+    (ENDED, "open"): LOADING,
+    (ENDED, "play"): PLAYING,
+}
+
+
+def resume_point(episode, total_episodes, timestamp, ended):  # (episode, timestamp) to continue from next time
+    if ended:  # Finished it completely, continue with the next episode from the start
+        return min(episode + 1, total_episodes), 0
+    return episode, timestamp
+
+
+class PlaybackStateMachine:
+    def __init__(self):
+        self.state = IDLE
+        self.listeners = []  # (old state, event, new state)
+        self.history = deque(maxlen=100)  # Recent (old state, event, new state), for debugging and tests
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def fire(self, event, playing=False):  # Returns the new state, events that don't fit the state are ignored
+        if event == "close":
+            new_state = IDLE
+        else:
+            new_state = transitions.get((self.state, event))
+            if new_state is None:
+                return self.state
+            if new_state == PAUSED and event == "prepared" and playing:
+                new_state = PLAYING
+        old_state, self.state = self.state, new_state
+        self.history.append((old_state, event, new_state))
+        for listener in self.listeners:
+            listener(old_state, event, new_state)
+        return new_state
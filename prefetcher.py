@@ -0,0 +1,83 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Loads things before they're asked for (a series page while its card is hovered or focused).
+# Only the newest target is loaded, starting a new one cancels the last. Finished results are kept
+# for the last few targets, so a card that was hovered a moment ago still opens instantly.
+# invalidate() (library refresh) bumps a generation, loads that started before it are thrown away.
+
+
+class Prefetcher:
+    def __init__(self, load, release=None, workers=2, keep=8):
+        self.load = load  # (key, cancelled event) -> result or None, runs in a worker. Check cancelled now and then
+        self.release = release  # (result), frees what a result holds on to when it's cancelled (queued jobs)
+        self.keep = keep
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.results = OrderedDict()  # Key -> result, newest last
+        self.current = None  # (key, future, cancelled event)
+        self.generation = 0
+
+    def prefetch(self, key):
+        with self.lock:
+            if self.current is not None and self.current[0] == key:
+                return
+        self.cancel()
+        cancelled = threading.Event()
+        with self.lock:
+            self.current = (key, self.pool.submit(self.run, key, cancelled, self.generation), cancelled)
+
+    def run(self, key, cancelled, generation):
+        if cancelled.is_set():
+            return
+        try:
+            result = self.load(key, cancelled)
+        except Exception as e:  # Prefetching is only a guess, opening it will load it properly
+            print("Prefetch failed for", key, e)
+            return
+        if result is None:
+            return
+        with self.lock:
+            if not cancelled.is_set() and generation == self.generation:
+                self.results[key] = result
+                self.results.move_to_end(key)
+                while len(self.results) > self.keep:
+                    self.results.popitem(last=False)
+                return
+        if self.release is not None:  # Cancelled while loading
+            self.release(result)
+
+    def cancel(self):  # Focus moved somewhere else
+        with self.lock:
+            current, self.current = self.current, None
+            result = self.results.get(current[0]) if current is not None else None
+        if current is None:
+            return
+        current[2].set()
+        current[1].cancel()
+        if result is not None and self.release is not None:
+            self.release(result)
+
+    def get(self, key):  # The prefetched result, or None
+        with self.lock:
+            return self.results.get(key)
+
+    def forget(self, key):  # What was prefetched for key is out of date
+        with self.lock:
+            self.results.pop(key, None)
+            current = self.current
+            if current is not None and current[0] == key:  # Still loading the old files, hovering again starts over
+                self.current = None
+        if current is not None and current[0] == key:
+            current[2].set()
+            current[1].cancel()
+
+    def invalidate(self):  # Everything prefetched is out of date, including loads still running
+        with self.lock:
+            self.generation += 1
+            self.results.clear()
+            current, self.current = self.current, None
+        if current is not None:
+            current[2].set()
+            current[1].cancel()
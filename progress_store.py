@@ -0,0 +1,107 @@
+import os, json, time, threading
+import tracing
+
+# Where you are in every anime, kept in memory while watching.
+# - update() only changes memory, and only if something actually changed
+# - flush() appends the changes to a small journal file (cheap, at most every flush_interval seconds unless forced)
+# - save() flushes, then writes the positions into each PTBAnime-info.json (atomically) and empties the journal
+# If the app crashes, the journal is replayed on the next start, so nothing is lost and no info file is ever half written.
+# The replay only reads the journal (on first use), writing what it found into the info files is recover(), which
+# the app runs in the background once the window is up, so startup never waits on rewriting info files.
+
+
+class ProgressStore:
+    def __init__(self, journal_path, metadata, flush_interval=30):
+        self.journal_path = journal_path
+        self.metadata = metadata  # MetadataRepository, for reading and writing PTBAnime-info.json
+        self.flush_interval = flush_interval
+        self.lock = threading.RLock()
+        self.positions = {}  # Anime path -> [last episode, last episode timestamp]
+        self.dirty = set()  # Changed since the last flush
+        self.unsaved = set()  # In the journal, but not in PTBAnime-info.json yet
+        self.last_flush = 0
+        self.replayed = False
+        os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+
+    def replay(self):  # Picks up what a crashed run left in the journal, into memory only. Every method calls this first
+        with self.lock:
+            if self.replayed:
+                return
+            self.replayed = True
+            try:
+                with open(self.journal_path, "r") as F:
+                    lines = F.readlines()
+            except OSError:
+                return
+            for line in lines:
+                try:
+                    entry = json.loads(line)
+                    self.positions[entry["anime"]] = [entry["episode"], entry["timestamp"]]
+                    self.unsaved.add(entry["anime"])
+                except (ValueError, KeyError):  # Last line can be cut off by a crash
+                    continue
+            if self.unsaved:
+                print("Recovered watch progress for", len(self.unsaved), "anime from the journal")
+
+    def recover(self):  # Writes what the journal had into the info files, slow on a network library so run it in a thread
+        self.replay()
+        with self.lock:
+            if self.unsaved:
+                self.save()
+
+    def get(self, anime_path):  # (last episode, last episode timestamp)
+        self.replay()
+        with self.lock:
+            if anime_path in self.positions:
+                return tuple(self.positions[anime_path])
+            anime_data = self.metadata.load(anime_path)
+            return anime_data["last-episode"], anime_data["last-episode-timestamp"]
+
+    def update(self, anime_path, episode, timestamp):  # Returns True if it changed
+        self.replay()
+        with self.lock:
+            if self.positions.get(anime_path) == [episode, timestamp]:
+                return False
+            self.positions[anime_path] = [episode, timestamp]
+            self.dirty.add(anime_path)
+            return True
+
+    @tracing.traced("progress_flush")
+    def flush(self, force=False):  # Appends what changed to the journal
+        self.replay()
+        with self.lock:
+            if not self.dirty or (not force and time.monotonic() - self.last_flush < self.flush_interval):
+                return
+            with open(self.journal_path, "a") as F:
+                for anime_path in self.dirty:
+                    episode, timestamp = self.positions[anime_path]
+                    F.write(json.dumps({"anime": anime_path, "episode": episode, "timestamp": timestamp}) + "\n")
+                F.flush()
+                os.fsync(F.fileno())
+            self.unsaved |= self.dirty
+            self.dirty.clear()
+            self.last_flush = time.monotonic()
+
+    @tracing.traced("progress_save")
+    def save(self):  # Writes everything into the PTBAnime-info.json files and empties the journal
+        with self.lock:
+            self.flush(force=True)
+            failed = set()
+            for anime_path in self.unsaved:
+                episode, timestamp = self.positions[anime_path]
+                try:
+                    self.metadata.update(anime_path, {"last-episode": episode, "last-episode-timestamp": timestamp})
+                except (OSError, ValueError) as e:  # Read only, gone, broken... keep it in the journal
+                    print("Couldn't save progress for", anime_path, e)
+                    failed.add(anime_path)
+            # Rewrite the journal with only what couldn't be saved
+            temp_path = self.journal_path + ".tmp"
+            with open(temp_path, "w") as F:
+                for anime_path in failed:
+                    episode, timestamp = self.positions[anime_path]
+                    F.write(json.dumps({"anime": anime_path, "episode": episode, "timestamp": timestamp}) + "\n")
+            os.replace(temp_path, self.journal_path)
+            saved = len(self.unsaved) - len(failed)
+            self.unsaved = failed
+            if saved:
+                print("Saved data")
@@ -0,0 +1,181 @@
+import re, bisect, threading, unicodedata
+
+# Library search. Every anime's titles, description and episode file names are split into words,
+# and each word points to the anime it's in, so a search only looks at words instead of every anime.
+# - A query word matches a word exactly, as the start of a word, or with one typo (SymSpell style:
+#   every word is also saved with each single letter removed, "naruto" -> "aruto", "nruto", ...)
+# - All query words have to match. Title matches count more than episode names, those more than the description
+# - One or two letters only match the start of title words (from a small table), anything else would match half the library
+# - Every search starts from the whole index (about 1 ms for 10k series). Only looking at the last results when
+#   the query got longer would be wrong: "narto" finds "naruto" by a typo but "nart" doesn't, and one or two letters
+#   only look at titles
+
+field_weights = {"title": 10, "title-en": 10, "episodes": 3, "description": 1}
+match_factors = {"exact": 1.0, "prefix": 0.8, "typo": 0.5}
+min_typo_length = 4  # Shorter words match too much with a typo
+short_prefix_length = 2
+word_pattern = re.compile(r"\w+")
+video_extension_pattern = re.compile(r"\.[a-z0-9]{2,4}$")
+
+
+def normalize(text):  # Lowercase without accents, "Pokémon" -> "pokemon"
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def split_words(text):
+    return word_pattern.findall(normalize(text))
+
+
+def deletes(word):  # Every way to remove one letter
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+class SearchIndex:
+    def __init__(self):
+        self.lock = threading.Lock()  # Filled from the library scan thread, searched on the main thread
+        self.documents = {}  # Key -> {word: weight}, plus the titles for substring matches
+        self.titles = {}  # Key -> normalized titles joined, for CJK titles without spaces
+        self.postings = {}  # Word -> {key: weight}
+        self.typos = {}  # Word with one letter removed -> set of words
+        self.short_prefixes = {}  # First one or two letters of title words -> {key: weight}
+        self.word_cache = {}  # Query word -> {key: score}, emptied when anything changes
+        self.sorted_words = []  # Every word in postings, sorted, for prefix matches
+        self.generation = 0  # Goes up on clear(), adds from a scan that started before it are dropped
+
+    def add(self, key, anime_data, episodes=(), generation=None):  # Replaces what was there for key
+        # generation is what clear() returned when the scan started, None always adds (watcher updates)
+        words = {}
+        fields = {"title": anime_data.get("title", ""), "title-en": anime_data.get("title-en", ""),
+                  "description": anime_data.get("description", ""),
+                  "episodes": " ".join(video_extension_pattern.sub("", name.lower()) for name in episodes)}
+        for field, text in fields.items():
+            for word in split_words(text):
+                if words.get(word, 0) < field_weights[field]:
+                    words[word] = field_weights[field]
+        with self.lock:
+            if generation is not None and generation != self.generation:  # From a refresh that was replaced
+                return
+            self.remove_locked(key)
+            self.documents[key] = words
+            self.titles[key] = normalize(fields["title"]) + "\n" + normalize(fields["title-en"])
+            for word, weight in words.items():
+                if weight == field_weights["title"]:
+                    for length in range(1, min(short_prefix_length, len(word)) + 1):
+                        self.short_prefixes.setdefault(word[:length], {})[key] = weight * match_factors["prefix"]
+                if word not in self.postings:
+                    self.postings[word] = {}
+                    bisect.insort(self.sorted_words, word)
+                    if len(word) >= min_typo_length:
+                        for variant in deletes(word) | {word}:
+                            self.typos.setdefault(variant, set()).add(word)
+                self.postings[word][key] = weight
+            self.word_cache.clear()
+
+    def remove(self, key):
+        with self.lock:
+            self.remove_locked(key)
+            self.word_cache.clear()
+
+    def remove_locked(self, key):
+        words = self.documents.pop(key, None)
+        self.titles.pop(key, None)
+        if words is None:
+            return
+        for word, weight in words.items():
+            if weight == field_weights["title"]:
+                for length in range(1, min(short_prefix_length, len(word)) + 1):
+                    prefix = self.short_prefixes.get(word[:length])
+                    if prefix is not None:
+                        prefix.pop(key, None)
+                        if not prefix:
+                            del self.short_prefixes[word[:length]]
+            posting = self.postings[word]
+            posting.pop(key, None)
+            if not posting:  # Nothing has this word anymore
+                del self.postings[word]
+                del self.sorted_words[bisect.bisect_left(self.sorted_words, word)]
+                if len(word) >= min_typo_length:
+                    for variant in deletes(word) | {word}:
+                        matches = self.typos.get(variant)
+                        if matches is not None:
+                            matches.discard(word)
+                            if not matches:
+                                del self.typos[variant]
+
+    def clear(self):  # Returns the new generation, for add()
+        with self.lock:
+            self.generation += 1
+            self.documents, self.titles, self.postings, self.typos = {}, {}, {}, {}
+            self.short_prefixes, self.word_cache = {}, {}
+            self.sorted_words = []
+            return self.generation
+
+    def matching_words(self, query_word):  # Word -> how well it matches query_word
+        matches = {}
+        index = bisect.bisect_left(self.sorted_words, query_word)
+        while index < len(self.sorted_words) and self.sorted_words[index].startswith(query_word):
+            word = self.sorted_words[index]
+            matches[word] = match_factors["exact"] if word == query_word else match_factors["prefix"]
+            index += 1
+        if len(query_word) >= min_typo_length:
+            for variant in deletes(query_word) | {query_word}:
+                for word in self.typos.get(variant, ()):
+                    matches.setdefault(word, match_factors["typo"])
+        return matches
+
+    def word_scores(self, query_word):  # Key -> best score of any word matching query_word
+        scores = self.word_cache.get(query_word)
+        if scores is not None:
+            return scores
+        if len(query_word) <= short_prefix_length:
+            scores = dict(self.short_prefixes.get(query_word, {}))
+            for key, weight in self.postings.get(query_word, {}).items():  # Still find "01" in episode names
+                if scores.get(key, 0) < weight:
+                    scores[key] = weight
+        else:
+            scores = {}
+            for word, factor in self.matching_words(query_word).items():
+                for key, weight in self.postings[word].items():
+                    score = weight * factor
+                    if scores.get(key, 0) < score:
+                        scores[key] = score
+        if len(self.word_cache) > 64:
+            self.word_cache.clear()
+        self.word_cache[query_word] = scores
+        return scores
+
+    def search(self, query):  # Key -> score, only for keys that match. None means everything matches
+        query = normalize(query).strip()
+        query_words = split_words(query)
+        if not query_words:
+            return None
+        with self.lock:
+            scores = None
+            for query_word in query_words:
+                word_scores = self.word_scores(query_word)
+                if scores is None:
+                    scores = dict(word_scores)
+                else:  # Every query word has to match
+                    scores = {key: score + word_scores[key] for key, score in scores.items() if key in word_scores}
+            # The whole query inside a title counts the most. Titles with no spaces (Japanese) can only be found
+            # like this, so for those every title is looked at, otherwise only the ones that already matched
+            keys = list(scores) if query.isascii() else list(self.titles)
+            for key in keys:
+                titles = self.titles.get(key)
+                if titles is None:
+                    continue
+                position = titles.find(query)
+                if position != -1:
+                    bonus = 30 if position == 0 or titles[position - 1] == "\n" else 20
+                    scores[key] = scores.get(key, 0) + bonus
+            return scores
+
+
+def filter_change(old_results, new_results):  # How the shown anime changed between two searches, for Gtk.FilterChange
+    # "more_strict" lets the filter model only look at what it showed before, that's only right if nothing new matched
+    if new_results is None:
+        return "same" if old_results is None else "less_strict"
+    if old_results is None or new_results.keys() <= old_results.keys():
+        return "more_strict"
+    return "different"
@@ -0,0 +1,83 @@
+import time
+from collections import deque
+from keyframes import nearest_keyframe
+
+# Seeks for held keys. The skips add up into one target, and only one seek is on its way at a time:
+# the next one goes out when the stream says the last one finished, so slow seeks (big HEVC files)
+# can't pile up. While a key is held the seeks go to the nearest keyframe (one frame to decode),
+# letting go does one exact seek to where the skips added up to.
+
+
+class SeekController:
+    def __init__(self, seek, get_position, get_duration):
+        self.seek = seek  # (position in microseconds) -> False if the stream can't seek right now
+        self.get_position = get_position
+        self.get_duration = get_duration
+        self.keyframes = None  # Sorted keyframe times in microseconds, None = not known
+        self.target = None  # Where the skips added up to, None when nothing is going on
+        self.in_flight = None  # (kind, time it was sent) of the seek the stream is doing
+        self.pending = None  # "fast" or "exact", a seek that waits for the one in flight
+        self.last_kind = None  # Kind and position of the last seek sent
+        self.last_position = None
+        self.scrubbing = False  # A key is held, the exact seek comes on release
+        self.latencies = deque(maxlen=200)  # (kind, seconds from seek() until the stream finished)
+
+    def reset(self, keyframes=None):  # New video
+        self.keyframes = keyframes
+        self.target = None
+        self.in_flight = None
+        self.pending = None
+        self.last_kind = None
+        self.last_position = None
+        self.scrubbing = False
+
+    def nudge(self, offset, scrubbing=False):  # Skip offset microseconds, scrubbing = key is being held
+        base = self.target if self.target is not None else self.get_position()
+        duration = self.get_duration()
+        self.target = max(0, base + offset)
+        if duration > 0:
+            self.target = min(self.target, duration)
+        self.scrubbing = scrubbing
+        self.pending = "exact" if not scrubbing or self.pending == "exact" else "fast"
+        self.pump()
+        return self.target
+
+    def release(self):  # Key let go, land exactly on the target
+        self.scrubbing = False
+        if self.target is None:
+            return
+        if self.pending == "fast" or self.last_kind == "fast":
+            self.pending = "exact"
+        self.pump()
+
+    def seek_done(self):  # Stream finished seeking (notify::seeking went False)
+        if self.in_flight is None:  # Not ours, like the resume seek
+            return
+        kind, sent_at = self.in_flight
+        self.in_flight = None
+        self.latencies.append((kind, time.perf_counter() - sent_at))
+        self.pump()
+
+    def pump(self):  # Sends the pending seek if nothing is in flight
+        if self.in_flight is not None:
+            return
+        if self.pending is None:
+            if not self.scrubbing:
+                self.target = None  # All done, the next skip starts from where the video is
+            return
+        kind, self.pending = self.pending, None
+        position = self.target if kind == "exact" else nearest_keyframe(self.keyframes, self.target)
+        if kind == "fast" and position == self.last_position:  # Still the same keyframe, nothing new to show
+            return
+        self.last_kind, self.last_position = kind, position
+        self.in_flight = (kind, time.perf_counter())
+        if not self.seek(position):
+            self.in_flight = None
+            self.target = None
+
+    def stats(self):  # Average seek latency in ms per kind
+        result = {}
+        for kind in ("fast", "exact"):
+            times = [latency for k, latency in self.latencies if k == kind]
+            result[kind] = {"seeks": len(times), "mean_ms": sum(times) / len(times) * 1000 if times else None}
+        return result
@@ -0,0 +1,41 @@
+import os, time
+
+# Timing from process start to the first frame on screen, for "python main.py --profile-startup".
+# Import this first so it's also there for the other imports. Marks are always taken (they're cheap),
+# they're only printed if enabled is set.
+
+enabled = False
+imported_at = time.perf_counter()
+marks = []  # (name, perf_counter time)
+
+
+def process_age():  # Seconds since the process started (interpreter startup included), None if we can't tell
+    try:
+        with open("/proc/self/stat", "r") as F:
+            start_ticks = int(F.read().rsplit(")", 1)[1].split()[19])  # Field 22, after the command name
+        with open("/proc/uptime", "r") as F:
+            uptime = float(F.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+before_import = process_age()  # Interpreter startup, measured when this module is imported
+
+
+def mark(name):
+    marks.append((name, time.perf_counter()))
+
+
+def report():
+    if not enabled:
+        return
+    print("Startup profile:")
+    offset = before_import if before_import is not None else 0
+    print(f"  {'interpreter start':<28} {offset * 1000:8.1f} ms")
+    previous = imported_at
+    for name, at in marks:
+        print(f"  {name:<28} {(at - previous) * 1000:8.1f} ms   (at {(offset + at - imported_at) * 1000:.1f} ms)")
+        previous = at
+    total = offset + (marks[-1][1] if marks else imported_at) - imported_at
+    print(f"  {'total to first frame':<28} {total * 1000:8.1f} ms")
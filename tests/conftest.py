@@ -0,0 +1,6 @@
+import os, sys, tempfile
+
+# The modules are flat files in the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# core opens its index, manifest and progress journal on import, keep them out of ~/.cache
+os.environ["XDG_CACHE_HOME"] = tempfile.mkdtemp(prefix="ptbanime-tests-")
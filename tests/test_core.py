@@ -0,0 +1,45 @@
+import os
+import pytest
+import core
+from cache_manifest import CacheManifest
+from cache_store import CacheStore
+from library_index import LibraryIndex
+from metadata_repository import MetadataRepository
+
+mp4_header = b"\0\0\0\x18ftypmp42"
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):  # A library with one episode at the top and one in a season folder, cached in "media" mode
+    root = tmp_path / "library"
+    season = root / "Show" / "Season 1"
+    season.mkdir(parents=True)
+    (root / "Show" / "Episode 0.mp4").write_bytes(mp4_header + b"0")  # Different content, the store is keyed by it
+    (season / "Episode 1.mp4").write_bytes(mp4_header + b"1")
+    monkeypatch.setattr(core, "library_index", LibraryIndex(str(tmp_path / "index.sqlite")))
+    monkeypatch.setattr(core, "metadata", MetadataRepository(core.ptbanime_data_file))
+    monkeypatch.setattr(core, "cache_manifest", CacheManifest(str(tmp_path / "manifest.sqlite")))
+    monkeypatch.setattr(core, "cache_store", None)
+    videos = [str(root / "Show" / "Episode 0.mp4"), str(season / "Episode 1.mp4")]
+    for video_path in videos:  # What "media" mode made before switching to "central"
+        for cache_path in (core.media_thumbnail_path(video_path),) + core.media_storyboard_paths(video_path):
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, "wb") as F:
+                F.write(b"cache")
+            core.cache_manifest.record(cache_path, video_path)
+    monkeypatch.setattr(core, "cache_store", CacheStore(str(tmp_path / "store")))
+    return str(root), videos
+
+
+def test_migration_moves_top_level_and_season_folder_caches(library):
+    root, videos = library
+    core.migrate_root_caches(root)
+    for video_path in videos:
+        new_paths = [core.cache_store.path_for(video_path, "thumbnails", ".jpg"),
+                     core.cache_store.path_for(video_path, "storyboards", ".jpg"),
+                     core.cache_store.path_for(video_path, "storyboards", ".json")]
+        assert all(os.path.exists(path) for path in new_paths)
+        assert all(core.is_cache_fresh(path, video_path) for path in new_paths)
+    assert not os.path.exists(os.path.join(root, "Show", ".cache"))
+    assert not os.path.exists(os.path.join(root, "Show", "Season 1", ".cache"))
+    assert core.cache_store.is_migrated(root)
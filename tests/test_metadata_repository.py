@@ -0,0 +1,34 @@
+import os, json
+import pytest
+from metadata_repository import MetadataRepository
+
+defaults = {"title": "", "title-en": "", "last-episode": 1, "last-episode-timestamp": 0, "description": ""}
+broken_text = '{"title": "My Show", "description": "Written by hand",}'  # Trailing comma
+
+
+def test_missing_keys_are_filled_in(tmp_path):
+    (tmp_path / "PTBAnime-info.json").write_text(json.dumps({"title": "My Show"}))
+    anime_data = MetadataRepository(defaults).load(str(tmp_path))
+    assert anime_data["title"] == "My Show" and anime_data["last-episode"] == 1
+    assert json.loads((tmp_path / "PTBAnime-info.json").read_text())["last-episode"] == 1
+
+
+def test_broken_file_loads_defaults_and_is_never_written_over(tmp_path):
+    (tmp_path / "PTBAnime-info.json").write_text(broken_text)
+    metadata = MetadataRepository(defaults)
+    assert metadata.load(str(tmp_path))["title"] == tmp_path.name
+    assert metadata.is_broken(str(tmp_path))
+    with pytest.raises(ValueError):
+        metadata.update(str(tmp_path), {"last-episode": 3})
+    assert (tmp_path / "PTBAnime-info.json").read_text() == broken_text
+
+
+def test_fixed_file_is_read_again(tmp_path):
+    metadata = MetadataRepository(defaults)
+    (tmp_path / "PTBAnime-info.json").write_text(broken_text)
+    metadata.load(str(tmp_path))
+    (tmp_path / "PTBAnime-info.json").write_text('{"title": "My Show", "description": "Written by hand"}')
+    mtime = os.stat(tmp_path / "PTBAnime-info.json").st_mtime_ns + 1000000000  # Coarse clocks could give the same mtime
+    os.utime(tmp_path / "PTBAnime-info.json", ns=(mtime, mtime))
+    assert metadata.update(str(tmp_path), {"last-episode": 3})["title"] == "My Show"
+    assert not metadata.is_broken(str(tmp_path))
@@ -0,0 +1,65 @@
+from playback_state import PlaybackStateMachine, resume_point, IDLE, LOADING, PLAYING, PAUSED, ENDED
+
+
+def opened(playing=False):  # A machine with a video that's loaded
+    playback = PlaybackStateMachine()
+    playback.fire("open")
+    playback.fire("prepared", playing)
+    return playback
+
+
+def test_open_and_prepared():
+    playback = PlaybackStateMachine()
+    assert playback.fire("open") == LOADING
+    assert playback.fire("prepared") == PAUSED
+    assert opened(playing=True).state == PLAYING  # Autoplay, the stream was already playing when it got prepared
+
+
+def test_play_pause():
+    playback = opened()
+    assert playback.fire("play") == PLAYING
+    assert playback.fire("pause") == PAUSED
+    assert playback.fire("play") == PLAYING
+
+
+def test_end_and_next_episode():
+    playback = opened(playing=True)
+    assert playback.fire("ended") == ENDED
+    assert playback.fire("open") == LOADING  # Auto-advance opens the next one
+    assert playback.fire("prepared", True) == PLAYING
+
+
+def test_events_that_dont_fit_are_ignored():
+    playback = PlaybackStateMachine()
+    seen = []
+    playback.add_listener(lambda *transition: seen.append(transition))
+    assert playback.fire("play") == IDLE
+    assert playback.fire("ended") == IDLE
+    assert seen == [] and len(playback.history) == 0
+
+
+def test_close_from_anywhere():
+    for state_events in ([], ["open"], ["open", "prepared"], ["open", "prepared", "play", "ended"]):
+        playback = PlaybackStateMachine()
+        for event in state_events:
+            playback.fire(event)
+        assert playback.fire("close") == IDLE
+
+
+def test_listeners_see_transitions():
+    playback = PlaybackStateMachine()
+    seen = []
+    playback.add_listener(lambda *transition: seen.append(transition))
+    playback.fire("open")
+    playback.fire("prepared", True)
+    playback.fire("pause")
+    playback.fire("close")
+    expected = [(IDLE, "open", LOADING), (LOADING, "prepared", PLAYING), (PLAYING, "pause", PAUSED), (PAUSED, "close", IDLE)]
+    assert seen == expected
+    assert list(playback.history) == expected
+
+
+def test_resume_point():
+    assert resume_point(3, 12, 754000000, ended=False) == (3, 754000000)
+    assert resume_point(3, 12, 1420000000, ended=True) == (4, 0)
+    assert resume_point(12, 12, 1420000000, ended=True) == (12, 0)  # Last episode stays the last
@@ -0,0 +1,41 @@
+import threading
+from prefetcher import Prefetcher
+
+
+def test_refresh_drops_loads_that_started_before_it():
+    started, finish = threading.Event(), threading.Event()
+
+    def load(key, cancelled):  # Ignores cancelled, like a load stuck in one long read
+        started.set()
+        finish.wait(5)
+        return "old files of " + key
+
+    prefetcher = Prefetcher(load, workers=1)
+    prefetcher.prefetch("anime")
+    assert started.wait(5)
+    prefetcher.invalidate()
+    finish.set()
+    prefetcher.pool.shutdown(wait=True)
+    assert prefetcher.get("anime") is None
+
+
+def test_forget_restarts_a_load_in_flight():
+    loads = []
+    started, finish = threading.Event(), threading.Event()
+
+    def load(key, cancelled):
+        loads.append(key)
+        load_n = len(loads)
+        started.set()
+        finish.wait(5)
+        return load_n
+
+    prefetcher = Prefetcher(load, workers=2)
+    prefetcher.prefetch("anime")
+    assert started.wait(5)
+    prefetcher.forget("anime")  # An episode was added while loading
+    prefetcher.prefetch("anime")  # Hovered again, loads the new files
+    finish.set()
+    prefetcher.pool.shutdown(wait=True)
+    assert prefetcher.get("anime") == 2  # Not what the first load found
+    assert loads == ["anime", "anime"]
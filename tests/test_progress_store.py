@@ -0,0 +1,45 @@
+import json, os
+from playback_state import resume_point
+from metadata_repository import MetadataRepository
+from progress_store import ProgressStore
+
+defaults = {"title": "", "title-en": "", "last-episode": 1, "last-episode-timestamp": 0, "description": ""}
+
+
+def test_resume_saved_on_leave(tmp_path):
+    anime_path = tmp_path / "Show"
+    anime_path.mkdir()
+    metadata = MetadataRepository(defaults)
+    progress = ProgressStore(str(tmp_path / "progress.journal"), metadata)
+    progress.update(str(anime_path), *resume_point(5, 12, 300000000, ended=False))  # What record_progress does
+    progress.save()  # Leaving the video
+    with open(anime_path / "PTBAnime-info.json") as F:
+        anime_data = json.load(F)
+    assert (anime_data["last-episode"], anime_data["last-episode-timestamp"]) == (5, 300000000)
+    assert os.path.getsize(tmp_path / "progress.journal") == 0
+
+
+def test_progress_journal_survives_a_crash(tmp_path):
+    anime_path = tmp_path / "Show"
+    anime_path.mkdir()
+    progress = ProgressStore(str(tmp_path / "progress.journal"), MetadataRepository(defaults))
+    progress.update(str(anime_path), 2, 60000000)
+    progress.flush(force=True)  # Pausing does this, then the app dies before save()
+    recovered = ProgressStore(str(tmp_path / "progress.journal"), MetadataRepository(defaults))
+    assert not (anime_path / "PTBAnime-info.json").exists()  # Starting up doesn't write info files
+    assert recovered.get(str(anime_path)) == (2, 60000000)  # But the journal is read on first use
+    recovered.recover()  # The app does this in a thread once the window is up
+    with open(anime_path / "PTBAnime-info.json") as F:
+        assert json.load(F)["last-episode"] == 2
+
+
+def test_broken_info_file_keeps_progress_in_the_journal(tmp_path):
+    anime_path = tmp_path / "Show"
+    anime_path.mkdir()
+    broken_text = '{"title": "My Show", "description": "Written by hand",}'
+    (anime_path / "PTBAnime-info.json").write_text(broken_text)
+    progress = ProgressStore(str(tmp_path / "progress.journal"), MetadataRepository(defaults))
+    progress.update(str(anime_path), 4, 120000000)
+    progress.save()
+    assert (anime_path / "PTBAnime-info.json").read_text() == broken_text  # Left for the user to fix
+    assert json.loads((tmp_path / "progress.journal").read_text())["episode"] == 4  # Saved once it's fixed
@@ -0,0 +1,55 @@
+import pytest
+from search_index import SearchIndex, filter_change
+
+library = {
+    "/anime/naruto": {"title": "Naruto", "title-en": "Naruto", "description": "A ninja who wants to be Hokage"},
+    "/anime/frieren": {"title": "Sousou no Frieren", "title-en": "Frieren: Beyond Journey's End", "description": "An elf mage"},
+    "/anime/fire-force": {"title": "Enen no Shouboutai", "title-en": "Fire Force", "description": "Firefighters"},
+    "/anime/one-piece": {"title": "One Piece", "title-en": "One Piece", "description": "Pirates"},
+}
+
+
+def make_index():
+    index = SearchIndex()
+    for key, anime_data in library.items():
+        index.add(key, anime_data, ["Episode 01.mkv"])
+    return index
+
+
+def type_query(index, query):  # Searches every prefix in order, like the search box does per key press
+    results = None
+    for end in range(1, len(query) + 1):
+        results = index.search(query[:end])
+    return results
+
+
+@pytest.mark.parametrize("query, key", [("narto", "/anime/naruto"), ("freiren", "/anime/frieren"), ("frieern", "/anime/frieren")])
+def test_typo_typed_one_key_at_a_time(query, key):
+    typed = type_query(make_index(), query)
+    assert key in typed
+    assert typed == make_index().search(query)  # Same as searching it at once on a fresh index
+
+
+def test_cleared_search_starts_over():
+    index = make_index()
+    type_query(index, "one")
+    assert index.search("") is None
+    assert "/anime/naruto" in type_query(index, "narto")
+
+
+def test_filter_change():
+    assert filter_change(None, None) == "same"
+    assert filter_change({"a": 1}, None) == "less_strict"
+    assert filter_change(None, {"a": 1}) == "more_strict"
+    assert filter_change({"a": 1, "b": 1}, {"a": 2}) == "more_strict"
+    assert filter_change({"a": 1}, {"a": 1, "b": 1}) == "different"  # Fuzzy matches can add anime
+
+
+def test_adds_from_a_replaced_refresh_are_dropped():
+    index = make_index()
+    old_generation = index.clear()
+    new_generation = index.clear()  # A new refresh started while the old scan was still adding
+    index.add("/anime/naruto", library["/anime/naruto"], generation=old_generation)
+    assert index.search("naruto") == {}
+    index.add("/anime/naruto", library["/anime/naruto"], generation=new_generation)
+    assert "/anime/naruto" in index.search("naruto")
@@ -0,0 +1,75 @@
+from seek_controller import SeekController
+
+
+class FakeStream:  # Records seeks, position and duration in microseconds
+    def __init__(self, position=0, duration=600000000):
+        self.position = position
+        self.duration = duration
+        self.seeks = []
+
+    def seek(self, position):
+        self.seeks.append(position)
+        return True
+
+
+def make_controller(stream, keyframes=None):
+    controller = SeekController(stream.seek, lambda: stream.position, lambda: stream.duration)
+    controller.reset(keyframes)
+    return controller
+
+
+def test_skip_seeks_exactly():
+    stream = FakeStream(position=10000000)
+    controller = make_controller(stream)
+    assert controller.nudge(5000000) == 15000000
+    assert stream.seeks == [15000000]
+    controller.seek_done()
+    assert controller.target is None  # Done, the next skip starts from where the video is
+
+
+def test_skips_add_up_while_a_seek_is_in_flight():
+    stream = FakeStream(position=10000000)
+    controller = make_controller(stream)
+    controller.nudge(5000000)
+    controller.nudge(5000000)
+    controller.nudge(5000000)
+    assert stream.seeks == [15000000]  # Only one seek on its way at a time
+    controller.seek_done()
+    assert stream.seeks == [15000000, 25000000]
+
+
+def test_skip_stays_inside_the_video():
+    stream = FakeStream(position=2000000, duration=60000000)
+    controller = make_controller(stream)
+    assert controller.nudge(-5000000) == 0
+    controller.seek_done()
+    assert controller.nudge(120000000) == 60000000
+
+
+def test_scrubbing_snaps_to_keyframes_then_lands_exactly():
+    stream = FakeStream(position=0)
+    controller = make_controller(stream, keyframes=[0, 10000000, 20000000, 30000000])
+    controller.nudge(12000000, scrubbing=True)
+    assert stream.seeks == [10000000]  # Nearest keyframe while the key is held
+    controller.seek_done()
+    controller.nudge(7000000, scrubbing=True)  # 19 s, keyframe 20 s
+    controller.seek_done()
+    assert stream.seeks == [10000000, 20000000]
+    controller.release()
+    assert stream.seeks == [10000000, 20000000, 19000000]  # Letting go seeks to where the skips added up to
+
+
+def test_scrubbing_skips_seeks_to_the_same_keyframe():
+    stream = FakeStream(position=0)
+    controller = make_controller(stream, keyframes=[0, 10000000, 20000000])
+    controller.nudge(9000000, scrubbing=True)
+    controller.seek_done()
+    controller.nudge(1000000, scrubbing=True)  # 10 s, still keyframe 10 s
+    assert stream.seeks == [10000000]
+
+
+def test_seek_done_from_somewhere_else_is_ignored():
+    stream = FakeStream()
+    controller = make_controller(stream)
+    controller.seek_done()  # Like the resume seek
+    assert stream.seeks == [] and len(controller.latencies) == 0
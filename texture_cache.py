@@ -0,0 +1,56 @@
+import os, threading
+from collections import OrderedDict
+
+# Decoded textures shared by every card and page, so a cover is only decoded once.
+# Keyed by (path, size, mtime), so a changed file is decoded again, and kept under a memory budget
+# by dropping the least recently used.
+
+
+class TextureCache:
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.lock = threading.Lock()  # Cover and thumbnail workers use it too
+        self.entries = OrderedDict()  # Key -> (texture, bytes), oldest first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path, size, load):  # load() decodes the texture if it isn't cached
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        key = (path, tuple(size), mtime)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        texture = load()
+        if texture is None:
+            return None
+        cost = texture.get_width() * texture.get_height() * 4  # RGBA in memory
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = (texture, cost)
+                self.total_bytes += cost
+            while self.total_bytes > self.budget_bytes and len(self.entries) > 1:
+                old_texture, old_cost = self.entries.popitem(last=False)[1]
+                self.total_bytes -= old_cost
+                self.evictions += 1
+        return texture
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self.entries), "bytes": self.total_bytes, "budget_bytes": self.budget_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "hit_rate": self.hits / lookups if lookups else 0}
@@ -0,0 +1,98 @@
+import heapq, itertools, threading
+
+# Runs thumbnail jobs on a few worker threads.
+# - Same file requested twice = one job, every requester gets the result
+# - Lower priority number goes first, and newer requests go first within the same priority
+#   (the cards that were just scrolled onto the screen)
+# - Cancelling the last request for a job that hasn't started drops it
+
+PRIORITY_VISIBLE = 0     # Card is on screen right now
+PRIORITY_PREFETCH = 1    # Probably going to be on screen soon
+PRIORITY_BACKGROUND = 2  # Cache warming, new files from the watcher
+
+
+class ThumbnailJob:
+    def __init__(self, path, group):
+        self.path = path
+        self.group = group
+        self.priority = PRIORITY_BACKGROUND
+        self.callbacks = {}  # Ticket -> callback
+        self.running = False
+
+
+class ThumbnailService:
+    def __init__(self, make_thumbnail, workers=2, deliver=None):
+        self.make_thumbnail = make_thumbnail  # (path) -> result, runs in a worker
+        self.deliver = deliver or (lambda callback, *args: callback(*args))  # How results get back (e.g. GLib.idle_add)
+        self.condition = threading.Condition()
+        self.queue = []  # Heap of (priority, -order, path)
+        self.jobs = {}  # Path -> ThumbnailJob, queued or running
+        self.tickets = {}  # Ticket -> path
+        self.counter = itertools.count()
+        for n in range(workers):
+            threading.Thread(target=self.work, name=f"thumbnail-worker-{n}", daemon=True).start()
+
+    def request(self, path, callback, priority=PRIORITY_VISIBLE, group=None):
+        # callback(path, result) gets called once the thumbnail is ready (result is None if it failed)
+        # Returns a ticket for cancel()
+        with self.condition:
+            ticket = next(self.counter)
+            job = self.jobs.get(path)
+            if job is None:
+                job = self.jobs[path] = ThumbnailJob(path, group)
+            job.callbacks[ticket] = callback
+            self.tickets[ticket] = path
+            if not job.running and (priority < job.priority or len(job.callbacks) == 1):
+                job.priority = min(priority, job.priority)
+                # Old heap entries for this job are skipped when popped
+                heapq.heappush(self.queue, (job.priority, -ticket, path))
+                self.condition.notify()
+            return ticket
+
+    def cancel(self, ticket):  # The requester doesn't care anymore (card scrolled away)
+        with self.condition:
+            path = self.tickets.pop(ticket, None)
+            job = self.jobs.get(path)
+            if job is not None:
+                job.callbacks.pop(ticket, None)
+                if not job.callbacks and not job.running:
+                    del self.jobs[path]
+
+    def cancel_group(self, group):  # Drops everything for a group (anime you navigated away from)
+        with self.condition:
+            for path, job in list(self.jobs.items()):
+                if job.group == group:
+                    for ticket in job.callbacks:
+                        self.tickets.pop(ticket, None)
+                    job.callbacks.clear()
+                    if not job.running:
+                        del self.jobs[path]
+
+    def pending(self):  # How many jobs are queued or running
+        with self.condition:
+            return len(self.jobs)
+
+    def work(self):
+        while True:
+            with self.condition:
+                job = None
+                while job is None:
+                    while not self.queue:
+                        self.condition.wait()
+                    priority, order, path = heapq.heappop(self.queue)
+                    job = self.jobs.get(path)
+                    if job is not None and (job.running or priority != job.priority):  # Stale heap entry
+                        job = None
+                job.running = True
+            try:
+                result = self.make_thumbnail(job.path)
+            except Exception as e:
+                print("Thumbnail job failed for", job.path, e)
+                result = None
+            with self.condition:
+                del self.jobs[job.path]
+                callbacks = list(job.callbacks.values())
+                for ticket in job.callbacks:
+                    self.tickets.pop(ticket, None)
+            for callback in callbacks:
+                self.deliver(callback, job.path, result)
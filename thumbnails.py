@@ -0,0 +1,151 @@
+import os, struct
+
+# Thumbnail extraction. The duration comes from the mp4 header when possible (no ffprobe process),
+# ffmpeg only decodes keyframes after a fast input seek, and several files can share one ffmpeg run.
+# ffmpeg-python is imported in the functions that use it, so importing this module doesn't slow down startup.
+
+thumbnail_size = (160, 90)
+storyboard_columns = 10  # Tiles per row of a storyboard sheet
+storyboard_max_tiles = 200  # Long videos get a longer interval instead, so a decoded sheet stays around 10 MB
+
+
+def read_box_header(f):  # Returns (box type, box size or None for "until the end", header size)
+    header = f.read(8)
+    if len(header) < 8:
+        return None, 0, 0
+    size, box_type = struct.unpack(">I4s", header)
+    if size == 1:  # 64 bit size
+        size = struct.unpack(">Q", f.read(8))[0]
+        return box_type, size, 16
+    if size == 0:
+        return box_type, None, 8
+    return box_type, size, 8
+
+
+def mp4_duration(video_path):  # Duration in seconds from the moov/mvhd box, None if it's not there
+    try:
+        with open(video_path, "rb") as f:
+            end = os.fstat(f.fileno()).st_size
+            while f.tell() < end:
+                start = f.tell()
+                box_type, size, header_size = read_box_header(f)
+                if box_type is None:
+                    return None
+                if size is None:
+                    size = end - start
+                if size < header_size:  # Broken file
+                    return None
+                if box_type == b"moov":
+                    end = start + size  # Look inside moov now
+                    continue
+                if box_type == b"mvhd":
+                    version = f.read(1)[0]
+                    f.read(3)  # Flags
+                    if version == 1:
+                        f.read(16)  # Creation and modification time
+                        timescale, duration = struct.unpack(">IQ", f.read(12))
+                    else:
+                        f.read(8)
+                        timescale, duration = struct.unpack(">II", f.read(8))
+                    return duration / timescale if timescale else None
+                f.seek(start + size)
+    except (OSError, struct.error, IndexError):
+        pass
+    return None
+
+
+def get_duration(video_path):  # Falls back to ffprobe for things that aren't mp4
+    duration = mp4_duration(video_path)
+    if duration is not None:
+        return duration
+    import ffmpeg
+    try:
+        return float(ffmpeg.probe(video_path)["format"]["duration"])
+    except (ffmpeg.Error, KeyError, ValueError) as e:
+        print("ffprobe error message:")
+        print(e.stderr.decode() if isinstance(e, ffmpeg.Error) else e)
+        return None
+
+
+def thumbnail_output(video_path, output_path, seek):  # One output of an ffmpeg run
+    import ffmpeg
+    return (
+        ffmpeg
+        .input(video_path, ss=seek, skip_frame="nokey", noaccurate_seek=None)  # Keyframes only, no exact seek
+        .video
+        .filter("scale", thumbnail_size[0], thumbnail_size[1])
+        .output(output_path, vframes=1, qscale=5)
+    )
+
+
+def extract_thumbnails(jobs):  # jobs = [(video path, output path)], all done by one ffmpeg process
+    # Returns the output paths that were made. If the shared run fails, every file is tried on its own.
+    outputs = []
+    for video_path, output_path in jobs:
+        duration = get_duration(video_path)
+        if duration is not None:
+            outputs.append((video_path, output_path, duration / 2))  # Middle of the video
+    if not outputs:
+        return []
+    import ffmpeg
+    try:
+        ffmpeg.merge_outputs(*[thumbnail_output(*output) for output in outputs]).run(quiet=True, overwrite_output=True)
+    except ffmpeg.Error as e:
+        if len(outputs) == 1:
+            print("ffmpeg error message for", outputs[0][0])
+            print(e.stderr.decode())
+            return []
+        return [path for output in outputs for path in extract_thumbnails([output[:2]])]
+    return [output_path for video_path, output_path, seek in outputs if os.path.exists(output_path)]
+
+
+def extract_thumbnail(video_path, output_path):  # Returns output_path, or None if it failed
+    made = extract_thumbnails([(video_path, output_path)])
+    return made[0] if made else None
+
+
+def scale_image(image_path, output_path, size):  # Resized png copy of an image (covers without GTK), None if it failed
+    import ffmpeg
+    try:
+        (
+            ffmpeg
+            .input(image_path)
+            .filter("scale", size[0], size[1])
+            .output(output_path, vframes=1, vcodec="png", f="image2")
+            .run(quiet=True, overwrite_output=True)
+        )
+    except ffmpeg.Error as e:
+        print("ffmpeg error message for", image_path)
+        print(e.stderr.decode())
+        return None
+    return output_path
+
+
+def extract_storyboard(video_path, output_path, interval=10):  # Sprite sheet of frames every interval seconds
+    # One ffmpeg pass: keyframes only, fps picks a frame per interval, tile puts them in one image.
+    # Tile n is the frame at n * interval. Returns the index (what the preview needs to cut tiles out), or None
+    duration = get_duration(video_path)
+    if not duration:
+        return None
+    interval = max(interval, duration / storyboard_max_tiles)
+    count = int(duration // interval) + 1
+    columns = min(storyboard_columns, count)
+    rows = -(-count // columns)
+    import ffmpeg
+    try:
+        (
+            ffmpeg
+            .input(video_path, skip_frame="nokey")
+            .video
+            .filter("fps", fps=f"1/{interval:.3f}")
+            .filter("scale", thumbnail_size[0], thumbnail_size[1])
+            .filter("tile", f"{columns}x{rows}")
+            .output(output_path, vframes=1, qscale=5)
+            .run(quiet=True, overwrite_output=True)
+        )
+    except ffmpeg.Error as e:
+        print("ffmpeg error message for", video_path)
+        print(e.stderr.decode())
+        return None
+    return {"interval": interval, "count": count, "columns": columns, "rows": rows,
+            "tile_width": thumbnail_size[0], "tile_height": thumbnail_size[1], "duration": duration}
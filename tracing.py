@@ -0,0 +1,139 @@
+import os, json, time, threading, functools
+from collections import deque
+
+# Timed spans around the slow stuff (directory scans, metadata reads, thumbnails, decoding, cards, saves),
+# for "python main.py --trace trace.json". The file opens in chrome://tracing or ui.perfetto.dev, and a
+# latency table per span is printed on exit. When tracing is off span() hands out one shared do-nothing
+# context manager, so leaving the spans in costs about a function call.
+#
+#   with tracing.span("scan_series", path=anime_path):
+#       ...
+#
+#   @tracing.traced("make_cover_cache")
+#   def make_cover_cache(...):
+
+enabled = False
+started_at = time.perf_counter()
+events = deque(maxlen=500000)  # (name, thread id, start, duration, args), oldest dropped first
+thread_names = {}  # Thread id -> name, for the trace viewer
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+null_span = NullSpan()
+
+
+class Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, self.start, time.perf_counter() - self.start, self.args)
+        return False
+
+
+def span(name, **args):  # Context manager timing its block, args show up in the trace viewer
+    if not enabled:
+        return null_span
+    return Span(name, args)
+
+
+def traced(name=None):  # Decorator version of span(), checks enabled on every call so it can be turned on later
+    def decorate(function):
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(span_name, start, time.perf_counter() - start, None)
+        return wrapper
+    return decorate
+
+
+def record(name, start, duration, args):
+    thread = threading.current_thread()
+    if thread.ident not in thread_names:
+        thread_names[thread.ident] = thread.name
+    events.append((name, thread.ident, start, duration, args))  # deque.append is thread safe
+
+
+def clear():
+    events.clear()
+
+
+def chrome_trace():  # Chrome trace event format, "X" = complete event, times in microseconds
+    pid = os.getpid()
+    trace_events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}}
+                    for tid, thread_name in thread_names.items()]
+    for name, tid, start, duration, args in list(events):
+        event = {"name": name, "ph": "X", "pid": pid, "tid": tid,
+                 "ts": round((start - started_at) * 1000000, 3), "dur": round(duration * 1000000, 3)}
+        if args:
+            event["args"] = {key: str(value) for key, value in args.items()}
+        trace_events.append(event)
+    return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+
+def export(path):
+    with open(path, "w") as F:
+        json.dump(chrome_trace(), F)
+
+
+def histogram(durations):  # Counts per power-of-two bucket in ms: {"<1": n, "<2": n, "<4": n, ...}
+    buckets = {}
+    for duration in durations:
+        limit = 1
+        while duration * 1000 >= limit:
+            limit *= 2
+        buckets[limit] = buckets.get(limit, 0) + 1
+    return {f"<{limit}": buckets[limit] for limit in sorted(buckets)}
+
+
+def summary():  # {span name: latency stats in ms}, slowest total first
+    durations = {}
+    for name, tid, start, duration, args in list(events):
+        durations.setdefault(name, []).append(duration)
+    result = {}
+    for name, times in sorted(durations.items(), key=lambda entry: -sum(entry[1])):
+        times.sort()
+        result[name] = {
+            "count": len(times),
+            "total_ms": sum(times) * 1000,
+            "mean_ms": sum(times) / len(times) * 1000,
+            "p50_ms": times[len(times) // 2] * 1000,
+            "p95_ms": times[min(len(times) - 1, int(len(times) * 0.95))] * 1000,
+            "max_ms": times[-1] * 1000,
+            "histogram": histogram(times),
+        }
+    return result
+
+
+def report():
+    stats = summary()
+    if not stats:
+        return
+    print("Trace summary:")
+    print(f"  {'span':<28}{'count':>8}{'total ms':>11}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, entry in stats.items():
+        print(f"  {name:<28}{entry['count']:>8}{entry['total_ms']:>11.1f}{entry['mean_ms']:>10.2f}"
+              f"{entry['p50_ms']:>10.2f}{entry['p95_ms']:>10.2f}{entry['max_ms']:>10.2f}")
+        print(f"  {'':<28}ms buckets: " + "  ".join(f"{limit}: {count}" for limit, count in entry["histogram"].items()))
@@ -1,35 +1,58 @@
-import re, json, ffmpeg
-import os, sys, subprocess, threading, shutil, time, atexit
+import re, json
+import os, sys, threading, shutil, time, atexit
 from concurrent.futures import ThreadPoolExecutor
 import gi
 gi.require_version('Gtk', '4.0')
-from gi.repository import Gtk, Gdk, Pango, GdkPixbuf, Gio, GLib
-
-base_dir = os.path.dirname(os.path.abspath(__file__))
-settings_path = os.path.join(base_dir, "settings.json")
-with open(settings_path, "r") as f:
-    settings = json.load(f)
-anime_dir = settings.get("anime_folder", os.path.join(os.path.expanduser("~"), "Anime"))
-ptbanime_data_file = {  # Default data file
-    "title": "Anime Title",          # Title
-    "title-en": "Anime Title (en)",  # Title in english
-    "last-episode": 1,               # Last episode you watched
-    "last-episode-timestamp": 0,     # Where you last left off of last-episode
-    "description": "Default description. You should edit the PTBAnime-info.json file in the folder of this anime to change the description, you can also change other stuff too, like the english and japanese titles. Changing the titles won't change your folder name. "
-}
-
-
-class EpisodeCard(Gtk.Box):
-    def __init__(self, info=None, anime_path=None, label_text="EMPTY", video_path=None, episode_num=0):
-        super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=5)
-        if info is None:
-            self.info = ptbanime_data_file
-        else:
-            self.info = info
-        self.anime_path = anime_path
-        self.label_text = label_text
+from gi.repository import Gtk, Gdk, Pango, GdkPixbuf, Gio, GLib, GObject
+import core
+from core import *  # Settings, library, metadata and cache code, the parts that don't need GTK
+from texture_cache import TextureCache
+from search_index import SearchIndex
+from prefetcher import Prefetcher
+from thumbnail_service import ThumbnailService, PRIORITY_VISIBLE, PRIORITY_PREFETCH, PRIORITY_BACKGROUND
+from thumbnails import thumbnail_size
+import tracing
+
+cover_pool = ThreadPoolExecutor(max_workers=2)  # Decodes covers for cards that are on screen
+# Extracts and decodes episode thumbnails, results come back on the main thread
+thumbnail_service = ThumbnailService(lambda video_path: load_episode_thumbnail(video_path),
+                                     workers=max(2, min(4, (os.cpu_count() or 2) // 2)), deliver=GLib.idle_add)
+texture_cache = TextureCache(settings.get("texture-cache-mb", 256) * 1024 * 1024)  # Decoded covers and thumbnails
+
+
+class EpisodeItem(GObject.Object):  # One episode in the episode list model
+    def __init__(self, video_path=None, episode_num=0, anime_path=None):
+        super().__init__()
         self.video_path = video_path
+        # Not the same for episodes in season folders. Placeholder items have neither
+        self.anime_path = anime_path or (os.path.dirname(video_path) if video_path else "")
         self.episode_num = episode_num
+        self.label_text = "Episode " + str(episode_num)
+        self.state = "not-watched"  # watched, continue or not-watched
+
+    def update(self, episode_num, last_episode, total_episodes):  # Returns True if the card has to change
+        label_text = "Episode " + str(episode_num)
+        if last_episode == episode_num:  # Give the card a unique look based on last watched
+            state = "continue"
+            label_text = "Continue " + label_text + "..."
+        elif episode_num < last_episode:
+            state = "watched"
+        else:
+            state = "not-watched"
+        if total_episodes == 1:  # If there is only 1 episode, make it show as a movie instead
+            label_text = "Watch Movie"
+        changed = (episode_num, label_text, state) != (self.episode_num, self.label_text, self.state)
+        self.episode_num, self.label_text, self.state = episode_num, label_text, state
+        return changed
+
+class EpisodeCard(Gtk.Box):  # The grid view reuses cards for whatever episode is on screen
+    @tracing.traced("EpisodeCard")
+    def __init__(self):
+        super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=5)
+        self.item = None
+        self.video_path = None
+        self.episode_num = 0
+        self.thumbnail_ticket = None
 
         self.size = (160, 90)
         self.set_size_request(self.size[0], self.size[1])
@@ -37,8 +60,7 @@ class EpisodeCard(Gtk.Box):
         self.set_margin_bottom(10)
         self.set_margin_start(10)
         self.set_margin_end(10)
-        self.set_tooltip_text(video_path)
-        self.label = Gtk.Label.new(label_text)
+        self.label = Gtk.Label.new("")
         self.label.set_valign(Gtk.Align.START)
         self.label.set_hexpand(False)
         self.label.set_vexpand(True)
@@ -51,13 +73,7 @@ class EpisodeCard(Gtk.Box):
         self.label.set_justify(Gtk.Justification.CENTER)
         self.label.set_css_classes(["epicard_label"])
 
-        if self.video_path is None:
-            self.cover_path = os.path.join(base_dir, "assets", "anime_card_thumbnail.png")
-        else:
-            self.cover_path = extract_video_thumbnail(video_path)
-        bad_cover_texture = GdkPixbuf.Pixbuf.new_from_file(self.cover_path)
-        cover_texture = Gdk.Texture.new_for_pixbuf(bad_cover_texture.scale_simple(self.size[0], self.size[1], GdkPixbuf.InterpType.BILINEAR))
-        self.cover = Gtk.Picture.new_for_paintable(cover_texture)
+        self.cover = Gtk.Picture.new()
         self.cover.set_content_fit(Gtk.ContentFit.FILL)
         self.cover.set_size_request(self.size[0], self.size[1])
         self.cover.set_css_classes(["episode_item"])
@@ -65,36 +81,154 @@ class EpisodeCard(Gtk.Box):
         self.cover.set_vexpand(False)
         self.cover.set_halign(Gtk.Align.CENTER)
         self.cover.set_valign(Gtk.Align.START)
-        self.append(self.cover)
 
         self.append(self.cover)
         self.append(self.label)
 
-class AnimeCard(Gtk.Box):  # Creates a card (Grid Item) for a Grid
-    def __init__(self, info=None, image_path=None, anime_path=None):
-        super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=5)
+    def bind(self, item):  # Card scrolled onto the screen
+        self.item = item
+        self.video_path = item.video_path
+        self.episode_num = item.episode_num
+        self.set_tooltip_text(item.video_path)
+        self.label.set_text(item.label_text)
+        self.cover.set_css_classes(["episode_item", "epicard-" + item.state])
+        self.cover.set_paintable(get_placeholder_thumbnail())  # Until the real one is ready
+        self.thumbnail_ticket = thumbnail_service.request(item.video_path, self.set_thumbnail, PRIORITY_VISIBLE, item.anime_path)
+
+    def unbind(self):  # Card scrolled away, let go of the texture and the job
+        thumbnail_service.cancel(self.thumbnail_ticket)
+        self.item = None
+        self.cover.set_paintable(None)
+
+    def set_thumbnail(self, video_path, thumbnail_texture):  # Called on the main thread by thumbnail_service
+        if self.item is not None and self.item.video_path == video_path and thumbnail_texture is not None:
+            self.cover.set_paintable(thumbnail_texture)
+        return GLib.SOURCE_REMOVE
+
+def load_scaled_texture(path, size):  # Decode + scale, goes through texture_cache
+    def load():
+        with tracing.span("decode_scale", path=path):
+            bad_pixbuf = GdkPixbuf.Pixbuf.new_from_file(path)
+            return Gdk.Texture.new_for_pixbuf(bad_pixbuf.scale_simple(size[0], size[1], GdkPixbuf.InterpType.BILINEAR))
+    return texture_cache.get(path, size, load)
+
+def get_placeholder_thumbnail():  # Shown on episode cards while the thumbnail is being made
+    return load_scaled_texture(default_cover_path, (160, 90))
+
+def load_episode_thumbnail(video_path):  # Runs in a thumbnail_service worker
+    thumbnail_path = extract_video_thumbnail(video_path)
+    if thumbnail_path is None:
+        return None
+    return texture_cache.get(thumbnail_path, (160, 90), lambda: load_texture(thumbnail_path))
+
+def load_texture(path):  # Decode a file that's already the right size
+    with tracing.span("decode", path=path):
+        return Gdk.Texture.new_from_filename(path)
+
+def create_episode_grid_factory():  # Factory for the episode Gtk.GridView
+    factory = Gtk.SignalListItemFactory()
+    factory.connect("setup", lambda _factory, list_item: list_item.set_child(EpisodeCard()))
+    factory.connect("bind", lambda _factory, list_item: list_item.get_child().bind(list_item.get_item()))
+    factory.connect("unbind", lambda _factory, list_item: list_item.get_child().unbind())
+    return factory
+
+class StoryboardPreview(Gtk.Popover):  # Frame preview over the seek bar, cut out of the episode's storyboard sheet
+    def __init__(self, parent):
+        super().__init__()
+        self.set_parent(parent)
+        self.set_autohide(False)  # Only follows the mouse, never takes focus
+        self.set_position(Gtk.PositionType.TOP)
+        self.set_can_target(False)
+        self.sheet = None  # The whole sheet as a GdkPixbuf, decoded once when the video opens
+        self.index = None
+        self.tiles = {}  # Tile number -> Gdk.Texture, cut from the sheet the first time it's shown
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=2)
+        self.picture = Gtk.Picture.new()
+        self.picture.set_size_request(thumbnail_size[0], thumbnail_size[1])
+        self.picture.set_content_fit(Gtk.ContentFit.FILL)
+        self.label = Gtk.Label.new("")
+        box.append(self.picture)
+        box.append(self.label)
+        self.set_child(box)
+
+    def set_storyboard(self, sheet, index):  # sheet is a GdkPixbuf, decode it in a thread
+        self.sheet = sheet
+        self.index = index
+        self.tiles.clear()
+
+    def clear(self):
+        self.set_storyboard(None, None)
+        self.popdown()
+
+    def show_at(self, x, y, seconds):  # x, y in the parent's coordinates
+        if self.sheet is None:
+            return
+        tile = max(0, min(self.index["count"] - 1, int(seconds / self.index["interval"])))
+        texture = self.tiles.get(tile)
+        if texture is None:
+            width, height = self.index["tile_width"], self.index["tile_height"]
+            column, row = tile % self.index["columns"], tile // self.index["columns"]
+            texture = Gdk.Texture.new_for_pixbuf(self.sheet.new_subpixbuf(column * width, row * height, width, height))
+            self.tiles[tile] = texture
+        self.picture.set_paintable(texture)
+        self.label.set_text(format_timestamp(seconds))
+        rectangle = Gdk.Rectangle()
+        rectangle.x, rectangle.y, rectangle.width, rectangle.height = int(x), int(y), 1, 1
+        self.set_pointing_to(rectangle)
+        if not self.get_visible():
+            self.popup()
+
+def format_timestamp(seconds):  # 3725 -> "1:02:05", 65 -> "1:05"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02}:{seconds % 60:02}"
+    return f"{seconds // 60}:{seconds % 60:02}"
+
+def load_anime_cover(image_path=None, anime_path=None, size=(280, 400)):  # Decodes a cover, this is safe to call from a thread
+    if image_path is None or image_path == default_cover_path:
+        return load_scaled_texture(default_cover_path, size)
+
+    def load():
+        cover_cache_path = get_cover_cache_path(image_path, anime_path)
+        if is_cache_fresh(cover_cache_path, image_path):  # Use cached file if can
+            return load_texture(cover_cache_path)
+        return Gdk.Texture.new_for_pixbuf(make_cover_cache(image_path, anime_path, size))
+    return texture_cache.get(image_path, size, load)
+
+@tracing.traced()
+def make_cover_cache(image_path, anime_path, size=(280, 400)):  # Generate cache, returns the scaled pixbuf
+    with tracing.span("decode_scale", path=image_path):
+        bad_cover_pixbuf = GdkPixbuf.Pixbuf.new_from_file(image_path)
+        scaled_cover_pixbuf = bad_cover_pixbuf.scale_simple(size[0], size[1], GdkPixbuf.InterpType.BILINEAR)
+    cover_cache_path = get_cover_cache_path(image_path, anime_path)
+    os.makedirs(os.path.dirname(cover_cache_path), exist_ok=True)
+    scaled_cover_pixbuf.savev(cover_cache_path, "png", [], [])
+    cache_manifest.record(cover_cache_path, image_path)
+    return scaled_cover_pixbuf
+
+class AnimeItem(GObject.Object):  # One anime in the library list model
+    def __init__(self, info=None, image_path=None, anime_path=None, offline=False):
+        super().__init__()
+        self.offline = offline  # Its library root didn't answer, this is what the index had
         if info is None:  # Really hope this doesn't happen
             self.info = ptbanime_data_file
         else:  # Yes
             self.info = info
-
         self.title = self.info["title"] if settings["title-language"] == "jp" else self.info["title-en"]
-        self.label = Gtk.Label(label=self.title)
-        self.size = (280, 400)
         self.image_path = image_path
         self.anime_path = anime_path
 
-        if self.image_path is None:
-            self.image_path = os.path.join(base_dir, "assets", "anime_card_thumbnail.png")
-        else:  # If there's an image path go here
-            cover_cache_path = str(os.path.join(anime_dir, self.anime_path, ".cache", os.path.basename(image_path)))
-            if os.path.exists(cover_cache_path):  # Use cached file if can
-                cover_texture = Gdk.Texture.new_from_filename(cover_cache_path)
-            else:  # Generate cache
-                bad_cover_pixbuf = GdkPixbuf.Pixbuf.new_from_file(self.image_path)
-                scaled_cover_pixbuf = bad_cover_pixbuf.scale_simple(self.size[0], self.size[1], GdkPixbuf.InterpType.BILINEAR)
-                cover_texture = Gdk.Texture.new_for_pixbuf(scaled_cover_pixbuf)
-                scaled_cover_pixbuf.savev(cover_cache_path, "png", [], [])
+class AnimeCard(Gtk.Box):  # Creates a card (Grid Item) for a Grid. The grid view reuses cards for whatever anime is on screen
+    @tracing.traced("AnimeCard")
+    def __init__(self, on_hover=None):
+        super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=5)
+        self.item = None
+        if on_hover is not None:  # on_hover(item), for prefetching the episodes page
+            hover_controller = Gtk.EventControllerMotion.new()
+            hover_controller.connect("enter", lambda controller, x, y: self.item is not None and on_hover(self.item))
+            self.add_controller(hover_controller)
+        self.label = Gtk.Label(label="")
+        self.size = (280, 400)
 
         self.set_size_request(self.size[0], self.size[1])
         self.set_spacing(0)
@@ -108,7 +242,7 @@ class AnimeCard(Gtk.Box):  # Creates a card (Grid Item) for a Grid
         self.set_margin_bottom(30)
         self.set_css_classes(["anicard-box"])
 
-        self.cover = Gtk.Picture.new_for_paintable(cover_texture)
+        self.cover = Gtk.Picture.new()
         self.cover.set_content_fit(Gtk.ContentFit.FILL)
         self.cover.set_size_request(self.size[0], self.size[1])
         self.cover.set_css_classes(["grid-item"])
@@ -132,104 +266,69 @@ class AnimeCard(Gtk.Box):  # Creates a card (Grid Item) for a Grid
         self.label.set_css_classes(["anicard-label"])
         self.append(self.label)
 
-def fetch_episodes(anime_path):  # Takes full anime path
-    if anime_path is None:
+    def bind(self, item):  # Card scrolled onto the screen
+        self.item = item
+        self.label.set_label(item.title)
+        self.cover.set_paintable(None)
+        if item.offline:
+            self.add_css_class("anicard-offline")
+        else:
+            self.remove_css_class("anicard-offline")
+        cover_pool.submit(self.load_cover, item)
+
+    def unbind(self):  # Card scrolled away, let go of the texture
+        self.item = None
+        self.cover.set_paintable(None)
+
+    def load_cover(self, item):  # Runs in cover_pool
+        if self.item is not item:  # Scrolled away before we got to it
+            return
+        try:
+            # An offline cover could hang the worker, the default cover doesn't
+            cover_texture = load_anime_cover(None if item.offline else item.image_path, item.anime_path, self.size)
+        except GLib.Error as e:
+            print("Couldn't load cover", item.image_path, e)
+            return
+        GLib.idle_add(self.set_cover, item, cover_texture)
+
+    def set_cover(self, item, cover_texture):
+        if self.item is item:
+            self.cover.set_paintable(cover_texture)
+        return GLib.SOURCE_REMOVE
+
+def create_anime_grid_factory(on_hover=None):  # Factory for the library Gtk.GridView
+    factory = Gtk.SignalListItemFactory()
+    factory.connect("setup", lambda _factory, list_item: list_item.set_child(AnimeCard(on_hover)))
+    factory.connect("bind", lambda _factory, list_item: list_item.get_child().bind(list_item.get_item()))
+    factory.connect("unbind", lambda _factory, list_item: list_item.get_child().unbind())
+    return factory
+
+def prefetch_series(anime_path, cancelled, thumbnails=24):  # Runs in the prefetcher, loads what opening an anime needs
+    episodes = sorted(fetch_indexed_episodes(anime_path) or [], key=natural_sort_key)
+    if cancelled.is_set():
         return None
-    found_episodes = [name for name in os.listdir(anime_path) if name.endswith(".mp4") and os.path.isfile(os.path.join(anime_path, name))]
-    print(f"Found Episodes for {anime_path}:", found_episodes)
-    return found_episodes
-
-def fetch_anime_folder():
-    found_anime = [name for name in os.listdir(anime_dir) if os.path.isdir(os.path.join(anime_dir, name))]
-    print("Found Anime:", found_anime)
-    return found_anime
-
-def get_anime_info(select_anime_folder):  # Gets the anime info.
-    if anime_dir_is_home_dir():
-        return ptbanime_data_file, None
-    # select_anime_folder is the anime folder name
-    full_select_anime_folder = os.path.join(anime_dir, select_anime_folder)  # Full anime folder path
-    print("GETTING INFO FROM ANIME:", full_select_anime_folder)
-    print(full_select_anime_folder)
-    data_file_path = os.path.join(str(full_select_anime_folder), "PTBAnime-info.json")  # Full data file path
-    cover_image_path = os.path.join(str(base_dir), "assets", "anime_card_thumbnail.png")  # Default cover image
-    for ext in [".jpg", "jpeg", "png"]:  # Find cover image. If not found default cover image is used
-        candidate = os.path.join(str(full_select_anime_folder), f"cover.{ext}")
-        if os.path.isfile(candidate):
-            cover_image_path = candidate
-            print("Found cover")
+    metadata.load(anime_path)
+    progress_store.get(anime_path)
+    tickets = []  # First screen of thumbnails, the cards ask for them again when they're shown
+    for episode in episodes[:thumbnails]:
+        if cancelled.is_set():
             break
-    if os.path.isfile(data_file_path):
-        # Get PTBAnime-data.json
-        print("Found PTBAnime data file!")
-        with open(data_file_path, "r") as F:
-            anime_data = json.load(F)
-            print(anime_data)
-        # Check for missing keys, and fill them if not present
-        missing = False
-        if "title" not in anime_data:
-            missing = True
-            anime_data["title"] = ptbanime_data_file["title"]
-            print("Filled in missing title")
-        if "title-en" not in anime_data:
-            missing = True
-            anime_data["title-en"] = ptbanime_data_file["title-en"]
-            print("Filled in missing title-en")
-        if "last-episode" not in anime_data:
-            missing = True
-            anime_data["last-episode"] = ptbanime_data_file["last-episode"]
-            print("Filled in missing last-episode")
-        if "last-episode-timestamp" not in anime_data:
-            missing = True
-            anime_data["last-episode-timestamp"] = ptbanime_data_file["last-episode-timestamp"]
-            print("Filled in missing last-episode-timestamp")
-        if "description" not in anime_data:
-            missing = True
-            anime_data["description"] = ptbanime_data_file["description"]
-            print("Filled in missing description")
-        if missing:
-            with open(data_file_path, "w") as F:
-                json.dump(anime_data, F, indent=4)
-    else:  # Data file doesn't exist. Create data file automatically
-        print("Creating new PTBAnime data file...")
-        anime_data = ptbanime_data_file.copy()
-        anime_data["title"] = select_anime_folder
-        anime_data["title-en"] = select_anime_folder
-        with open(data_file_path, "w") as F:
-            json.dump(anime_data, F, indent=4)
-        print("Created new PTBAnime data file!")
-    return anime_data, cover_image_path  # Return the anime data and cover image path
-
-def anime_dir_is_home_dir():  # Checks if anime folder is the home directory
-    return settings["anime_folder"] == os.path.expanduser("~")
-
-def extract_video_thumbnail(video_path):
-    # Create cache stuff
-    cache_dir = os.path.join(os.path.dirname(video_path), ".cache")
-    os.makedirs(cache_dir, exist_ok=True)
-    output_path = os.path.join(os.path.dirname(video_path), ".cache", os.path.basename(video_path) + ".jpg")
-    # Check if the cache file exists already
-    if os.path.exists(output_path):
-        return output_path
-    # Get Video Duration
-    print("Generating thumbnail cache for:", video_path)
-    try:
-        probe = ffmpeg.probe(video_path)
-    except ffmpeg._run.Error as e:
-        print("ffprobe error message:")
-        print(e.stderr.decode())
-    duration = float(probe["format"]["duration"])
-    midpoint = duration / 2
-
-    # Extract middle frame
-    (
-        ffmpeg
-        .input(video_path, ss=midpoint)
-        .filter("scale", 160, 90)
-        .output(output_path, vframes=1, qscale=5)
-        .run(quiet=True, overwrite_output=True)
-    )
-    return output_path
+        tickets.append(thumbnail_service.request(os.path.join(anime_path, episode), lambda path, texture: None,
+                                                 PRIORITY_PREFETCH, anime_path))
+    return {"episodes": episodes, "tickets": tickets}
+
+def release_prefetched_series(prefetched):  # Drops the thumbnails nobody asked for yet
+    for ticket in prefetched["tickets"]:
+        thumbnail_service.cancel(ticket)
+
+series_prefetcher = Prefetcher(prefetch_series, release_prefetched_series, workers=2)
+
+def create_cache_builder(on_progress=None, on_done=None):  # Covers go through GdkPixbuf, like the ones made on screen
+    return core.create_cache_builder(on_progress, on_done, make_cover=make_cover_cache)
+
+def check_settings():  # Fix settings options if empty
+    core.check_settings()
+    texture_cache.budget_bytes = settings["texture-cache-mb"] * 1024 * 1024
 
 def select_folder(window: Gtk.Window, on_folder_selected: callable):
     dialog = Gtk.FileChooserNative.new(
@@ -247,8 +346,7 @@ def select_folder(window: Gtk.Window, on_folder_selected: callable):
             print("Selected folder:", folder)
             if settings["first-time"]:  # Clear first time
                 settings["first-time"] = False
-                with open(settings_path, "w") as F:
-                    json.dump(settings, F, indent=4)
+                save_settings()
         else:
             print("Cancelled selecting folder")
         _dialog.destroy()
@@ -257,24 +355,6 @@ def select_folder(window: Gtk.Window, on_folder_selected: callable):
     dialog.connect("response", on_response)
     dialog.show()
 
-def update_anime_dir():
-    global anime_dir
-    anime_dir = settings.get("anime_folder", os.path.join(os.path.expanduser("~"), "Anime"))
-
-def check_settings():  # Fix settings options if empty
-    if "anime_folder" not in settings or settings["anime_folder"] == "":
-        settings["anime_folder"] = os.path.expanduser("~")
-    if "title-language" not in settings or settings["title-language"] == "":
-        settings["title-language"] = "en"
-    if "first-time" not in settings or settings["first-time"] == "":
-        settings["first-time"] = True
-    with open(settings_path, "w") as F:
-        json.dump(settings, F, indent=4)
-    update_anime_dir()
-
-def natural_sort_key(text):
-    return [int(s) if s.isdigit() else s.lower() for s in re.split(r'(\d+)', text)]
-
 def load_css():
     css = b"""
     .grid-item {
@@ -295,6 +375,9 @@ def load_css():
         font-size: 14px;
         /*background-color: black;*/
     }
+    .anicard-offline {
+        opacity: 0.4;
+    }
     
     #cover_plus_info_box {
         /*background-color: lime;*/
@@ -0,0 +1,147 @@
+import os
+from gi.repository import Gio, GLib
+from library_crawler import video_extensions, is_season_folder, scan_videos
+
+# Watches the anime folder and every anime in it, and turns file events into small updates
+# (anime added/removed/changed, episode added/removed) so the grids don't have to be rebuilt.
+# Season folders ("Season 1") inside an anime are watched too, their episodes belong to the anime.
+
+
+class LibraryWatcher:
+    settle_seconds = 2  # Wait until a file stopped changing before saying it's there (downloads, copies)
+
+    def __init__(self, root, on_anime_added, on_anime_removed, on_anime_changed, on_episode_added, on_episode_removed):
+        self.root = root
+        self.on_anime_added = on_anime_added          # (anime_path)
+        self.on_anime_removed = on_anime_removed      # (anime_path)
+        self.on_anime_changed = on_anime_changed      # (anime_path), data file or cover changed
+        self.on_episode_added = on_episode_added      # (anime_path, video_path)
+        self.on_episode_removed = on_episode_removed  # (anime_path, video_path)
+        self.root_monitor = None
+        self.series_monitors = {}  # Anime path -> Gio.FileMonitor
+        self.season_monitors = {}  # Season folder path -> Gio.FileMonitor
+        self.pending = {}  # Path -> [GLib source id, callback], things waiting to settle
+
+    def start(self, series):  # series is {anime folder name: season folder names or None} from the library scan
+        self.root_monitor = self.monitor(self.root, self.on_root_event)
+        for name, seasons in series.items():  # No listing here, this runs on the main thread for every anime
+            self.watch_series(os.path.join(self.root, name), seasons)
+        print("Watching", len(self.series_monitors), "anime in", self.root)
+
+    def stop(self):
+        if self.root_monitor is not None:
+            self.root_monitor.cancel()
+            self.root_monitor = None
+        for monitor in list(self.series_monitors.values()) + list(self.season_monitors.values()):
+            monitor.cancel()
+        self.series_monitors.clear()
+        self.season_monitors.clear()
+        for source_id, callback in self.pending.values():
+            GLib.source_remove(source_id)
+        self.pending.clear()
+
+    def monitor(self, path, handler):
+        monitor = Gio.File.new_for_path(path).monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES, None)
+        monitor.connect("changed", handler)
+        return monitor
+
+    def watch_series(self, anime_path, seasons=None):  # seasons None lists the folder, for anime that just appeared
+        if anime_path not in self.series_monitors:
+            self.series_monitors[anime_path] = self.monitor(
+                anime_path, lambda m, f, o, e: self.on_series_event(anime_path, f, o, e))
+            if seasons is None:
+                try:
+                    with os.scandir(anime_path) as entries:
+                        seasons = [entry.name for entry in entries if is_season_folder(entry.name) and entry.is_dir()]
+                except OSError:
+                    seasons = []
+            for season in seasons:
+                self.watch_season(anime_path, os.path.join(anime_path, season))
+
+    def watch_season(self, anime_path, season_path):
+        if season_path not in self.season_monitors:
+            self.season_monitors[season_path] = self.monitor(
+                season_path, lambda m, f, o, e: self.on_series_event(anime_path, f, o, e))
+
+    def unwatch_season(self, season_path):
+        monitor = self.season_monitors.pop(season_path, None)
+        if monitor is not None:
+            monitor.cancel()
+        for path in [p for p in self.pending if p == season_path or os.path.dirname(p) == season_path]:
+            self.cancel_settle(path)
+
+    def unwatch_series(self, anime_path):
+        monitor = self.series_monitors.pop(anime_path, None)
+        if monitor is not None:
+            monitor.cancel()
+        for season_path in [p for p in self.season_monitors if os.path.dirname(p) == anime_path]:
+            self.unwatch_season(season_path)
+        for path in [p for p in self.pending if p == anime_path or os.path.dirname(p) == anime_path]:
+            self.cancel_settle(path)
+
+    def settle(self, path, callback):  # Calls callback once path hasn't changed for settle_seconds
+        self.cancel_settle(path)
+
+        def fire():
+            del self.pending[path]
+            callback()
+            return GLib.SOURCE_REMOVE
+
+        self.pending[path] = [GLib.timeout_add_seconds(self.settle_seconds, fire), callback]
+
+    def cancel_settle(self, path):
+        if path in self.pending:
+            GLib.source_remove(self.pending.pop(path)[0])
+
+    def on_root_event(self, monitor, file, other_file, event_type):
+        path = file.get_path()
+        if os.path.basename(path).startswith("."):  # Skip hidden stuff
+            return
+        E = Gio.FileMonitorEvent
+        if event_type in (E.CREATED, E.MOVED_IN):
+            self.anime_appeared(path)
+        elif event_type in (E.DELETED, E.MOVED_OUT):
+            self.anime_disappeared(path)
+        elif event_type == E.RENAMED:
+            self.anime_disappeared(path)
+            self.anime_appeared(other_file.get_path())
+
+    def anime_appeared(self, anime_path):
+        if os.path.isdir(anime_path) and anime_path not in self.series_monitors:
+            self.watch_series(anime_path)
+            self.on_anime_added(anime_path)
+
+    def anime_disappeared(self, anime_path):
+        if anime_path in self.series_monitors:
+            self.unwatch_series(anime_path)
+            self.on_anime_removed(anime_path)
+
+    def on_series_event(self, anime_path, file, other_file, event_type):
+        E = Gio.FileMonitorEvent
+        path = file.get_path()
+        name = os.path.basename(path)
+        if event_type == E.RENAMED:  # Treat it as the old one going away and a new one coming in
+            self.on_series_event(anime_path, file, None, E.MOVED_OUT)
+            self.on_series_event(anime_path, other_file, None, E.MOVED_IN)
+            return
+        if os.path.dirname(path) == anime_path and is_season_folder(name):
+            if event_type in (E.CREATED, E.MOVED_IN) and os.path.isdir(path):
+                self.watch_season(anime_path, path)
+                # A season folder moved in already has its episodes, a new one gets them through its monitor
+                for video_path in scan_videos(path, path + os.sep):
+                    self.settle(video_path, lambda video_path=video_path: self.on_episode_added(anime_path, video_path))
+            elif event_type in (E.DELETED, E.MOVED_OUT) and path in self.season_monitors:
+                self.unwatch_season(path)
+                self.on_episode_removed(anime_path, path)  # Episodes are synced from the index, so the folder is enough
+        elif name == "PTBAnime-info.json" or name.startswith("cover."):
+            self.settle(anime_path, lambda: self.on_anime_changed(anime_path))
+        elif name.lower().endswith(video_extensions):
+            if event_type in (E.CREATED, E.MOVED_IN):
+                self.settle(path, lambda: self.on_episode_added(anime_path, path))
+            elif event_type == E.CHANGED and path in self.pending:  # Still being written, wait more
+                self.settle(path, self.pending[path][1])
+            elif event_type in (E.DELETED, E.MOVED_OUT):
+                if path in self.pending:  # Never finished arriving
+                    self.cancel_settle(path)
+                else:
+                    self.on_episode_removed(anime_path, path)